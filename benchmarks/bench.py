@@ -0,0 +1,204 @@
+# coding: utf-8
+"""
+Замер этапов анализа на синтетическом дереве репозиториев.
+
+python benchmarks/bench.py [--tree=КАТАЛОГ] [--output=bench_results.json] [--repeat=3] [--stages=scan,render_excel]
+    [--workers=N] [параметры genrepo.py: --modules=5 --entities=20 ...]
+
+Если --tree не указан, дерево создаётся во временном каталоге генератором genrepo.py с переданными
+параметрами. Каждый этап запускается в отдельном процессе: время этапа и пиковый объём памяти процесса
+(включая подготовку, например разбор модели перед render_excel). Результаты сохраняются в JSON
+для сравнения версий и машин.
+"""
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.join(BENCH_DIR, '..', 'sgmtd_plugin')
+sys.path.insert(0, BENCH_DIR)
+
+import genrepo  # noqa: E402
+
+STAGES = ['discovery', 'scan', 'scan_parallel', 'scan_cached', 'render_excel', 'render_excel_streaming', 'gen_package']
+
+
+def peak_memory_mb() -> float:
+    """ Пиковый объём памяти текущего процесса """
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2 ** 20
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux - килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_stage(stage: str, tree: str, workers: int) -> Dict[str, float]:
+    """ Выполнение этапа в текущем процессе (вызывается из дочернего процесса) """
+    sys.path.insert(0, PLUGIN_DIR)
+    import mtd
+    from parsecache import ParseCache
+
+    with open(os.path.join(tree, 'repos.json'), encoding='utf-8') as fp:
+        repos = json.load(fp)['repos']
+    work = tempfile.mkdtemp(prefix='sgmtd_bench_')
+    counts = {}
+    try:
+        if stage == 'discovery':
+            started = time.perf_counter()
+            jobs = [job for repo in repos for job in mtd.discover(repo['path'])]
+            elapsed = time.perf_counter() - started
+            items, archive = [], []
+            counts['modules'] = len(jobs)
+            counts['files'] = sum(1 + len(x.entities) for x in jobs)
+        elif stage in ('scan', 'scan_parallel'):
+            started = time.perf_counter()
+            items, archive = mtd.scan_repositories(repos, parallel=stage == 'scan_parallel', workers=workers)
+            elapsed = time.perf_counter() - started
+        elif stage == 'scan_cached':
+            filename = os.path.join(work, 'cache.sqlite')
+            with ParseCache(filename) as cache:
+                mtd.scan_repositories(repos, cache=cache)
+            with ParseCache(filename) as cache:
+                started = time.perf_counter()
+                items, archive = mtd.scan_repositories(repos, cache=cache)
+                elapsed = time.perf_counter() - started
+                counts['cache_hits'] = cache.hits
+        elif stage in ('render_excel', 'render_excel_streaming'):
+            items, archive = mtd.scan_repositories(repos)
+            filename = os.path.join(work, 'report.xlsx')
+            started = time.perf_counter()
+            mtd.render_excel(items, archive, filename, stage == 'render_excel_streaming')
+            elapsed = time.perf_counter() - started
+            counts['output_bytes'] = os.path.getsize(filename)
+        elif stage == 'gen_package':
+            filename = os.path.join(work, 'package.xml')
+            started = time.perf_counter()
+            mtd.gen_package(filename, repos)
+            elapsed = time.perf_counter() - started
+            items, archive = [], []
+            counts['output_bytes'] = os.path.getsize(filename)
+        else:
+            raise ValueError('Unknown stage: ' + stage)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if items or archive:
+        counts['items'] = len(items)
+        counts['archive'] = len(archive)
+    return dict(counts, seconds=elapsed, peak_mb=peak_memory_mb())
+
+
+def measure(stage: str, tree: str, workers: int, repeat: int) -> Dict[str, object]:
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child=' + stage, '--tree=' + tree,
+                               '--workers={}'.format(workers)], stdout=subprocess.PIPE, check=True)
+        # последняя строка вывода - результат, выше - сообщения анализатора
+        runs.append(json.loads(proc.stdout.decode('utf-8').strip().splitlines()[-1]))
+
+    response = dict(runs[0])
+    response['seconds'] = min(x['seconds'] for x in runs)
+    response['peak_mb'] = max(x['peak_mb'] for x in runs)
+    response['runs'] = [round(x['seconds'], 4) for x in runs]
+    print('{:<24} {:>9.3f} s {:>9.1f} MB'.format(stage, response['seconds'], response['peak_mb']))
+    return response
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', '-C', BENCH_DIR, 'describe', '--always', '--dirty'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    tree = None
+    output = 'bench_results.json'
+    repeat = 3
+    workers = os.cpu_count() or 1
+    stages = STAGES
+    child = None
+    generator_args = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--tree='):
+            tree = arg[len('--tree='):]
+        elif arg.startswith('--output='):
+            output = arg[len('--output='):]
+        elif arg.startswith('--repeat='):
+            repeat = int(arg[len('--repeat='):])
+        elif arg.startswith('--workers='):
+            workers = int(arg[len('--workers='):])
+        elif arg.startswith('--stages='):
+            stages = arg[len('--stages='):].split(',')
+        elif arg.startswith('--child='):
+            child = arg[len('--child='):]
+        else:
+            generator_args.append(arg)
+
+    if child:
+        print(json.dumps(run_stage(child, tree, workers)))
+        return
+
+    temp = None
+    if not tree:
+        temp = tree = tempfile.mkdtemp(prefix='sgmtd_tree_')
+        generator = genrepo.Generator(genrepo.parse_options(generator_args))
+        started = time.perf_counter()
+        generator.generate(tree)
+        print('Generated {} files ({:.1f} MB) in {:.1f} s'.format(generator.files, generator.bytes / 2 ** 20,
+                                                                  time.perf_counter() - started))
+
+    try:
+        with open(os.path.join(tree, 'repos.json'), encoding='utf-8') as fp:
+            info = json.load(fp)
+
+        results: List[Dict[str, object]] = []
+        for stage in stages:
+            results.append(dict(measure(stage, tree, workers, repeat), stage=stage))
+    finally:
+        if temp:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'workers': workers,
+        'repeat': repeat,
+        'tree': {'options': info.get('options'), 'files': info.get('files'), 'bytes': info.get('bytes')},
+        'stages': results,
+    }
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, indent=2)
+    print('Saved to', output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# coding: utf-8
+"""
+Время записи и размер отчёта Excel при разных уровнях сжатия zip и числе потоков сжатия.
+
+python benchmarks/compression.py [--tree=КАТАЛОГ] [--output=compression_results.json] [--repeat=3]
+    [--levels=0,1,6,9] [--threads=0,4] [параметры genrepo.py: --modules=5 --entities=20 ...]
+
+Модель разбирается один раз, затем для каждого сочетания уровня (--levels, 0 - без сжатия) и числа потоков
+(--threads, 0 - сжатие в основном потоке по мере записи частей) отчёт записывается --repeat раз,
+в результат попадает лучшее время. По умолчанию потоков - по числу процессоров.
+"""
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.join(BENCH_DIR, '..', 'sgmtd_plugin')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, PLUGIN_DIR)
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+
+def measure(items, archive, work: str, level: int, threads: int, repeat: int) -> Dict[str, object]:
+    filename = os.path.join(work, 'report_{}_{}.xlsx'.format(level, threads))
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        mtd.render_excel(items, archive, filename, compression=level, deflate_threads=threads)
+        runs.append(time.perf_counter() - started)
+    response = {'level': level, 'threads': threads, 'seconds': min(runs), 'runs': [round(x, 4) for x in runs],
+                'bytes': os.path.getsize(filename)}
+    os.remove(filename)
+    print('level {:<2} threads {:<3} {:>9.3f} s {:>9.2f} MB'.format(level, threads, response['seconds'],
+                                                                   response['bytes'] / 2 ** 20))
+    return response
+
+
+def main():
+    tree = None
+    output = 'compression_results.json'
+    repeat = 3
+    levels = [0, 1, 6, 9]
+    threads = [0, os.cpu_count() or 1]
+    generator_args = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--tree='):
+            tree = arg[len('--tree='):]
+        elif arg.startswith('--output='):
+            output = arg[len('--output='):]
+        elif arg.startswith('--repeat='):
+            repeat = int(arg[len('--repeat='):])
+        elif arg.startswith('--levels='):
+            levels = [int(x) for x in arg[len('--levels='):].split(',')]
+        elif arg.startswith('--threads='):
+            threads = [int(x) for x in arg[len('--threads='):].split(',')]
+        else:
+            generator_args.append(arg)
+
+    temp = None
+    if not tree:
+        temp = tree = tempfile.mkdtemp(prefix='sgmtd_tree_')
+        generator = genrepo.Generator(genrepo.parse_options(generator_args))
+        generator.generate(tree)
+        print('Generated {} files ({:.1f} MB)'.format(generator.files, generator.bytes / 2 ** 20))
+
+    work = tempfile.mkdtemp(prefix='sgmtd_bench_')
+    try:
+        with open(os.path.join(tree, 'repos.json'), encoding='utf-8') as fp:
+            info = json.load(fp)
+        items, archive = mtd.scan_repositories(info['repos'])
+
+        results: List[Dict[str, object]] = []
+        for level in levels:
+            # без сжатия потоки не используются
+            for count in ([0] if level == 0 else threads):
+                results.append(measure(items, archive, work, level, count, repeat))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if temp:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'tree': {'options': info.get('options'), 'files': info.get('files'), 'bytes': info.get('bytes')},
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, indent=2)
+    print('Saved to', output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# coding: utf-8
+"""
+Генератор синтетических репозиториев разработки для замеров производительности.
+
+python benchmarks/genrepo.py КАТАЛОГ [--solutions=1] [--modules=5] [--entities=20] [--properties=10]
+    [--controls=5] [--actions=3] [--layers=1] [--collections=1] [--archive=1] [--noise=0] [--no-resx] [--seed=0]
+
+Создаётся базовый репозиторий (Base) и --layers репозиториев-перекрытий (Work): каждая сущность слоя
+перекрывает сущность предыдущего слоя (цепочка BaseGuid глубины --layers). --archive - число копий модулей
+в VersionData базового репозитория. --noise - число файлов исходного кода на сущность в проектах .Server/.ClientBase
+и в bin/obj (файлы без метаданных, которые обходятся при поиске модулей).
+Список репозиториев сохраняется в КАТАЛОГ/repos.json.
+"""
+import json
+import os
+import random
+import sys
+import uuid
+from typing import Dict, List, Optional
+
+ENTITY_TYPES = ['EntityMetadata', 'DocumentMetadata', 'TaskMetadata', 'AssignmentMetadata', 'NoticeMetadata',
+                'ReportMetadata']
+
+PROPERTY_TYPES = ['StringPropertyMetadata', 'IntegerPropertyMetadata', 'DateTimePropertyMetadata',
+                  'BooleanPropertyMetadata', 'NavigationPropertyMetadata', 'EnumPropertyMetadata']
+
+
+class Options:
+    """ Параметры дерева: число решений, модулей, сущностей и их элементов """
+
+    def __init__(self, solutions=1, modules=5, entities=20, properties=10, controls=5, actions=3, layers=1,
+                 collections=1, archive=1, noise=0, resx=True, seed=0):
+        self.solutions = solutions
+        self.modules = modules
+        self.entities = entities
+        self.properties = properties
+        self.controls = controls
+        self.actions = actions
+        self.layers = layers
+        self.collections = collections
+        self.archive = archive
+        self.noise = noise
+        self.resx = resx
+        self.seed = seed
+
+    def as_dict(self) -> Dict[str, object]:
+        return dict(self.__dict__)
+
+
+class Generator:
+    def __init__(self, options: Options):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.files = 0
+        self.bytes = 0
+
+    def guid(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+    def write(self, path: str, text: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode('utf-8-sig')
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        self.files += 1
+        self.bytes += len(data)
+
+    def write_mtd(self, path: str, data: dict):
+        self.write(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def write_resx(self, path: str, strings: Dict[str, str]):
+        if not self.options.resx:
+            return
+        body = ''.join('\n  <data name="{}" xml:space="preserve">\n    <value>{}</value>\n  </data>'.format(k, v)
+                       for k, v in strings.items())
+        self.write(path, '<?xml version="1.0" encoding="utf-8"?>\n<root>\n'
+                         '  <resheader name="resmimetype">\n    <value>text/microsoft-resx</value>\n  </resheader>'
+                         '{}\n</root>\n'.format(body))
+
+    def entity(self, number: int, name: str, base: Optional[dict] = None, collection_guids=()) -> dict:
+        """ Метаданные сущности: свойства, форма с контролами, действия, кнопки ленты """
+        opts = self.options
+        kind = ENTITY_TYPES[number % len(ENTITY_TYPES)] if base is None else base['$type'].split(',')[0].split('.')[-1]
+        properties = []
+        previous = None
+        for i in range(opts.properties):
+            guid = base['Properties'][i]['NameGuid'] if base else self.guid()
+            prop = {"$type": "Sungero.Metadata.{}, Sungero.Metadata".format(PROPERTY_TYPES[i % len(PROPERTY_TYPES)]),
+                    "NameGuid": guid, "Name": "Property{}".format(i), "Code": "Prop{}".format(i),
+                    "IsRequired": i == 0, "ListDataBinderTypeName": "Sungero.Presentation.CommonDataBinders",
+                    "PreviousPropertyGuid": previous}
+            if base:
+                prop["IsAncestorMetadata"] = True
+                prop["Overridden"] = ["IsRequired"]
+            properties.append(prop)
+            previous = guid
+
+        for guid in collection_guids:
+            properties.append({"$type": "Sungero.Metadata.CollectionPropertyMetadata, Sungero.Metadata",
+                               "NameGuid": self.guid(), "Name": "Collection{}".format(len(properties)),
+                               "EntityGuid": guid, "IsShowedInList": False})
+
+        actions = [{"$type": "Sungero.Metadata.ActionMetadata, Sungero.Metadata", "NameGuid": self.guid(),
+                    "Name": "Action{}".format(i), "ActionArea": "Card", "GenerateHandler": True, "LargeIconName": None}
+                   for i in range(opts.actions)]
+        form = self.guid()
+        controls = [{"$type": "Sungero.Metadata.ControlMetadata, Sungero.Metadata", "NameGuid": self.guid(),
+                     "Name": "Control{}".format(i), "ColumnNumber": i % 2, "ColumnSpan": 1, "ParentGuid": form,
+                     "PropertyGuid": properties[i % len(properties)]["NameGuid"] if properties else None,
+                     "RowNumber": i, "RowSpan": 1, "Settings": []}
+                    for i in range(opts.controls)]
+        ribbon = [{"$type": "Sungero.Metadata.RibbonActionButtonMetadata, Sungero.Metadata", "NameGuid": self.guid(),
+                   "Name": "Button{}".format(i), "ActionGuid": x["NameGuid"], "ButtonSize": "Large", "Index": i,
+                   "ParentGuid": self.guid()} for i, x in enumerate(actions)]
+
+        data = {"$type": "Sungero.Metadata.{}, Sungero.Metadata".format(kind),
+                "NameGuid": self.guid(), "Name": name, "Code": name[:7] + str(number), "BaseGuid": None,
+                "AccessRightsMode": "Both", "IsVisible": True, "Actions": actions,
+                "Forms": [{"$type": "Sungero.Metadata.StandaloneFormMetadata, Sungero.Metadata", "NameGuid": form,
+                           "Name": "Card", "Controls": controls}],
+                "Properties": properties,
+                "RibbonCardMetadata": {"NameGuid": self.guid(), "Name": "RibbonCard", "Elements": ribbon}}
+        if base:
+            data["BaseGuid"] = base["NameGuid"]
+            data["Overridden"] = ["Controls", "Actions"]
+        else:
+            data.pop("BaseGuid")
+        return data
+
+    def collection(self, owner: str, number: int) -> dict:
+        return {"$type": "Sungero.Metadata.EntityMetadata, Sungero.Metadata", "NameGuid": self.guid(),
+                "Name": "{}Collection{}".format(owner, number), "Code": "Coll{}".format(number),
+                "Properties": [{"$type": "Sungero.Metadata.NavigationPropertyMetadata, Sungero.Metadata",
+                                "NameGuid": self.guid(), "Name": owner, "IsReferenceToRootEntity": True},
+                               {"$type": "Sungero.Metadata.StringPropertyMetadata, Sungero.Metadata",
+                                "NameGuid": self.guid(), "Name": "Value", "Code": "Value"}]}
+
+    def module(self, path: str, data: dict, entities: List[dict], collections: List[dict]):
+        """ Каталог модуля: Module.mtd, сущности и коллекции в подкаталогах, .resx """
+        self.write_mtd(os.path.join(path, 'Module.mtd'), data)
+        self.write_resx(os.path.join(path, 'ModuleSystem.resx'), {'DisplayName': data['Name']})
+        self.write_resx(os.path.join(path, 'ModuleSystem.ru.resx'), {'DisplayName': data['Name'] + ' (ru)'})
+        for entity in entities + collections:
+            folder = os.path.join(path, entity['Name'])
+            self.write_mtd(os.path.join(folder, entity['Name'] + '.mtd'), entity)
+            strings = {'DisplayName': entity['Name']}
+            strings.update(('Property_' + x['Name'], x['Name'] + ' title') for x in entity['Properties']
+                           if not x.get('IsAncestorMetadata'))
+            self.write_resx(os.path.join(folder, entity['Name'] + 'System.resx'), strings)
+            self.write_resx(os.path.join(folder, entity['Name'] + 'System.ru.resx'),
+                            {k: v + ' (ru)' for k, v in strings.items()})
+
+    def noise(self, path: str, folder: str, entities: List[dict]):
+        """ Проекты исходного кода рядом с каталогом .Shared модуля и результаты их сборки """
+        for project in ('Server', 'ClientBase'):
+            project_path = os.path.join(path, '{}.{}'.format(folder, project))
+            self.write(os.path.join(project_path, '{}.{}.csproj'.format(folder, project)), '<Project />\n')
+            for entity in entities:
+                for i in range(self.options.noise):
+                    self.write(os.path.join(project_path, entity['Name'], '{}Handlers{}.cs'.format(entity['Name'], i)),
+                               'namespace {} {{ }}\n'.format(folder))
+            for output in ('bin', 'obj'):
+                for i in range(self.options.noise):
+                    self.write(os.path.join(project_path, output, 'Debug', '{}.{}.dll'.format(folder, i)), '\0')
+
+    def repository(self, path: str, company: str, layer: int, base: Optional[dict]) -> dict:
+        """ Репозиторий слоя, base - модули и сущности перекрываемого слоя """
+        opts = self.options
+        result = {'modules': []}
+        base_modules = base['modules'] if base else [None] * (opts.solutions * opts.modules)
+        position = 0
+        for s in range(opts.solutions):
+            solution = {"$type": "Sungero.Metadata.SolutionMetadata, Sungero.Metadata", "NameGuid": self.guid(),
+                        "Name": "Solution{}".format(s), "CompanyCode": company, "Version": "4.{}.0.0".format(layer)}
+            folder = '{}.Solution{}'.format(company, s)
+            self.write_mtd(os.path.join(path, 'source', folder, folder + '.Shared', 'Module.mtd'), solution)
+
+            for m in range(opts.modules):
+                base_module = base_modules[position]
+                position += 1
+                name = 'Module{}_{}'.format(s, m)
+                module = {"$type": "Sungero.Metadata.{}, Sungero.Metadata".format(
+                              'LayerModuleMetadata' if base_module else 'ModuleMetadata'),
+                          "NameGuid": self.guid(), "Name": name, "Code": 'M{}{}'.format(s, m), "CompanyCode": company,
+                          "Version": "4.{}.0.0".format(layer),
+                          "Dependencies": [{"Id": solution["NameGuid"], "IsSolutionModule": True}]}
+                if base_module:
+                    module["BaseGuid"] = base_module['module']['NameGuid']
+                    module["AssociatedGuid"] = solution["NameGuid"]
+
+                entities = []
+                collections = []
+                for e in range(opts.entities):
+                    parent = base_module['entities'][e] if base_module else None
+                    items = [self.collection('Entity{}'.format(e), c) for c in range(opts.collections)]
+                    entities.append(self.entity(e, 'Entity{}_{}'.format(m, e), parent, [x['NameGuid'] for x in items]))
+                    collections += items
+
+                folder = '{}.{}'.format(company, name)
+                self.module(os.path.join(path, 'source', folder, folder + '.Shared'), module, entities, collections)
+                if opts.noise:
+                    self.noise(os.path.join(path, 'source', folder), folder, entities + collections)
+                for version in range(opts.archive if layer == 0 else 0):
+                    archive = dict(module, Version="3.{}.0.0".format(version))
+                    self.module(os.path.join(path, 'VersionData', '3.{}'.format(version), folder + '.Shared'),
+                                archive, entities, collections)
+                result['modules'].append({'module': module, 'entities': entities})
+        return result
+
+    def generate(self, root: str) -> List[Dict[str, str]]:
+        """ Создать дерево в каталоге root, возвращает список репозиториев для анализа """
+        repos = []
+        base = None
+        for layer in range(self.options.layers + 1):
+            path = os.path.join(os.path.abspath(root), 'base' if layer == 0 else 'layer{}'.format(layer))
+            base = self.repository(path, 'Sungero' if layer == 0 else 'Layer{}'.format(layer), layer, base)
+            repos.append({'type': 'Base' if layer == 0 else 'Work', 'path': path})
+
+        # слои перечисляются от верхнего к базовому, как в config.yml
+        repos.reverse()
+        with open(os.path.join(root, 'repos.json'), 'w', encoding='utf-8') as fp:
+            json.dump({'options': self.options.as_dict(), 'files': self.files, 'bytes': self.bytes,
+                       'repos': repos}, fp, indent=2)
+        return repos
+
+
+def parse_options(args: List[str]) -> Options:
+    options = Options()
+    for arg in args:
+        if arg == '--no-resx':
+            options.resx = False
+        elif arg.startswith('--') and '=' in arg:
+            key, value = arg[2:].split('=', 1)
+            if not hasattr(options, key):
+                raise ValueError('Unknown option: ' + arg)
+            setattr(options, key, int(value))
+    return options
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith('--'):
+        print(__doc__)
+        return
+
+    generator = Generator(parse_options(sys.argv[2:]))
+    repos = generator.generate(sys.argv[1])
+    print('Generated {} files ({:.1f} MB): {}'.format(generator.files, generator.bytes / 2 ** 20,
+                                                     ', '.join(x['path'] for x in repos)))
+
+
+if __name__ == '__main__':
+    main()
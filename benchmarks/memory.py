@@ -0,0 +1,70 @@
+# coding: utf-8
+"""
+Расход памяти модели на синтетическом дереве сущностей.
+
+python benchmarks/memory.py [--entities=50000] [--compare]
+
+--compare - два прогона в отдельных процессах: с SGMTD_KEEP_JSON=1 (исходный JSON элементов сохраняется)
+и без него.
+"""
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+
+def measure(entities: int):
+    # 8 свойств, 2 действия с кнопками ленты, форма с 4 контролами
+    generator = genrepo.Generator(genrepo.Options(properties=8, controls=4, actions=2, collections=0))
+    module = mtd.build({"$type": "Sungero.Metadata.ModuleMetadata, Sungero.Metadata", "NameGuid": generator.guid(),
+                        "Name": "Module", "CompanyCode": "Bench"})
+    index = mtd.MetadataIndex()
+    resx = {'DisplayName': 'Entity', 'Property_Property0': 'Property'}
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    items = []
+    for number in range(entities):
+        text = json.dumps(generator.entity(number, 'Entity{}'.format(number)))
+        items.append(mtd.build(json.loads(text), dict(resx), {}, module, index))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    leaves = sum(len(x.Properties) + len(x.Actions) + len(x.Controls) + len(x.RibbonCard) for x in items)
+    print('KEEP_JSON={}: entities={}, leaves={}, memory={:.1f} MB ({:.0f} B/leaf), peak={:.1f} MB, build={:.1f} s'.format(
+        int(mtd.KEEP_JSON), entities, leaves, current / 2 ** 20, current / leaves, peak / 2 ** 20, elapsed))
+
+
+def main():
+    entities = 50000
+    compare = False
+    for arg in sys.argv[1:]:
+        if arg.startswith('--entities='):
+            entities = int(arg.split('=', 1)[1])
+        elif arg == '--compare':
+            compare = True
+
+    if not compare:
+        measure(entities)
+        return
+
+    for keep in ('1', ''):
+        env = dict(os.environ, SGMTD_KEEP_JSON=keep)
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--entities={}'.format(entities)], env=env,
+                       check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 """ Модуль плагина SG MTD Analyzer. """
 import os
 import os.path
-from typing import Any, Optional, List
+from typing import Any, Optional, List, Union
 
 from components import ui_models
 from components.base_component import BaseComponent
@@ -73,30 +73,85 @@ class MtdAnalyzer(BaseComponent):
         repo_list.append({'type': 'Base', 'path': os.path.join(git_root_directory, '_platform')})
         return repo_list
 
-    def _get_mtd_info(self):
-        response = []
-        archive = []
-        for repo in self._get_repo_list():
-            items, arch = mtd.dir_walk(repo.get('path'))
-            print("Using repository: Type={}, path={}".format(repo.get('type'),repo.get('path')))
-            response += items.values()
-            archive += arch
-
-        return response, archive
-
-    def get_mtd_info(self):
+    def _get_mtd_info(self, parallel=False, workers=None, cache=None, snapshot=None, rules=mtd.discovery.Rules(),
+                      revision=None, model=None):
+        repos = self._get_repo_list()
+        if revision:
+            repos = mtd.with_revision(repos, revision)
+        if model:
+            return mtd.load_or_scan(repos, model, parallel, workers, cache, snapshot, rules)
+        return mtd.scan_repositories(repos, parallel=parallel, workers=workers, cache=cache,
+                                     snapshot=snapshot, rules=rules)
+
+    def get_mtd_info(self, parallel: bool = False, workers: Optional[int] = None, model: Optional[str] = None):
         """ MTD. Вывод краткой структуры репозиториев """
-        response, archive = self._get_mtd_info()
+        response, archive = self._get_mtd_info(parallel, workers, model=model)
         return response
 
-    def save_mtd_info(self, filename: str):
+    def save_mtd_info(self, filename: str, parallel: bool = False, workers: Optional[int] = None,
+                      no_cache: bool = False, cache_size: int = mtd.parsecache.DEFAULT_MAX_SIZE_MB,
+                      incremental: bool = False, streaming: bool = False, timings: bool = False, slowest: int = 0,
+                      profile: Union[bool, str, None] = None, profile_memory: bool = False,
+                      include: Optional[str] = None, exclude: Optional[str] = None, git_index: bool = False,
+                      revision: Optional[str] = None, model: Optional[str] = None, compression: Optional[int] = None,
+                      deflate_threads: int = 0, xlsx_compat: bool = False):
         """ MTD. Сохранить данные в Excel. Параметр - имя файла.xlsx """
-        items, archive = self._get_mtd_info()
-        mtd.render_excel(items, archive, filename)
-
-    def gen_package(self, filename: str):
+        snapshot = mtd.snapshot_path(filename) if incremental else None
+        rules = mtd.discovery.make_rules(include, exclude, git_index)
+        with mtd.timings.session(timings, slowest, profile, profile_memory):
+            with mtd.open_cache(filename, no_cache, cache_size) as cache:
+                items, archive = self._get_mtd_info(parallel, workers, cache, snapshot, rules, revision, model)
+            mtd.render_excel(items, archive, filename, streaming, compression, deflate_threads, xlsx_compat)
+
+    def gen_package(self, filename: str, parallel: bool = False, workers: Optional[int] = None,
+                    no_cache: bool = False, cache_size: int = mtd.parsecache.DEFAULT_MAX_SIZE_MB,
+                    timings: bool = False, slowest: int = 0, profile: Union[bool, str, None] = None,
+                    profile_memory: bool = False, full: bool = False, include: Optional[str] = None,
+                    exclude: Optional[str] = None, git_index: bool = False, revision: Optional[str] = None,
+                    model: Optional[str] = None):
         """ MTD. Создать package.xml для DDS. Параметр - имя файла.xml """
-        mtd.gen_package(filename, self._get_repo_list())
+        rules = mtd.discovery.make_rules(include, exclude, git_index)
+        repos = self._get_repo_list()
+        if revision:
+            repos = mtd.with_revision(repos, revision)
+        with mtd.timings.session(timings, slowest, profile, profile_memory):
+            with mtd.open_cache(filename, no_cache or not full and not model, cache_size) as cache:
+                mtd.gen_package(filename, repos, parallel, workers, cache, full, rules, model)
+
+    def export(self, xlsx: Optional[str] = None, package: Optional[str] = None, jsonl: Optional[str] = None,
+               csv: Optional[str] = None, sqlite: Optional[str] = None, upsert: bool = False,
+               parallel: bool = False, workers: Optional[int] = None, no_cache: bool = False,
+               cache_size: int = mtd.parsecache.DEFAULT_MAX_SIZE_MB, incremental: bool = False, streaming: bool = False,
+               timings: bool = False, slowest: int = 0, profile: Union[bool, str, None] = None,
+               profile_memory: bool = False, include: Optional[str] = None, exclude: Optional[str] = None,
+               git_index: bool = False, revision: Optional[str] = None, model: Optional[str] = None,
+               compression: Optional[int] = None, deflate_threads: int = 0, xlsx_compat: bool = False):
+        """ MTD. Выгрузить модель в несколько файлов за один обход репозиториев """
+        outputs = {key: value for key, value in (('xlsx', xlsx), ('package', package), ('jsonl', jsonl), ('csv', csv),
+                                                 ('sqlite', sqlite)) if value}
+        if not outputs:
+            raise ValueError('No outputs: --xlsx, --package, --jsonl, --csv, --sqlite')
+        filename = next(iter(outputs.values()))
+        snapshot = mtd.snapshot_path(filename) if incremental else None
+        rules = mtd.discovery.make_rules(include, exclude, git_index)
+        with mtd.timings.session(timings, slowest, profile, profile_memory):
+            with mtd.open_cache(filename, no_cache, cache_size) as cache:
+                items, archive = self._get_mtd_info(parallel, workers, cache, snapshot, rules, revision, model)
+            mtd.export(outputs, items, archive, streaming, upsert, compression, deflate_threads, xlsx_compat)
+
+    def diff(self, filename: str, old: str = 'HEAD', new: Optional[str] = None, old_snapshot: Optional[str] = None,
+             new_snapshot: Optional[str] = None, parallel: bool = False, workers: Optional[int] = None,
+             no_cache: bool = False, cache_size: int = mtd.parsecache.DEFAULT_MAX_SIZE_MB, timings: bool = False,
+             slowest: int = 0, profile: Union[bool, str, None] = None, profile_memory: bool = False,
+             include: Optional[str] = None, exclude: Optional[str] = None, git_index: bool = False):
+        """ MTD. Сравнить ветки. Параметр - имя файла .xlsx или .json """
+        rules = mtd.discovery.make_rules(include, exclude, git_index)
+        repos = self._get_repo_list()
+        with mtd.timings.session(timings, slowest, profile, profile_memory):
+            with mtd.open_cache(filename, no_cache, cache_size) as cache:
+                old_items = mtd.load_model(repos, old, old_snapshot, parallel, workers, cache, rules)
+                new_items = mtd.load_model(repos, new, new_snapshot, parallel, workers, cache, rules)
+            mtd.save_diff(filename, mtd.diff_models(old_items, new_items))
 
 def init_plugin() -> None:
     """ Инициализировать плагин. """
@@ -0,0 +1,219 @@
+# coding: utf-8
+""" Поиск файлов метаданных в каталоге репозитория. """
+import fnmatch
+import os
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+# запуск из разных контекстов
+try:
+    from . import gitrepo
+except ImportError:
+    import gitrepo
+
+MODULE_FILE = 'Module.mtd'
+
+# каталоги без метаданных: служебные каталоги git и IDE, результаты сборки, пакеты
+DEFAULT_EXCLUDE = ('.git', '.vs', 'bin', 'obj', 'packages', 'node_modules')
+
+# файлы каталога проекта исходного кода (.Server, .ClientBase и т.п.): модулей внутри не бывает
+PROJECT_FILES = ('*.csproj',)
+
+# файлы, которые запрашиваются из индекса git
+GIT_PATTERNS = ('*.mtd*', '*.resx') + PROJECT_FILES
+
+
+class MetadataFile(NamedTuple):
+    """ .mtd файл: каталог модуля, путь к .mtd, найденные рядом System.resx / System.ru.resx """
+    module: str
+    path: str
+    resx: Tuple[str, ...]
+
+
+class Rules(NamedTuple):
+    """
+    Правила обхода: exclude - шаблоны (glob) имён или относительных путей каталогов, которые не обходятся,
+    include - шаблоны относительных путей каталогов модулей, если заданы - остальные модули пропускаются,
+    projects - шаблоны имён файлов проекта: каталог с таким файлом без Module.mtd не обходится глубже,
+    git_index - список файлов берётся из индекса git (git ls-files), а не обходом каталогов.
+    Относительные пути записываются через "/".
+    """
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = DEFAULT_EXCLUDE
+    projects: Tuple[str, ...] = PROJECT_FILES
+    git_index: bool = False
+
+
+def make_rules(include: Union[str, Sequence[str], None] = None,
+               exclude: Union[str, Sequence[str], None] = None, git_index=False) -> Rules:
+    """ Правила из параметров командной строки: шаблоны через запятую, exclude дополняет DEFAULT_EXCLUDE """
+    def split(patterns):
+        if isinstance(patterns, str):
+            patterns = patterns.split(',')
+        return tuple(x.strip() for x in patterns or () if x.strip())
+
+    return Rules(split(include), DEFAULT_EXCLUDE + split(exclude), PROJECT_FILES, git_index)
+
+
+def compile_patterns(patterns: Sequence[str]) -> Optional[Callable[[str], object]]:
+    """ Проверка имени по списку шаблонов одним регулярным выражением, регистр - как в файловой системе """
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(x)) for x in patterns)).match
+
+
+def companions(folder: str, name: str, names) -> Tuple[str, ...]:
+    """ Существующие .resx для .mtd файла name, names - имена файлов каталога """
+    return tuple(os.path.join(folder, x) for x in (name.replace('.mtd', 'System.resx'),
+                                                   name.replace('.mtd', 'System.ru.resx')) if x in names)
+
+
+def _scandir(path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """ Подкаталоги и файлы каталога, тип берётся из DirEntry без дополнительных вызовов stat """
+    folders = []
+    files = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                (folders if is_dir else files).append(entry)
+    except OSError:
+        pass
+    return folders, files
+
+
+def module_files(path: str, only_module=False, files: Optional[List[os.DirEntry]] = None,
+                 folders: Optional[List[os.DirEntry]] = None) -> Iterator[MetadataFile]:
+    """
+    Module.mtd каталога модуля и .mtd сущностей в его подкаталогах (первого уровня).
+    files/folders - уже прочитанное содержимое каталога модуля.
+    """
+    if files is None:
+        folders, files = _scandir(path)
+    names = {x.name for x in files}
+    yield MetadataFile(path, os.path.join(path, MODULE_FILE), companions(path, MODULE_FILE, names))
+    if only_module:
+        return
+
+    for folder in folders:
+        entries = _scandir(folder.path)[1]
+        names = {x.name for x in entries}
+        for entry in entries:
+            if '.mtd' in entry.name:
+                yield MetadataFile(path, entry.path, companions(folder.path, entry.name, names))
+
+
+def walk(root: str, only_module=False, rules: Rules = Rules()) -> Iterator[MetadataFile]:
+    """
+    Обход каталога root через os.scandir: каталог с Module.mtd - каталог модуля, для него выдаются
+    Module.mtd и .mtd сущностей (module_files), дальше каталог модуля не обходится.
+    Каталоги по rules.exclude и каталоги проектов (rules.projects) отсекаются вместе с поддеревом.
+    Порядок - как у os.walk.
+    """
+    exclude = compile_patterns(rules.exclude)
+    include = compile_patterns(rules.include)
+    projects = compile_patterns(rules.projects)
+    stack = [(root, '')]
+    while stack:
+        path, relative = stack.pop()
+        folders, files = _scandir(path)
+        if any(x.name == MODULE_FILE for x in files):
+            if not include or include(os.path.normcase(relative)):
+                yield from module_files(path, only_module, files, folders)
+            continue
+        if projects and any(projects(os.path.normcase(x.name)) for x in files):
+            continue
+
+        children = []
+        for folder in folders:
+            # как и os.walk, по ссылкам на каталоги не переходим
+            if folder.is_symlink():
+                continue
+            child = relative + '/' + folder.name if relative else folder.name
+            if exclude and (exclude(os.path.normcase(folder.name)) or exclude(os.path.normcase(child))):
+                continue
+            children.append((folder.path, child))
+        stack.extend(reversed(children))
+
+
+def walk_paths(root: str, paths: Iterable[str], only_module=False, rules: Rules = Rules()) -> Iterator[MetadataFile]:
+    """
+    То же, что walk, по готовому списку файлов (пути относительно root через "/"), например из индекса git.
+    Модули выдаются в порядке путей (каталог раньше вложенных), сущности модуля - по именам.
+    """
+    exclude = compile_patterns(rules.exclude)
+    include = compile_patterns(rules.include)
+    projects = compile_patterns(rules.projects)
+
+    folders: Dict[str, Set[str]] = {}
+    children: Dict[str, List[str]] = {}
+    for path in paths:
+        folder, _, name = path.rpartition('/')
+        names = folders.get(folder)
+        if names is None:
+            folders[folder] = names = set()
+            if folder:
+                children.setdefault(folder.rpartition('/')[0], []).append(folder)
+        names.add(name)
+
+    def stops(folder: str) -> bool:
+        """ Каталог не обходится глубже: каталог модуля или проекта """
+        names = folders.get(folder, ())
+        return MODULE_FILE in names or bool(projects) and any(projects(os.path.normcase(x)) for x in names)
+
+    def excluded(folder: str) -> bool:
+        return bool(exclude) and (exclude(os.path.normcase(folder.rpartition('/')[2])) or
+                                  exclude(os.path.normcase(folder)))
+
+    def native(folder: str) -> str:
+        return os.path.join(root, *folder.split('/')) if folder else root
+
+    modules = []
+    for folder, names in folders.items():
+        if MODULE_FILE not in names:
+            continue
+        parts = folder.split('/') if folder else []
+        prefixes = ['/'.join(parts[:i]) for i in range(len(parts) + 1)]
+        if any(stops(x) for x in prefixes[:-1]) or any(excluded(x) for x in prefixes[1:]):
+            continue
+        if include and not include(os.path.normcase(folder)):
+            continue
+        modules.append(folder)
+
+    for folder in sorted(modules, key=lambda x: x.split('/')):
+        path = native(folder)
+        yield MetadataFile(path, os.path.join(path, MODULE_FILE), companions(path, MODULE_FILE, folders[folder]))
+        if only_module:
+            continue
+
+        for child in sorted(children.get(folder, ())):
+            child_path = native(child)
+            names = folders[child]
+            for name in sorted(names):
+                if '.mtd' in name:
+                    yield MetadataFile(path, os.path.join(child_path, name), companions(child_path, name, names))
+
+
+def find(root: str, only_module=False, rules: Rules = Rules()) -> Iterator[MetadataFile]:
+    """ .mtd файлы репозитория: из индекса git (rules.git_index) или обходом каталогов, если это не репозиторий git """
+    if rules.git_index:
+        paths = gitrepo.ls_files(root, *GIT_PATTERNS)
+        if paths is not None:
+            return walk_paths(root, paths, only_module, rules)
+        print('Not a git repository, walking directories:', root)
+    return walk(root, only_module, rules)
+
+
+def revision_files(root: str, revision: str) -> Optional[Dict[str, str]]:
+    """
+    Файлы метаданных и проектов каталога root в ревизии git (без извлечения в рабочее дерево):
+    SHA объектов по путям относительно root через "/" (для walk_paths), None - если ревизия не найдена.
+    """
+    tree = gitrepo.ls_tree(root, revision)
+    if tree is None:
+        return None
+    match = compile_patterns(GIT_PATTERNS)
+    return {path: sha for path, sha in tree.items() if match(os.path.normcase(path.rpartition('/')[2]))}
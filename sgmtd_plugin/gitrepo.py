@@ -0,0 +1,151 @@
+# coding: utf-8
+""" Вызовы git для репозиториев разработки. """
+import atexit
+import os
+import subprocess
+from typing import Dict, List, NamedTuple, Optional
+
+
+def git(repo_path: str, *args: str) -> Optional[str]:
+    """ Выполнить команду git в каталоге репозитория, None - если это не репозиторий или git недоступен """
+    try:
+        proc = subprocess.run(['git', '-C', repo_path] + list(args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.decode('utf-8')
+
+
+def head(repo_path: str) -> Optional[str]:
+    """ Текущий коммит репозитория """
+    response = git(repo_path, 'rev-parse', '--verify', 'HEAD')
+    return response.strip() if response else None
+
+
+def _paths(output: Optional[str], repo_path: str) -> List[str]:
+    if not output:
+        return []
+    return [os.path.normpath(os.path.join(repo_path, x)) for x in output.split('\0') if x]
+
+
+def changed_files(repo_path: str, commit: str, *patterns: str) -> Optional[List[str]]:
+    """
+    Файлы каталога repo_path, отличающиеся в рабочем дереве от commit (включая незафиксированные),
+    patterns - только файлы по шаблонам. None - если сравнение невозможно (коммит не найден).
+    """
+    output = git(repo_path, 'diff', '--name-only', '--no-renames', '--relative', '-z', commit, '--', *patterns)
+    if output is None:
+        return None
+    return _paths(output, repo_path)
+
+
+def untracked_files(repo_path: str, *patterns: str) -> List[str]:
+    """ Неотслеживаемые (и не игнорируемые) файлы каталога repo_path, patterns - только файлы по шаблонам """
+    return _paths(git(repo_path, 'ls-files', '--others', '--exclude-standard', '-z', '--', *patterns), repo_path)
+
+
+def ls_files(repo_path: str, *patterns: str) -> Optional[List[str]]:
+    """
+    Файлы каталога repo_path из индекса git (без обхода рабочего дерева), кроме удалённых в рабочем дереве.
+    Пути относительно repo_path через "/", None - если это не репозиторий git.
+    """
+    output = git(repo_path, 'ls-files', '-z', '--cached', '--', *patterns)
+    if output is None:
+        return None
+    deleted = set((git(repo_path, 'ls-files', '-z', '--deleted', '--', *patterns) or '').split('\0'))
+    return [x for x in output.split('\0') if x and x not in deleted]
+
+
+def ls_tree(repo_path: str, revision: str) -> Optional[Dict[str, str]]:
+    """
+    Файлы каталога repo_path в ревизии revision (ветка, тег, коммит) без извлечения в рабочее дерево:
+    SHA объектов по путям относительно repo_path через "/". None - если ревизия не найдена.
+    """
+    output = git(repo_path, 'ls-tree', '-r', '-z', revision)
+    if output is None:
+        return None
+    response = {}
+    for line in output.split('\0'):
+        info, _, path = line.partition('\t')
+        parts = info.split()
+        if len(parts) == 3 and parts[1] == 'blob':
+            response[path] = parts[2]
+    return response
+
+
+class BlobReader:
+    """ Чтение объектов git одним долгоживущим процессом git cat-file --batch """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self._proc = subprocess.Popen(['git', '-C', repo_path, 'cat-file', '--batch'], stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def read(self, name: str) -> Optional[bytes]:
+        """ Содержимое объекта (SHA или ревизия:путь), None - если объекта нет """
+        self._proc.stdin.write(name.encode('utf-8') + b'\n')
+        self._proc.stdin.flush()
+        header = self._proc.stdout.readline().split()
+        if not header:
+            raise OSError('git cat-file terminated: ' + self.repo_path)
+        # "<sha> <type> <size>" или "<name> missing"
+        if len(header) != 3:
+            return None
+        content = self._proc.stdout.read(int(header[2]))
+        # перевод строки после содержимого
+        self._proc.stdout.read(1)
+        return content
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.stdin.close()
+            self._proc.wait()
+        self._proc.stdout.close()
+
+
+# процессы чтения текущего процесса по репозиториям
+_readers: Dict[str, BlobReader] = {}
+_readers_pid: Optional[int] = None
+
+
+def blob_reader(repo_path: str) -> BlobReader:
+    """ Процесс чтения объектов репозитория, один на репозиторий в каждом процессе (в том числе пула) """
+    global _readers_pid
+    if _readers_pid != os.getpid():
+        # при fork процесс пула получает копию словаря, каналы основного процесса не используются
+        _readers.clear()
+        _readers_pid = os.getpid()
+    reader = _readers.get(repo_path)
+    if reader is None:
+        _readers[repo_path] = reader = BlobReader(repo_path)
+    return reader
+
+
+def close_readers():
+    if _readers_pid == os.getpid():
+        for reader in _readers.values():
+            reader.close()
+    _readers.clear()
+
+
+atexit.register(close_readers)
+
+
+class Blobs(NamedTuple):
+    """ Файлы ревизии: repo_path - репозиторий, shas - SHA объектов по полным путям файлов """
+    repo_path: str
+    shas: Dict[str, str]
+
+    def sha(self, path: str) -> Optional[str]:
+        return self.shas.get(path)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """ Содержимое файла в ревизии, None - если файла в ней нет """
+        sha = self.shas.get(path)
+        return blob_reader(self.repo_path).read(sha) if sha else None
@@ -0,0 +1,180 @@
+# coding: utf-8
+""" Сравнение двух моделей метаданных (например, двух веток) по NameGuid объектов. """
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+# элементы сущности: вид объекта в отчёте и атрибут со списком
+CHILDREN = (('property', 'Properties'), ('control', 'Controls'), ('action', 'Actions'), ('ribbon', 'RibbonCard'))
+_CHILD_KINDS = {x for x, _ in CHILDREN}
+
+# вид объекта верхнего уровня по MtdType, остальные - сущности
+KINDS = {'Solution': 'solution', 'Module': 'module', 'LayerModule': 'module'}
+
+# виды изменений в порядке вывода
+CHANGES = ('added', 'removed', 'renamed', 'reparented', 'sql', 'changed')
+
+# поля, изменения которых выводятся отдельными видами (renamed, reparented, sql), а не в changed
+_SEPARATE = {'Name', 'BaseGuid'}
+_SEPARATE_PROPERTY = _SEPARATE | {'Code'}
+
+
+class Change(NamedTuple):
+    """
+    Изменение объекта: kind - вид объекта (solution, module, entity, property, control, action, ribbon),
+    change - вид изменения (CHANGES), entity - сущность элемента, old/new - значения до и после.
+    """
+    kind: str
+    change: str
+    guid: str
+    name: str
+    entity: str = ''
+    old: Any = None
+    new: Any = None
+    path: str = ''
+
+
+class ModelDiff(NamedTuple):
+    """ Результат сравнения: изменения и число объектов верхнего уровня без изменений """
+    changes: List[Change]
+    unchanged: int
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """ Число изменений: вид объекта -> вид изменения -> количество """
+        counts = Counter((x.kind, x.change) for x in self.changes)
+        response: Dict[str, Dict[str, int]] = {}
+        for (kind, change), count in sorted(counts.items(), key=lambda x: (x[0][0], CHANGES.index(x[0][1]))):
+            response.setdefault(kind, {})[change] = count
+        return response
+
+
+def field(item, name: str) -> Any:
+    """ Значение поля, для свойств - имя из .mtd: Name ссылки на сущность в коллекции подменяется при связывании """
+    if name == 'Name':
+        return getattr(item, 'JsonName', item.Name)
+    return getattr(item, name, None)
+
+
+def sql_column(item) -> str:
+    """ SQL столбец свойства, как Property.SQLColumn, но по имени из .mtd """
+    return item.Code or field(item, 'Name')
+
+
+def signature(item) -> tuple:
+    """ Сравниваемые данные объекта: тип и поля, копируемые из JSON при разборе """
+    return (item.type,) + tuple(field(item, x) for x in item._schema)
+
+
+def own_children(item, attr: str) -> List[Any]:
+    """ Элементы сущности, свойства коллекций, добавленные при связывании, сравниваются в самой коллекции """
+    children = getattr(item, attr, None) or []
+    if attr == 'Properties':
+        return [x for x in children if x.CollectionEntity is None or x.CollectionEntity is item]
+    return children
+
+
+def content_hash(item) -> bytes:
+    """ Хэш объекта вместе с его элементами: совпадает - объект и всё его поддерево не сравниваются """
+    digest = hashlib.blake2b(repr(signature(item)).encode('utf-8'), digest_size=16)
+    for _, attr in CHILDREN:
+        digest.update(attr.encode('ascii'))
+        for child in own_children(item, attr):
+            digest.update(repr(signature(child)).encode('utf-8'))
+    return digest.digest()
+
+
+def _label(item) -> str:
+    try:
+        return str(item)
+    except AttributeError:
+        # сущность без модуля
+        return item.Name or ''
+
+
+def _by_guid(items: Iterable[Any]) -> Dict[str, Any]:
+    return {x.NameGuid: x for x in items if x.NameGuid}
+
+
+def compare_item(kind: str, old, new, entity: str, changes: List[Change], path: str = ''):
+    """ Изменения полей объекта (без элементов) """
+    name = field(new, 'Name')
+
+    def add(change, old_value, new_value):
+        changes.append(Change(kind, change, new.NameGuid, name, entity, old_value, new_value, path))
+
+    if field(old, 'Name') != name:
+        add('renamed', field(old, 'Name'), name)
+    # родитель (BaseGuid) есть только у объектов верхнего уровня
+    if kind not in _CHILD_KINDS and old.BaseGuid != new.BaseGuid:
+        add('reparented', old.BaseGuid, new.BaseGuid)
+    if kind == 'property' and sql_column(old) != sql_column(new):
+        add('sql', sql_column(old), sql_column(new))
+
+    separate = _SEPARATE_PROPERTY if kind == 'property' else _SEPARATE
+    fields = ('type',) + tuple(x for x in new._schema if x not in separate)
+    old_values = {x: field(old, x) for x in fields}
+    new_values = {x: field(new, x) for x in fields}
+    if old_values != new_values:
+        add('changed', {k: v for k, v in old_values.items() if new_values[k] != v},
+            {k: v for k, v in new_values.items() if old_values[k] != v})
+
+
+def compare_children(old, new, changes: List[Change]):
+    """ Изменения свойств, контролов, действий и кнопок сущности """
+    entity = _label(new)
+    for kind, attr in CHILDREN:
+        old_children = _by_guid(own_children(old, attr))
+        new_children = _by_guid(own_children(new, attr))
+        for guid, item in new_children.items():
+            previous = old_children.get(guid)
+            if previous is None:
+                changes.append(Change(kind, 'added', guid, field(item, 'Name'), entity, path=new.path))
+            elif signature(previous) != signature(item):
+                compare_item(kind, previous, item, entity, changes, new.path)
+        for guid, item in old_children.items():
+            if guid not in new_children:
+                changes.append(Change(kind, 'removed', guid, field(item, 'Name'), entity, path=old.path))
+
+
+def compare(old_items: Iterable[Any], new_items: Iterable[Any]) -> ModelDiff:
+    """
+    Сравнение моделей (объекты верхнего уровня: решения, модули, сущности) по NameGuid.
+    Объекты с одинаковым content_hash пропускаются целиком, сравнение - за один проход по моделям.
+    """
+    old_map = _by_guid(old_items)
+    new_map = _by_guid(new_items)
+    changes: List[Change] = []
+    unchanged = 0
+    for guid, item in new_map.items():
+        kind = KINDS.get(item.MtdType, 'entity')
+        previous = old_map.get(guid)
+        if previous is None:
+            changes.append(Change(kind, 'added', guid, item.Name, path=item.path))
+            continue
+        if content_hash(previous) == content_hash(item):
+            unchanged += 1
+            continue
+
+        if signature(previous) != signature(item):
+            compare_item(kind, previous, item, '', changes, item.path)
+        if kind == 'entity':
+            compare_children(previous, item, changes)
+
+    for guid, item in old_map.items():
+        if guid not in new_map:
+            changes.append(Change(KINDS.get(item.MtdType, 'entity'), 'removed', guid, item.Name, path=item.path))
+    return ModelDiff(changes, unchanged)
+
+
+def format_value(value: Any) -> Optional[str]:
+    """ Значение для отчёта: изменённые поля - "поле=значение" через "; " """
+    if isinstance(value, dict):
+        return '; '.join('{}={}'.format(k, v) for k, v in value.items())
+    return None if value is None else str(value)
+
+
+def write_json(filename: str, diff: ModelDiff):
+    data = {'summary': diff.summary(), 'unchanged': diff.unchanged, 'changes': [x._asdict() for x in diff.changes]}
+    with open(filename, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, ensure_ascii=False, indent=1)
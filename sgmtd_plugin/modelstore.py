@@ -0,0 +1,102 @@
+# coding: utf-8
+""" Двоичный снимок связанной модели: загрузка без обхода и разбора репозиториев. """
+import hashlib
+import marshal
+import os
+import sys
+import zlib
+from typing import Any, Dict, List, Optional
+
+# запуск из разных контекстов
+try:
+    from . import discovery
+    from . import gitrepo
+except ImportError:
+    import discovery
+    import gitrepo
+
+# при изменении формата снимок пересоздаётся
+MODEL_VERSION = 1
+MAGIC = b'SGMTDM'
+# zlib: быстрый уровень, снимок пишется при каждом полном разборе
+COMPRESS_LEVEL = 1
+
+
+def _version() -> bytes:
+    # marshal зависит от версии Python
+    return '{}:{}.{}'.format(MODEL_VERSION, *sys.version_info[:2]).encode('ascii')
+
+
+def _stat(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def repository_state(repo: Dict[str, str], rules: discovery.Rules) -> str:
+    """
+    Состояние репозитория: для git - коммит (ревизии или HEAD) и mtime/size изменённых и неотслеживаемых
+    .mtd, .resx и файлов проектов (отсекают обход каталогов), для каталога вне git - mtime/size всех найденных .mtd/.resx.
+    """
+    path = repo.get('path')
+    revision = repo.get('revision')
+    if revision:
+        commit = gitrepo.git(path, 'rev-parse', '--verify', revision + '^{commit}')
+        if commit:
+            return 'revision:' + commit.strip()
+
+    commit = gitrepo.head(path)
+    patterns = ('*.mtd*', '*.resx') + rules.projects
+    changed = gitrepo.changed_files(path, commit, *patterns) if commit else None
+    if changed is not None:
+        files = sorted(set(changed + gitrepo.untracked_files(path, *patterns)))
+        return 'commit:{}:{!r}'.format(commit, [(x, _stat(x)) for x in files])
+
+    files = []
+    for item in discovery.walk(path, rules=rules):
+        files.append((item.path, _stat(item.path)) + tuple(_stat(x) for x in item.resx))
+    return 'files:{!r}'.format(files)
+
+
+def fingerprint(repos: List[Dict[str, str]], rules: discovery.Rules = discovery.Rules()) -> str:
+    """ Отпечаток репозиториев и правил обхода: снимок модели действителен, пока отпечаток не изменился """
+    digest = hashlib.blake2b(repr(rules).encode('utf-8'), digest_size=20)
+    for repo in repos:
+        digest.update(repr((repo.get('type'), repo.get('path'), repo.get('revision'))).encode('utf-8'))
+        digest.update(repository_state(repo, rules).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write(filename: str, fingerprint_value: str, data: Any):
+    """ Запись снимка: заголовок (версия, отпечаток) и сжатые данные marshal """
+    version = _version()
+    key = fingerprint_value.encode('ascii')
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as fp:
+        fp.write(MAGIC + bytes((len(version), len(key))) + version + key)
+        fp.write(zlib.compress(marshal.dumps(data), COMPRESS_LEVEL))
+    os.replace(tmp, filename)
+
+
+def read(filename: str, fingerprint_value: Optional[str] = None) -> Optional[Any]:
+    """
+    Данные снимка, None - если снимка нет, он другой версии или отпечаток не совпадает
+    (заголовок проверяется до чтения данных). fingerprint_value=None - без проверки отпечатка.
+    """
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename, 'rb') as fp:
+            header = fp.read(len(MAGIC) + 2)
+            if len(header) < len(MAGIC) + 2 or header[:len(MAGIC)] != MAGIC:
+                return None
+            version = fp.read(header[-2])
+            key = fp.read(header[-1]).decode('ascii')
+            if version != _version() or fingerprint_value is not None and key != fingerprint_value:
+                return None
+            return marshal.loads(zlib.decompress(fp.read()))
+    except (OSError, ValueError, EOFError, zlib.error) as exc:
+        print('Model snapshot skipped:', exc)
+        return None
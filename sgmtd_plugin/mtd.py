@@ -1,27 +1,81 @@
 import os
 import json
+import pickle
+import re
 import sys
-from typing import Any, Optional, List, Dict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain, islice
+from typing import Any, Optional, List, Dict, Iterable, Iterator, NamedTuple, Tuple
 import xml.etree.ElementTree as ET
 
+# отладка: элементы сущностей сохраняют исходный JSON (по умолчанию удаляется после разбора)
+KEEP_JSON = bool(os.environ.get('SGMTD_KEEP_JSON'))
+
+# общий пустой словарь ресурсов для объектов без .resx, не изменяется
+EMPTY_RESX = {'en': {}, 'ru': {}}
+
+# строки .resx, которые выводятся в отчёт (таблица локализации MetadataIndex)
+LOCALE_KEYS = ('DisplayName', 'Property_')
+
+# размер порции текста .resx при потоковом разборе
+RESX_CHUNK = 64 * 1024
+
+# ключи Module.mtd, которые нужны для package.xml
+HEADER_KEYS = ('$type', 'NameGuid', 'Name', 'CompanyCode', 'Version')
+
 # запуск из разных контекстов
 try:
     from . import xlsxwriter
+    from . import discovery
+    from . import gitrepo
+    from . import modeldiff
+    from . import modelstore
+    from . import parsecache
+    from . import sqlexport
+    from . import timings
+    from . import writers
+    from .parsecache import ParseCache
 except ImportError:
     import xlsxwriter
-
-
-def dispatch(mtd_file, module=None, en_file=None, ru_file=None):
+    import discovery
+    import gitrepo
+    import modeldiff
+    import modelstore
+    import parsecache
+    import sqlexport
+    import timings
+    import writers
+    from parsecache import ParseCache
+
+
+def decode(mtd_file, en_file=None, ru_file=None):
+    """ Разбор текста .mtd и сопутствующих .resx """
+    with timings.phase('json decode'):
+        j = json.loads(mtd_file)
+    with timings.phase('resx decode'):
+        return j, parse_resx(en_file), parse_resx(ru_file)
+
+
+def dispatch(mtd_file, module=None, en_file=None, ru_file=None, index: Optional['MetadataIndex'] = None):
     try:
-        response = None
         if mtd_file:
-            j = json.loads(mtd_file)
+            j, en_res, ru_res = decode(mtd_file, en_file, ru_file)
         else:
-            return response
+            return None
+    except Exception as exc:
+        print(exc)
+        return None
+
+    return build(j, en_res, ru_res, module, index)
 
-        en_res = parse_resx(en_file)
-        ru_res = parse_resx(ru_file)
 
+def build(j, en_res=None, ru_res=None, module=None, index: Optional['MetadataIndex'] = None):
+    """ Создание объекта по разобранному .mtd """
+    try:
+        response = None
         t = j.get("$type", "").split(",")[0]
 
         if t == "Sungero.Metadata.SolutionMetadata":
@@ -50,60 +104,112 @@ def dispatch(mtd_file, module=None, en_file=None, ru_file=None):
         if response and not isinstance(response, (Solution, Module)):
             response.Module = module
 
+        if response and index is not None:
+            index.add(response)
+
     except Exception as exc:
         print(exc)
 
     return response
 
 
-class Singleton(object):
+class JsonField:
+    """
+    Редко используемое поле: значение читается из JSON при первом обращении
+    и сохраняется в объекте, дальше descriptor не вызывается.
+    """
 
-    def __new__(cls, elem=None):
-        if not hasattr(cls, 'instance'):
-            cls.instance = super(Singleton, cls).__new__(cls)
+    def __init__(self, default=None, default_factory=None):
+        self.default = default
+        self.default_factory = default_factory
+        self.name = None
 
-        if not hasattr(cls.instance, 'entity'):
-            cls.instance.entity = {}
+    def __set_name__(self, owner, name):
+        self.name = name
 
-        if not hasattr(cls.instance, 'property'):
-            cls.instance.property = {}
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj.json.get(self.name)
+        if not value or isinstance(value, list):
+            value = self.default_factory() if self.default_factory else self.default
+        obj.__dict__[self.name] = value
+        return value
 
-        if not hasattr(cls.instance, 'control'):
-            cls.instance.control = {}
 
-        return cls.instance
+class BasicMTD:
+    # у элементов сущностей (LeafMTD) нет __dict__, все атрибуты в слотах
+    __slots__ = ('json', 'resx', 'type', 'Name', 'NameGuid', 'path', 'index', 'RootEntity')
+    _slot_names = __slots__
 
+    # ссылки, найденные через индекс, после загрузки из снимка ищутся заново
+    _lookups = ('index', '_parent', '_solution', '_action', '_parent_task', '_ancestors')
 
-class BasicMTD:
-    type = ""
-    Name = ""
-    NameGuid = ""
-    path = ""
+    # поля, копируемые из JSON при разборе, к ним добавляются Fields базовых классов
+    Fields = ('Name',)
+    _schema = Fields
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        schema = []
+        for klass in reversed(cls.__mro__):
+            schema.extend(x for x in klass.__dict__.get('Fields', ()) if x not in schema)
+        cls._schema = tuple(schema)
+        cls._slot_names = tuple(x for klass in cls.__mro__ for x in klass.__dict__.get('__slots__', ()))
 
     def __init__(self, json_str, en_res=None, ru_res=None, root_entity=None):
+        self.type = ""
+        self.Name = ""
+        self.path = ""
+        self.index = None
         self.json = {}
-        self.resx = {'en': en_res if en_res else {}, 'ru': ru_res if ru_res else {}}
+        if en_res or ru_res:
+            self.resx = {'en': en_res if en_res else {}, 'ru': ru_res if ru_res else {}}
+        else:
+            self.resx = EMPTY_RESX
         if isinstance(json_str, str):
             self.json = json.loads(json_str)
         elif isinstance(json_str, dict):
             self.json = json_str
 
-        self.NameGuid = self.json.get("NameGuid")
+        guid = self.json.get("NameGuid")
+        self.NameGuid = sys.intern(guid) if guid else guid
         self.RootEntity = root_entity
-        Singleton().entity[self.NameGuid] = self
 
         self.parse()
 
     def __str__(self):
         return "{}({})".format(self.Name, self.NameGuid)
 
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for key in self._slot_names:
+            if hasattr(self, key):
+                state[key] = getattr(self, key)
+        for key in self._lookups:
+            if key in state:
+                state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, sys.intern(value) if isinstance(value, str) else value)
+        if not any(self.resx.values()):
+            self.resx = EMPTY_RESX
+
+    def lookup(self, guid):
+        """ Объект из индекса текущего анализа """
+        return self.index.get(guid) if self.index else None
+
     def parse(self):
-        for k in [x for x in dir(self) if "__" not in x]:
-            v = self.json.get(k)
+        data = self.json
+        for k in self._schema:
+            v = data.get(k)
             if v and not isinstance(v, list):
-                setattr(self, k, v)
+                # Guid, коды и имена повторяются в ссылках и у наследников
+                setattr(self, k, sys.intern(v) if isinstance(v, str) else v)
 
-        self.type = self.json.get("$type", "").split(",")[0]
+        self.type = sys.intern(data.get("$type", "").split(",")[0])
 
     def Locale(self, lang):
         """ Возвращает локализованное имя"""
@@ -123,6 +229,8 @@ class BasicMTD:
 
 class BaseMTD(BasicMTD):
     """Базовый класс для работы с MTD"""
+    Fields = ('BaseGuid', 'Code')
+    # объект из архивного репозитория: задаётся при обходе, в JSON .mtd такого поля нет
     IsArchive = False
     BaseGuid = ""
     Code = ""
@@ -137,6 +245,7 @@ class BaseMTD(BasicMTD):
         self.Versions = []
         self.Module = None
         self._parent = None
+        self._ancestors = None
         super().__init__(json_str, en_res, ru_res)
 
     def __str__(self):
@@ -144,35 +253,67 @@ class BaseMTD(BasicMTD):
 
     def Locale(self, lang):
         """ Возвращает локализованное имя"""
-        response = None
-        data = self.resx.get(lang)
-        if data:
-            response = data.get('DisplayName')
-        if not response:
-            response = self.Parent.Locale(lang) if self.Parent else None  # TODO: оптимизировать
+        return self.LocaleString(lang, 'DisplayName')
+
+    def LocaleString(self, lang, key):
+        """
+        Строка key .resx: из таблицы локализации индекса (build_locales), если она построена,
+        иначе из .resx объекта или ближайшего родителя, где она есть.
+        """
+        locales = self.index.locales_of(self) if self.index else None
+        if locales is not None:
+            return locales.get((self.NameGuid, lang, key))
+
+        for item in (self,) + self.Ancestors:
+            data = item.resx.get(lang)
+            response = data.get(key) if data else None
+            if response:
+                return response
 
-        return response
+        return None
 
     @property
     def Parent(self):
         if not self._parent:
-            self._parent = Singleton().entity.get(self.BaseGuid)
+            self._parent = self.lookup(self.BaseGuid)
         return self._parent
 
     @property
-    def RootParent(self):
-        # TODO: наверняка есть возможность оптимизации
-        parent = self.Parent
-        if parent:
-            while parent:
-                if parent.Parent:
-                    parent = parent.Parent
-                else:
-                    break
-        else:
-            parent = self
+    def Ancestors(self) -> tuple:
+        """ Родители от ближайшего до корневого, вычисляются один раз """
+        if self._ancestors is None:
+            self._build_ancestors()
+        return self._ancestors
 
-        return parent
+    @property
+    def Depth(self) -> int:
+        """ Число уровней наследования """
+        return len(self.Ancestors)
+
+    @property
+    def RootParent(self):
+        return self.Ancestors[-1] if self.Ancestors else self
+
+    def _build_ancestors(self):
+        # подъём до родителя с уже известной цепочкой, цепочки всех пройденных объектов заполняются
+        path = []
+        seen = set()
+        node = self
+        while node is not None and node._ancestors is None:
+            if id(node) in seen:
+                # цикл (например, в битых VersionData) - наследование обрывается перед повтором
+                cycle = path[path.index(node):] + [node]
+                print('Inheritance cycle:', ' -> '.join(str(x.NameGuid) for x in cycle))
+                node = None
+                break
+            seen.add(id(node))
+            path.append(node)
+            node = node.Parent
+
+        ancestors = (node,) + node._ancestors if node is not None else ()
+        for item in reversed(path):
+            item._ancestors = ancestors
+            ancestors = (item,) + ancestors
 
     def FullName(self):
         if isinstance(self.Module, Solution):
@@ -186,14 +327,27 @@ class BaseMTD(BasicMTD):
         return '{}.{}.{}'.format(solution, module, self.Name)
 
     def SQLTable(self):
-        return '{}_{}_{}'.format(self.RootParent.Module.CompanyCode if self.Module else '---',
-                                 self.RootParent.Module.Code if self.Module else '---',
-                                 self.RootParent.Code)
+        root = self.RootParent
+        return '{}_{}_{}'.format(root.Module.CompanyCode if self.Module else '---',
+                                 root.Module.Code if self.Module else '---',
+                                 root.Code)
+
 
+class LeafMTD(BasicMTD):
+    """
+    Элемент сущности: действие, контрол, свойство, кнопка. Таких объектов в модели большинство,
+    поэтому они компактны: атрибуты в слотах, JSON после разбора не хранится (кроме KEEP_JSON).
+    """
+    __slots__ = ()
 
-class Action(BasicMTD):
     def __init__(self, item: dict, root_entity):
         super().__init__(item, root_entity=root_entity)
+        if not KEEP_JSON:
+            self.json = None
+
+
+class Action(LeafMTD):
+    __slots__ = ()
 
     def ExcelHeaders(self) -> List[str]:
         return ['Тип', 'Код компании', 'Модуль', 'Тип сущности', 'Название', 'Действие', 'Guid', 'Путь']
@@ -212,14 +366,14 @@ class Action(BasicMTD):
         return response
 
 
-class Control(BasicMTD):
-    ParentGuid = ""
-    PropertyGuid = ""
+class Control(LeafMTD):
+    __slots__ = ('_parent', 'ParentGuid', 'PropertyGuid')
+    Fields = ('ParentGuid', 'PropertyGuid')
 
     def __init__(self, item: dict, root_entity):
         self._parent = None
-        self.RootEntity = root_entity
-        Singleton().control[self.NameGuid] = self
+        self.ParentGuid = ""
+        self.PropertyGuid = ""
         super().__init__(item, root_entity=root_entity)
 
     def ExcelHeaders(self) -> List[str]:
@@ -238,30 +392,31 @@ class Control(BasicMTD):
         return response
 
 
-class Property(BasicMTD):
-    IsAncestorMetadata = False
-    IsIdentifier = False
-    IsUnique = False
-    IsReferenceToRootEntity = False
-    EntityGuid = ""
-    Code = ""
+class Property(LeafMTD):
+    __slots__ = ('IsAncestorMetadata', 'IsIdentifier', 'IsUnique', 'IsReferenceToRootEntity', 'EntityGuid', 'Code',
+                 'CollectionProperty', 'CollectionEntity', 'JsonName')
+    Fields = ('IsReferenceToRootEntity', 'EntityGuid', 'Code', 'IsAncestorMetadata', 'IsIdentifier', 'IsUnique')
 
     def __init__(self, item: dict, root_entity):
-        self.RootEntity = root_entity
+        self.IsAncestorMetadata = False
+        self.IsIdentifier = False
+        self.IsUnique = False
+        self.IsReferenceToRootEntity = False
+        self.EntityGuid = ""
+        self.Code = ""
         self.CollectionProperty = None
         self.CollectionEntity = None
         super().__init__(item, root_entity=root_entity)
 
     def parse(self):
         super().parse()
+        # имя из .mtd, Name ссылки на сущность в коллекции подменяется при слиянии свойств
+        self.JsonName = self.Name
 
     def Locale(self, lang):
         if not self.RootEntity:
             return None
-        data = self.RootEntity.resx.get(lang)
-        if not data:
-            return None
-        return data.get('Property_' + self.Name)
+        return self.RootEntity.LocaleString(lang, 'Property_' + self.Name)
 
     @property
     def FullName(self):
@@ -297,17 +452,19 @@ class Property(BasicMTD):
         return response
 
 
-class RibbonActionButtonMetadata(BasicMTD):
-    ActionGuid = None
+class RibbonActionButtonMetadata(LeafMTD):
+    __slots__ = ('_action', 'ActionGuid')
+    Fields = ('ActionGuid',)
 
     def __init__(self, item: dict, root_entity):
         self._action = None
+        self.ActionGuid = None
         super().__init__(item, root_entity=root_entity)
 
     @property
     def Action(self):
         if not self._action:
-            self._action = Singleton().entity.get(self.ActionGuid)
+            self._action = self.lookup(self.ActionGuid)
         return self._action
 
     def ExcelHeaders(self) -> List[str]:
@@ -333,6 +490,7 @@ class RibbonActionButtonMetadata(BasicMTD):
 
 
 class Solution(BaseMTD):
+    Fields = ('Version', 'CompanyCode')
     Version = ""
     CompanyCode = ""
 
@@ -367,12 +525,13 @@ class Solution(BaseMTD):
 
 
 class Module(BaseMTD):
+    Fields = ('CompanyCode', 'Version', 'AssociatedGuid', 'SolutionGuid')
     CompanyCode = ""
     Version = ""
     AssociatedGuid = ""
-    LayeredFromGuid = ""
+    LayeredFromGuid = JsonField("")
     SolutionGuid = ""
-    Override = False
+    Override = JsonField(False)
 
     def __init__(self, json_str, en_res: Dict[str, str], ru_res: Dict[str, str]):
         self.AsyncHandlers = []
@@ -397,7 +556,7 @@ class Module(BaseMTD):
     @property
     def Solution(self):
         if not self._solution:
-            self._solution = Singleton().entity.get(self.SolutionGuid)
+            self._solution = self.lookup(self.SolutionGuid)
         return self._solution
 
     @Solution.setter
@@ -430,12 +589,6 @@ class Module(BaseMTD):
 
 
 class LayerModule(Module):
-    def parse(self):
-        super().parse()
-
-        if self.AssociatedGuid:
-            self.Solution = Singleton().entity.get(self.AssociatedGuid)
-
     def __str__(self):
         return self.Name
 
@@ -465,9 +618,9 @@ class LayerModule(Module):
 
 
 class DataBook(BaseMTD):
-    AccessRightsMode = ""
-    IsAbstract = False
-    IsVisible = False
+    AccessRightsMode = JsonField("")
+    IsAbstract = JsonField(False)
+    IsVisible = JsonField(False)
 
     def __init__(self, json_str, en_res=None, ru_res=None):
         self.Actions = []
@@ -503,6 +656,14 @@ class DataBook(BaseMTD):
         for prop in self.json.get("Properties", []):
             self.Properties.append(Property(prop, self))
 
+        if not KEEP_JSON:
+            # JSON элементов разобран в объекты, в сущности его не держим
+            for key in ("Actions", "Properties", "RibbonCardMetadata"):
+                self.json.pop(key, None)
+            if self.Forms:
+                self.Forms = [{k: v for k, v in form.items() if k != "Controls"} for form in self.Forms]
+                self.json["Forms"] = self.Forms
+
     def ExcelHeaders(self) -> List[str]:
         return ['Тип', 'Код компании', 'Модуль', 'Guid', 'Название', 'Имя[En]', 'Имя[Ru]', 'SQL таблица',
                 'Код компании родителя', 'Guid родителя', 'Название родителя', 'Путь']
@@ -536,9 +697,10 @@ class Document(DataBook):
 
 
 class Task(DataBook):
+    Scheme = JsonField(default_factory=dict)
+
     def __init__(self, json_str, en_res=None, ru_res=None):
         self.AttachmentGroups = []
-        self.Scheme = {}
         self._root_entity_guid = None
         super().__init__(json_str, en_res, ru_res)
 
@@ -547,19 +709,20 @@ class Task(DataBook):
 
 
 class Assignment(DataBook):
+    Fields = ('AssociatedGuid',)
     AssociatedGuid = None
+    Scheme = JsonField(default_factory=dict)
 
     def __init__(self, json_str, en_res=None, ru_res=None):
         self._parent_task = None
         self.AttachmentGroups = []
-        self.Scheme = {}
         self._root_entity_guid = None
         super().__init__(json_str, en_res, ru_res)
 
     @property
     def MainTask(self):
         if not self._parent_task:
-            self._parent_task = Singleton().entity.get(self.AssociatedGuid)
+            self._parent_task = self.lookup(self.AssociatedGuid)
         return self._parent_task
 
     def SQLTable(self):
@@ -575,34 +738,309 @@ class Report(DataBook):
     pass
 
 
-def get_file(filename: str):
-    if not os.path.isfile(filename):
+class MetadataIndex:
+    """
+    Индекс метаданных одного анализа: объекты по Guid и вторичные индексы.
+    Каждый анализ (например, двух веток) работает со своим индексом и не влияет на другие.
+    """
+
+    def __init__(self):
+        self.entity = {}  # Guid -> модуль, сущность, действие, свойство, кнопка, контрол
+        self.by_type = defaultdict(list)  # класс модели (и его базовые классы) -> объекты в порядке добавления
+        self.by_module = defaultdict(list)  # Guid модуля -> сущности модуля
+        self.children = defaultdict(list)  # BaseGuid -> наследники
+        self.collection_refs = defaultdict(list)  # EntityGuid -> ссылающиеся свойства
+        self.shadowed = set()  # id объектов, перекрытых в своём репозитории объектом с тем же Guid (см. collect)
+        self.locales = None  # (Guid, язык, ключ) -> строка, см. build_locales
+
+    def get(self, guid):
+        return self.entity.get(guid) if guid else None
+
+    def build_locales(self):
+        """
+        Таблица локализации модулей и сущностей после загрузки всех репозиториев.
+        Строки, которых нет в .resx объекта, берутся у ближайшего родителя, поэтому
+        Locale() - один поиск в словаре. Хранятся только ключи, которые выводятся в отчёт.
+        """
+        locales = {}
+        for item in self.by_type[BaseMTD]:
+            guid = item.NameGuid
+            if self.entity.get(guid) is not item:
+                continue
+
+            # от корня к объекту, родительские строки перекрываются строками наследников
+            for node in reversed((item,) + item.Ancestors):
+                for lang, data in node.resx.items():
+                    for key, value in data.items():
+                        if value and key.startswith(LOCALE_KEYS):
+                            locales[(guid, lang, key)] = value
+
+        self.locales = locales
+
+    def build_inheritance(self):
+        """
+        Цепочки наследования модулей и сущностей после загрузки всех репозиториев: обход от корней
+        к наследникам по children, цепочка наследника - родитель и его цепочка.
+        """
+        items = self.by_type[BaseMTD]
+        for item in items:
+            item._ancestors = None
+        pending = [x for x in items if self.get(x.BaseGuid) is None]
+        for item in pending:
+            item._ancestors = ()
+        while pending:
+            item = pending.pop()
+            # Parent наследников - объект индекса с их BaseGuid
+            if self.entity.get(item.NameGuid) is not item:
+                continue
+            ancestors = (item,) + item._ancestors
+            for child in self.children.get(item.NameGuid, ()):
+                child._ancestors = ancestors
+                pending.append(child)
+
+        # не достижимы от корней только объекты в циклах наследования и их наследники
+        for item in items:
+            if item._ancestors is None:
+                item._build_ancestors()
+
+    def locales_of(self, item: BasicMTD) -> Optional[Dict[tuple, str]]:
+        """ Таблица локализации, если она построена и item - объект индекса со своим Guid """
+        if self.locales is None or self.entity.get(item.NameGuid) is not item:
+            return None
+        return self.locales
+
+    def is_actual(self, item: BaseMTD) -> bool:
+        """ Объект модели: не архивная версия и не перекрыт в своём репозитории """
+        return not item.IsArchive and id(item) not in self.shadowed
+
+    def actual(self, cls) -> List[BaseMTD]:
+        """ Объекты модели класса cls (и его наследников) в порядке разбора """
+        return [x for x in self.by_type[cls] if self.is_actual(x)]
+
+    def module_entities(self, guid: str) -> List[BaseMTD]:
+        """ Сущности модели из модулей с Guid guid в порядке разбора """
+        return [x for x in self.by_module.get(guid, ()) if self.is_actual(x)]
+
+    def add(self, item: BasicMTD):
+        """ Регистрация объекта вместе с действиями, кнопками, свойствами и контролами """
+        if item.index is self:
+            return
+
+        item.index = self
+        self.entity[item.NameGuid] = item
+        self.locales = None
+        # без BasicMTD и object
+        for cls in type(item).__mro__[:-2]:
+            self.by_type[cls].append(item)
+
+        if isinstance(item, BaseMTD):
+            if item.BaseGuid:
+                self.children[item.BaseGuid].append(item)
+            if isinstance(item.Module, BaseMTD):
+                self.by_module[item.Module.NameGuid].append(item)
+        elif isinstance(item, Property) and item.EntityGuid:
+            self.collection_refs[item.EntityGuid].append(item)
+
+        # решение слоя - по AssociatedGuid, если оно уже известно
+        if isinstance(item, LayerModule) and item.AssociatedGuid:
+            solution = self.get(item.AssociatedGuid)
+            if solution:
+                item.Solution = solution
+
+        if isinstance(item, DataBook):
+            for child in item.Controls + item.Actions + item.RibbonCard + item.Properties:
+                self.add(child)
+
+
+def model_index(data: List[BasicMTD]) -> MetadataIndex:
+    """ Индекс анализа, в котором получены объекты модели; для объектов вне анализа строится новый """
+    index = data[0].index if data else None
+    if index is None:
+        index = MetadataIndex()
+        for item in data:
+            index.add(item)
+    return index
+
+
+def read_file(filename: str) -> Optional[bytes]:
+    try:
+        with open(filename, 'rb') as fp:
+            return fp.read()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
         return None
 
-    with open(filename, 'r', encoding='utf-8-sig') as fp:
-        return fp.read()
+
+def iter_resx(resx: str):
+    """ Потоковый разбор .resx: закрытые элементы по мере чтения текста """
+    parser = ET.XMLPullParser(events=('end',))
+    for pos in range(0, len(resx), RESX_CHUNK):
+        parser.feed(resx[pos:pos + RESX_CHUNK])
+        for _, elem in parser.read_events():
+            yield elem
+    parser.close()
+    for _, elem in parser.read_events():
+        yield elem
 
 
 def parse_resx(resx: str):
     response = {}
     if resx:
-        root = ET.fromstring(resx)
-        for child in root.iter('data'):
-            name = child.get('name')
-            value = next(child.iter('value')).text
-            response[name] = value
+        for elem in iter_resx(resx):
+            if elem.tag != 'data':
+                continue
+            value = next(elem.iter('value'), None)
+            if value is not None:
+                response[elem.get('name')] = value.text
+            # дерево не накапливается, нужны только пары data/value
+            elem.clear()
     return response
 
 
-def parse_file(path, module=None):
-    mtd_file = get_file(path)
-    if not mtd_file:
-        return None
+_json_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# текст до ближайшей скобки вне строк
+_NOT_BRACKETS = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.S)
+_SCALAR = re.compile(r'[^,}\]\s]*')
+_CLOSING = {'{': '}', '[': ']'}
+
+
+def skip_value(text: str, pos: int, indent: Optional[str] = None) -> int:
+    """
+    Позиция после значения JSON, которое начинается в pos: значение не разбирается, только скобки.
+    indent - отступ строки ключа: в форматированном JSON (содержимое с новой строки и большим отступом)
+    закрывающая скобка стоит в начале строки с тем же отступом и ищется без просмотра содержимого.
+    """
+    char = text[pos:pos + 1]
+    if char == '"':
+        match = _STRING.match(text, pos)
+        if not match:
+            raise ValueError('Unterminated string at {}'.format(pos))
+        return match.end()
+    if char not in _CLOSING:
+        return _SCALAR.match(text, pos).end()
+
+    if indent is not None:
+        start = pos + 2 if text.startswith('\r', pos + 1) else pos + 1
+        prefix = '\n' + indent
+        if text.startswith(prefix, start) and text[start + len(prefix):start + len(prefix) + 1] in (' ', '\t'):
+            end = text.find(prefix + _CLOSING[char], start)
+            if end >= 0:
+                return end + len(prefix) + 1
+
+    depth = 0
+    while True:
+        char = text[pos:pos + 1]
+        if char in ('{', '['):
+            depth += 1
+        elif char in ('}', ']'):
+            depth -= 1
+        else:
+            raise ValueError('Unexpected end of value at {}'.format(pos))
+        pos += 1
+        if not depth:
+            return pos
+        pos = _NOT_BRACKETS.match(text, pos).end()
+
+
+def scan_header(text: str, keys=HEADER_KEYS) -> Dict[str, Any]:
+    """
+    Значения ключей верхнего уровня объекта JSON без разбора всего текста: нужные значения
+    декодируются, остальные (PublicFunctions, PublicStructures и т.п.) пропускаются по скобкам.
+    Просмотр заканчивается, как только найдены все ключи.
+    """
+    response = {}
+    pos = _WHITESPACE.match(text).end()
+    if text[pos:pos + 1] != '{':
+        raise ValueError('Object expected at {}'.format(pos))
+    pos += 1
+
+    while len(response) < len(keys):
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] == '}':
+            break
+        match = _STRING.match(text, pos)
+        if not match:
+            raise ValueError('Key expected at {}'.format(pos))
+        key = json.loads(match.group())
+        indent = text[text.rfind('\n', 0, pos) + 1:pos]
+        pos = _WHITESPACE.match(text, match.end()).end()
+        if text[pos:pos + 1] != ':':
+            raise ValueError('":" expected at {}'.format(pos))
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+        if key in keys:
+            response[key], pos = _json_decoder.raw_decode(text, pos)
+        else:
+            pos = skip_value(text, pos, indent if not indent.strip(' \t') else None)
+
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] == ',':
+            pos += 1
+        elif text[pos:pos + 1] != '}':
+            raise ValueError('"," expected at {}'.format(pos))
+    return response
+
+
+def parse_header(path: str, blobs: Optional[gitrepo.Blobs] = None) -> Optional[BasicMTD]:
+    """
+    Модуль/решение только по заголовку Module.mtd (HEADER_KEYS), без .resx и остального JSON:
+    быстрый путь gen_package. Если заголовок не удалось выделить - файл разбирается целиком.
+    blobs - файл берётся из ревизии git.
+    """
+    with timings.track_file(path, 'header scan'):
+        content = blobs.read(path) if blobs is not None else read_file(path)
+        if not content:
+            return None
+
+        text = content.decode('utf-8-sig')
+        try:
+            header = scan_header(text)
+        except ValueError:
+            try:
+                header = json.loads(text)
+            except Exception as exc:
+                print(exc)
+                return None
+
+        response = build(header)
+    if response:
+        response.path = path.replace('/', '\\')
+    return response
 
-    ru_file = get_file(path.replace('.mtd', 'System.ru.resx'))
-    en_file = get_file(path.replace('.mtd', 'System.resx'))
 
-    response = dispatch(mtd_file, module, en_file, ru_file)
+def parse_file(path, module=None, cache: Optional[ParseCache] = None, index: Optional[MetadataIndex] = None,
+               resx: Optional[Tuple[str, ...]] = None, blobs: Optional[gitrepo.Blobs] = None):
+    """
+    Разбор .mtd и его .resx, resx - найденные при обходе .resx (отсутствующие не читаются).
+    blobs - файлы берутся из ревизии git, а не из рабочего дерева (см. parse_blobs).
+    """
+    files = (path, path.replace('.mtd', 'System.resx'), path.replace('.mtd', 'System.ru.resx'))
+
+    with timings.track_file(path):
+        if blobs is not None:
+            payload = parse_blobs(files, blobs, cache)
+            if payload is None:
+                return None
+        else:
+            # разобранные ранее данные берутся из кэша, если файлы не менялись
+            payload = None
+            if cache:
+                with timings.phase('cache lookup'):
+                    payload = cache.get(files)
+            if payload is None:
+                with timings.phase('file read'):
+                    contents = [read_file(x) if resx is None or i == 0 or x in resx else None
+                                for i, x in enumerate(files)]
+                payload = decode_contents(contents)
+                if payload is None:
+                    return None
+
+                if cache:
+                    cache.put(files, contents, payload)
+
+        with timings.phase('object construction'):
+            response = build(*payload, module, index)
     if response:
         response.path = path.replace('/', '\\')
         if 'VersionData' in path:
@@ -611,83 +1049,266 @@ def parse_file(path, module=None):
     return response
 
 
-def dir_walk(repo_path: str, only_module=False, repo_type='Base'):
-    result = {}
-    archive = []
+def decode_contents(contents: List[Optional[bytes]]):
+    """ Разобранные .mtd и .resx по содержимому файлов, None - если .mtd нет или он не разбирается """
+    if not contents[0]:
+        return None
+    try:
+        return decode(*[x.decode('utf-8-sig') if x else None for x in contents])
+    except Exception as exc:
+        print(exc)
+        return None
+
+
+# разобранные объекты git текущего процесса: marshal данных разбора по SHA (.mtd, .resx, .ru.resx),
+# используется без кэша разбора - одинаковые в разных ревизиях файлы разбираются один раз.
+# Размер ограничен, давно не использованные записи удаляются
+_parsed_blobs = parsecache.MemoryCache()
+
+
+def parse_blobs(files: Tuple[str, ...], blobs: gitrepo.Blobs, cache: Optional[ParseCache] = None):
+    """
+    Данные разбора (.mtd, .resx, .ru.resx) из объектов git. Ключ - SHA объектов, а не путь:
+    неизменившиеся между ревизиями файлы не читаются и не разбираются повторно.
+    """
+    shas = [blobs.sha(x) for x in files]
+    if not shas[0]:
+        return None
+    key = ' '.join(x or '' for x in shas)
+
+    with timings.phase('cache lookup'):
+        if cache:
+            payload = cache.get_blob(key)
+        else:
+            payload = _parsed_blobs.get(key)
+    if payload is not None:
+        return payload
+
+    with timings.phase('blob read'):
+        contents = [blobs.read(x) if sha else None for x, sha in zip(files, shas)]
+    payload = decode_contents(contents)
+    if payload is None:
+        return None
+
+    if cache:
+        cache.put_blob(key, payload)
+    else:
+        _parsed_blobs.put(key, payload)
+    return payload
+
+
+class ModuleJob(NamedTuple):
+    """
+    Каталог модуля/решения, найденный при обходе репозитория, resx - .resx найденных .mtd,
+    blobs - файлы модуля в ревизии git, если разбирается ревизия, а не рабочее дерево.
+    """
+    path: str
+    is_archive: bool
+    entities: List[str]
+    resx: Optional[Dict[str, Tuple[str, ...]]] = None
+    blobs: Optional[gitrepo.Blobs] = None
+
+
+def group_modules(files: Iterable[discovery.MetadataFile]):
+    """ Задания по модулям из списка .mtd: Module.mtd модуля идёт первым, за ним .mtd сущностей """
+    job = None
+    for item in files:
+        if job is None or item.module != job.path:
+            if job:
+                yield job
+            #  каталог решения / модуля
+            job = ModuleJob(item.module, 'VersionData' in item.module, [], {})
+        else:
+            job.entities.append(item.path)
+        job.resx[item.path] = item.resx
+    if job:
+        yield job
+
+
+def find_modules(repo_path: str, only_module=False, rules: discovery.Rules = discovery.Rules(),
+                 revision: Optional[str] = None):
+    """
+    Поиск каталогов с Module.mtd и .mtd файлов сущностей в их подкаталогах.
+    only_module - только Module.mtd, архив VersionData не обходится.
+    revision - ветка/коммит git: файлы берутся из ревизии (git ls-tree) без извлечения в рабочее дерево.
+    """
+    if only_module:
+        rules = rules._replace(exclude=rules.exclude + ('VersionData',))
+    if revision is None:
+        return group_modules(discovery.find(repo_path, only_module, rules))
+
+    tree = discovery.revision_files(repo_path, revision)
+    if tree is None:
+        raise ValueError('Revision {} not found in {}'.format(revision, repo_path))
+    shas = {os.path.join(repo_path, *path.split('/')): sha for path, sha in tree.items()}
+    return (job._replace(blobs=gitrepo.Blobs(repo_path, {x: shas[x] for x in chain(job.resx, *job.resx.values())}))
+            for job in group_modules(discovery.walk_paths(repo_path, tree, only_module, rules)))
+
+
+def module_job(job: ModuleJob) -> ModuleJob:
+    """ Задание модуля с заново прочитанным списком сущностей """
+    return next(group_modules(discovery.module_files(job.path)))._replace(is_archive=job.is_archive)
+
+
+def discover(repo_path: str, only_module=False, rules: discovery.Rules = discovery.Rules(),
+             revision: Optional[str] = None) -> List[ModuleJob]:
+    """ Список модулей репозитория (или его ревизии), число найденных .mtd учитывается в замерах """
+    with timings.phase('discovery') as phase:
+        jobs = list(find_modules(repo_path, only_module, rules, revision))
+        phase.count = sum(1 + len(x.entities) for x in jobs)
+    return jobs
+
+
+def parse_module(job: ModuleJob, repo_type='Base', cache: Optional[ParseCache] = None,
+                 index: Optional[MetadataIndex] = None):
+    """ Разбор Module.mtd и сущностей модуля, возвращает список объектов в порядке разбора """
+    resx = job.resx or {}
+    path = os.path.join(job.path, 'Module.mtd')
+    response = parse_file(path, 'Module.mtd', cache, index, resx.get(path), job.blobs)
+    if not response:
+        return []
 
     module = None
-    skip_path = ''
-    for path, folders, files in os.walk(repo_path):
+    if isinstance(response, Module) or isinstance(response, Solution):
+        module = response
+    else:
+        print("ERROR", job.path)
+
+    response.IsArchive = job.is_archive
+    response.repo_type = repo_type
 
-        # пропускаем уже обработанные каталоги
-        if skip_path and skip_path in path:
+    items = [response]
+    for path in job.entities:
+        response = parse_file(path, module, cache, index, resx.get(path), job.blobs)
+        if not response:
+            print('ERROR', job.path, os.path.dirname(path), os.path.basename(path))
             continue
 
-        #  каталог решения / модуля
-        is_archive = 'VersionData' in path
+        response.IsArchive = job.is_archive
+        items.append(response)
 
-        if is_archive and only_module:
-            continue
+    return items
 
-        if 'Module.mtd' in files:
-            response = parse_file(os.path.join(path, 'Module.mtd'), 'Module.mtd')
-            if not response:
-                continue
 
-            if isinstance(response, Module) or isinstance(response, Solution):
-                module = response
-            else:
-                print("ERROR", path)
+_worker_cache = None
 
-            response.IsArchive = is_archive
-            response.repo_type = repo_type
 
-            if is_archive:
+def parse_module_in_worker(job: ModuleJob, repo_type='Base', cache_file: Optional[str] = None,
+                           slowest: Optional[int] = None):
+    """
+    Разбор модуля в процессе пула, изменения кэша возвращаются основному процессу.
+    slowest - включены замеры (--timings), они тоже возвращаются основному процессу.
+    """
+    global _worker_cache
+
+    if cache_file and (not _worker_cache or _worker_cache.filename != cache_file):
+        _worker_cache = ParseCache(cache_file, readonly=True)
+    if slowest is not None:
+        timings.start(slowest)
+
+    # у каждого задания свой индекс: объекты разных заданий не ссылаются друг на друга,
+    # ссылки восстанавливаются после добавления в индекс основного процесса
+    cache = _worker_cache if cache_file else None
+    items = parse_module(job, repo_type, cache, MetadataIndex())
+    return items, cache.take_pending() if cache else [], timings.take()
+
+
+@contextmanager
+def open_cache(output_filename: str, no_cache=False, cache_size: int = parsecache.DEFAULT_MAX_SIZE_MB):
+    """ Кэш разбора рядом с выходным файлом, cache_size - ограничение размера в Мб """
+    if no_cache:
+        yield None
+        return
+
+    cache = ParseCache(parsecache.default_path(output_filename), cache_size * 1024 * 1024)
+    try:
+        yield cache
+    finally:
+        cache.close()
+        print('Parse cache: hits={}, misses={}'.format(cache.hits, cache.misses))
+
+
+def create_pool(workers: Optional[int] = None):
+    """ Пул процессов для параллельного разбора, по умолчанию - по числу процессоров """
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+def parse_jobs(jobs: List[ModuleJob], repo_type='Base', pool=None, cache: Optional[ParseCache] = None,
+               index: Optional[MetadataIndex] = None):
+    """ Разбор найденных модулей, последовательно или в пуле процессов """
+    if not pool:
+        return [parse_module(job, repo_type, cache, index) for job in jobs]
+
+    # порядок результатов совпадает с порядком заданий, как при последовательном обходе
+    active = timings.active()
+    worker = partial(parse_module_in_worker, repo_type=repo_type, cache_file=cache.filename if cache else None,
+                     slowest=active.slowest if active else None)
+    response = []
+    for items, cache_changes, worker_timings in pool.map(worker, jobs):
+        if cache_changes:
+            cache.merge(cache_changes)
+        timings.merge(worker_timings)
+        if index is not None:
+            for item in items:
+                index.add(item)
+        response.append(items)
+    return response
+
+
+def collect(jobs: List[ModuleJob], parsed: List[List[BasicMTD]], index: MetadataIndex):
+    """
+    Раскладка разобранных объектов на актуальные и архивные, подгрузка свойств коллекций.
+    Объекты уже добавлены в index.
+    """
+    result = {}
+    archive = []
+    for job, items in zip(jobs, parsed):
+        for response in items:
+            if job.is_archive:
                 archive.append(response)
             else:
+                shadowed = result.get(response.NameGuid)
+                if shadowed is not None:
+                    index.shadowed.add(id(shadowed))
                 result[response.NameGuid] = response
 
-            skip_path = path
+    with timings.phase('collection linking'):
+        link_collections(result, index)
+    return result, archive
 
-            # ускоренная пробежка
-            if only_module:
-                continue
 
-            for folder in folders:
-                subpath = os.path.join(path, folder)
-                mtds = [x for x in os.listdir(subpath) if '.mtd' in x]
-                for mtd in mtds:
-                    response = parse_file(os.path.join(subpath, mtd), module)
-                    if not response:
-                        print('ERROR', path, subpath, mtd)
-                        continue
-
-                    response.IsArchive = is_archive
-
-                    if is_archive:
-                        archive.append(response)
-                    else:
-                        result[response.NameGuid] = response
-
-    # постобработка
-    for k in result.keys():
-        item = result[k]
-        if not isinstance(item, BaseMTD):
-            continue
+COLLECTION_PROPERTY = 'Sungero.Metadata.CollectionPropertyMetadata'
 
-        # обновление родителей после полной загрузки
-        if item.Parent:
-            pass
 
-        if not isinstance(item, DataBook):
+def link_collections(result: Dict[str, BasicMTD], index: MetadataIndex):
+    """ Свойства коллекций репозитория (result) добавляются к свойствам сущностей, которые на них ссылаются """
+    # свойства коллекций могли остаться от предыдущей сборки (снимок инкрементального режима)
+    entities = [x for x in result.values() if isinstance(x, DataBook)]
+    for item in entities:
+        item.Properties = [x for x in item.Properties if x.CollectionEntity is None or x.CollectionEntity is item]
+    for item in entities:
+        for prop in item.Properties:
+            if prop.CollectionEntity is item:
+                if prop.IsReferenceToRootEntity:
+                    prop.Name = prop.JsonName
+                prop.RootEntity = item
+                prop.CollectionProperty = None
+                prop.CollectionEntity = None
+
+    # свойства-коллекции сущностей того же репозитория, ссылающиеся на коллекции
+    links = {}
+    for collection in index.by_type[Collection]:
+        if result.get(collection.NameGuid) is not collection:
             continue
-
-        # подгрузка свойств из коллекций
-        for p in [x for x in item.Properties if x.type == 'Sungero.Metadata.CollectionPropertyMetadata']:
-            collection = result.get(p.EntityGuid)
-            if not collection:
-                continue
-
+        for p in index.collection_refs.get(collection.NameGuid, ()):
+            item = p.RootEntity
+            if p.type == COLLECTION_PROPERTY and item is not None and result.get(item.NameGuid) is item:
+                links.setdefault(item, {})[id(p)] = collection
+
+    # подгрузка свойств из коллекций в порядке свойств сущности
+    for item, collections in links.items():
+        for p in [x for x in item.Properties if id(x) in collections]:
+            collection = collections[id(p)]
             for pc in collection.Properties:
                 # hack - странная отрисовка ссылки на родителя, заменил на Id, как видится в DDS
                 if pc.IsReferenceToRootEntity:
@@ -697,96 +1318,469 @@ def dir_walk(repo_path: str, only_module=False, repo_type='Base'):
                 pc.CollectionEntity = collection
                 item.Properties.append(pc)
 
-    return result, archive
 
+def dir_walk(repo_path: str, only_module=False, repo_type='Base', pool=None, cache: Optional[ParseCache] = None,
+             index: Optional[MetadataIndex] = None, rules: discovery.Rules = discovery.Rules(),
+             revision: Optional[str] = None):
+    """ Разбор репозитория, revision - ветка/коммит git, файлы читаются из хранилища объектов git """
+    if index is None:
+        index = MetadataIndex()
+    jobs = discover(repo_path, only_module, rules, revision)
+    return collect(jobs, parse_jobs(jobs, repo_type, pool, cache, index), index)
 
-def render_excel(data, archive, filename):
-    wb = xlsxwriter.Workbook(filename)
 
-    header_format = wb.add_format()
-    header_format.set_bold()
 
-    # Решения и модули
-    sheet = wb.add_worksheet("Модули_Решения")
+SNAPSHOT_VERSION = 4
+SNAPSHOT_FILENAME = '.sgmtd_model.pickle'
 
-    rows = [x for x in data if isinstance(x, (Module, Solution))]
-    render_excel_sheet(rows, sheet, header_format)
 
-    # Справочники, Документы, Задачи, Задания, Уведомления, Отчеты
-    sheet = wb.add_worksheet("Сущности")
-    rows = [x for x in data if
-            isinstance(x, (DataBook, Document, Task, Assignment, Notice, Report, Collection))]
-    render_excel_sheet(rows, sheet, header_format)
+class RepoState:
+    """ Состояние репозитория на момент анализа: коммит, найденные модули и разобранные объекты """
 
-    actions = []
-    buttons = []
-    properties = []
-    controls = []
-    for item in rows:
-        for button in item.RibbonCard:
-            buttons.append(button)
+    def __init__(self, path: str, repo_type: str, commit: Optional[str], dirty: List[str],
+                 jobs: List[ModuleJob], parsed: List[List[BasicMTD]], rules: discovery.Rules = discovery.Rules()):
+        self.path = path
+        self.type = repo_type
+        self.commit = commit
+        # изменённые и неотслеживаемые файлы, отличавшиеся от commit на момент анализа
+        self.dirty = dirty
+        self.jobs = jobs
+        self.parsed = parsed
+        # правила обхода, с которыми найдены модули
+        self.rules = rules
 
-        for acti in item.Actions:
-            actions.append(acti)
 
-        for prop in item.Properties:
-            properties.append(prop)
+def path_key(path: str) -> str:
+    """ Путь для сравнения: .path объектов хранится с обратными слешами """
+    return os.path.normcase(os.path.normpath(path.replace('\\', os.sep)))
+
+
+def _is_metadata_file(path: str) -> bool:
+    return '.mtd' in os.path.basename(path) or path.endswith('.resx')
 
-        for cont in item.Controls:
-            controls.append(cont)
 
-    sheet = wb.add_worksheet("Перекрытия")
-    render_excel_sheet_parent(rows, sheet, header_format, wb)
+def dirty_files(repo_path: str, commit: str) -> Optional[List[str]]:
+    """ .mtd/.resx рабочего дерева, отличающиеся от commit, None - если сравнение невозможно """
+    changed = gitrepo.changed_files(repo_path, commit)
+    if changed is None:
+        return None
+    return [x for x in changed + gitrepo.untracked_files(repo_path) if _is_metadata_file(x)]
+
+
+def scan_repository(repo: Dict[str, str], pool=None, cache: Optional[ParseCache] = None,
+                    index: Optional[MetadataIndex] = None, rules: discovery.Rules = discovery.Rules()) -> RepoState:
+    """ Полный разбор репозитория с запоминанием коммита для инкрементального режима """
+    path = repo.get('path')
+    commit = gitrepo.head(path)
+    dirty = (dirty_files(path, commit) or []) if commit else []
+    jobs = discover(path, rules=rules)
+    return RepoState(path, repo.get('type'), commit, dirty, jobs,
+                     parse_jobs(jobs, repo.get('type'), pool, cache, index), rules)
+
+
+def update_repository(state: RepoState, pool=None, cache: Optional[ParseCache] = None,
+                      index: Optional[MetadataIndex] = None, rules: discovery.Rules = discovery.Rules()) -> RepoState:
+    """
+    Инкрементальное обновление: по git diff от последнего проанализированного коммита
+    разбираются только изменившиеся .mtd/.resx, удалённые файлы убираются из модели.
+    Если изменился состав модулей, правила обхода или git недоступен - выполняется полный разбор.
+    """
+    repo = {'path': state.path, 'type': state.type}
+    commit = gitrepo.head(state.path)
+    dirty = dirty_files(state.path, state.commit) if commit and state.commit else None
+    if dirty is None or state.rules != rules:
+        return scan_repository(repo, pool, cache, index, rules)
+    jobs = {path_key(job.path): job_no for job_no, job in enumerate(state.jobs)}
+    reparse = set()
+    files = {}
+    # файлы, изменённые в прошлый раз, тоже проверяются: правку могли откатить
+    for path in set(dirty) | set(state.dirty):
+        for suffix in ('System.ru.resx', 'System.resx'):
+            if path.endswith(suffix):
+                path = path[:-len(suffix)] + '.mtd'
+                break
+
+        name = os.path.basename(path)
+        if name == 'Module.mtd':
+            job_no = jobs.get(path_key(os.path.dirname(path)))
+            exists = os.path.isfile(path)
+            if job_no is None and exists or job_no is not None and not exists:
+                # появился или удалён модуль
+                return scan_repository(repo, pool, cache, index, rules)
+            if job_no is not None:
+                reparse.add(job_no)
+        elif '.mtd' in name:
+            job_no = jobs.get(path_key(os.path.dirname(os.path.dirname(path))))
+            if job_no is not None:
+                files[path] = job_no
+
+    for job_no in reparse:
+        state.jobs[job_no] = job = module_job(state.jobs[job_no])
+        state.parsed[job_no] = parse_module(job, state.type, cache)
+
+    for path, job_no in files.items():
+        job = state.jobs[job_no]
+        items = state.parsed[job_no]
+        if job_no in reparse or not items:
+            continue
 
-    # Действия
-    sheet = wb.add_worksheet("Кнопки")
-    render_excel_sheet(buttons, sheet, header_format)
+        key = path_key(path)
+        position = next((i for i, x in enumerate(items) if i and path_key(x.path) == key), None)
+        job.entities[:] = [x for x in job.entities if path_key(x) != key]
+        if job.resx:
+            # набор .resx мог измениться, при следующем разборе модуля они проверяются заново
+            job.resx.pop(path, None)
+        response = None
+        if os.path.isfile(path):
+            module = items[0] if isinstance(items[0], (Module, Solution)) else None
+            response = parse_file(path, module, cache)
+            job.entities.append(path)
+
+        if response:
+            response.IsArchive = job.is_archive
+            if position is None:
+                items.append(response)
+            else:
+                items[position] = response
+        elif position is not None:
+            del items[position]
 
-    # Действия
-    sheet = wb.add_worksheet("Действия")
-    render_excel_sheet(actions, sheet, header_format)
+    print('Incremental update: {} -> {}, modules={}, files={}'.format(state.commit, commit, len(reparse), len(files)))
+    if commit != state.commit:
+        # в следующий раз сравнение идёт уже с новым коммитом
+        dirty = dirty_files(state.path, commit) or []
+    state.commit = commit
+    state.dirty = dirty
+    return state
 
-    # Свойства
-    sheet = wb.add_worksheet("Свойства")
-    render_excel_sheet(properties, sheet, header_format)
 
-    # Контролы
-    sheet = wb.add_worksheet("Контролы")
-    render_excel_sheet(controls, sheet, header_format)
+def snapshot_path(output_filename: str) -> str:
+    """ Путь к снимку состояния рядом с выходным файлом """
+    return os.path.join(os.path.dirname(os.path.abspath(output_filename)), SNAPSHOT_FILENAME)
+
+
+def load_states(filename: str) -> Dict[str, RepoState]:
+    """ Состояния репозиториев из снимка предыдущего анализа """
+    if not os.path.isfile(filename):
+        return {}
 
-    # Архив
-    sheet = wb.add_worksheet("Архив")
-    archive += [x for x in data if isinstance(x, (Module, Solution, DataBook, Document, Task, Assignment, Notice, Report)) and not isinstance(x, Collection)]
+    try:
+        with open(filename, 'rb') as fp:
+            data = pickle.load(fp)
+    except Exception as exc:
+        print('Snapshot skipped:', exc)
+        return {}
+
+    if data.get('version') != SNAPSHOT_VERSION:
+        return {}
+    return {path_key(x.path): x for x in data.get('repos', [])}
+
+
+def save_states(filename: str, states: List[RepoState]):
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as fp:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'repos': states}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
+
+
+def scan_repositories(repos: List[Dict[str, str]], only_module=False, parallel=False, workers: Optional[int] = None,
+                      cache: Optional[ParseCache] = None, snapshot: Optional[str] = None,
+                      index: Optional[MetadataIndex] = None, rules: discovery.Rules = discovery.Rules()):
+    """
+    Обход всех репозиториев, при parallel=True разбор файлов идёт в пуле процессов.
+    snapshot - файл состояния для инкрементального режима: репозитории обновляются по git diff
+    от последнего проанализированного коммита, после обхода состояние сохраняется.
+    index - индекс метаданных анализа, по умолчанию создаётся новый.
+    rules - шаблоны каталогов, которые обходятся / пропускаются при поиске модулей.
+    Ключ repo['revision'] - разбор ветки/коммита git вместо рабочего дерева (без инкрементального режима).
+    """
+    if index is None:
+        index = MetadataIndex()
+    response = []
+    archive = []
+    previous = {}
+    if snapshot and not only_module:
+        with timings.phase('snapshot load'):
+            previous = load_states(snapshot)
+    states = []
+    pool = create_pool(workers) if parallel else None
+    try:
+        for repo in repos:
+            print("Using repository: Type={}, path={}".format(repo.get('type'), repo.get('path')))
+            revision = repo.get('revision')
+            if not snapshot or only_module or revision:
+                items, arch = dir_walk(repo.get('path'), only_module, repo.get('type'), pool, cache, index, rules,
+                                       revision)
+            else:
+                state = previous.get(path_key(repo.get('path')))
+                if state and state.type == repo.get('type'):
+                    state = update_repository(state, pool, cache, index, rules)
+                else:
+                    state = scan_repository(repo, pool, cache, index, rules)
+                states.append(state)
 
-    render_excel_sheet_archive(archive, sheet, header_format)
+                # объекты из снимка ещё не добавлены в индекс
+                for parsed in state.parsed:
+                    for item in parsed:
+                        index.add(item)
+                items, arch = collect(state.jobs, state.parsed, index)
+
+            response += items.values()
+            archive += arch
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if states:
+        with timings.phase('snapshot save'):
+            save_states(snapshot, states)
+
+    with timings.phase('inheritance'):
+        index.build_inheritance()
+    with timings.phase('localisation table'):
+        index.build_locales()
+    return response, archive
+
+
+def model_classes() -> Dict[str, type]:
+    """ Классы модели по имени (для снимка модели) """
+    response = {}
+    pending = [BasicMTD]
+    while pending:
+        cls = pending.pop()
+        response[cls.__name__] = cls
+        pending.extend(cls.__subclasses__())
+    return response
+
+
+def encode_model(items: List[BasicMTD], archive: List[BasicMTD], index: MetadataIndex) -> Dict[str, Any]:
+    """
+    Связанная модель в виде данных для marshal: объекты - записи (номер раскладки, значения полей),
+    ссылки на другие объекты (модуль, сущность, свойства, коллекции) - номера записей, а не граф объектов.
+    Раскладка - класс и поля с признаком ссылки (0 - значение, 1 - объект, 2 - список объектов).
+    """
+    ids: Dict[int, int] = {}
+    objects: List[BasicMTD] = []
+
+    def ref(item: BasicMTD) -> int:
+        number = ids.get(id(item))
+        if number is None:
+            number = ids[id(item)] = len(objects)
+            objects.append(item)
+        return number
+
+    response = {'items': [ref(x) for x in items], 'archive': [ref(x) for x in archive],
+                'index': [ref(x) for x in index.entity.values()]}
+    layouts: Dict[tuple, int] = {}
+    records = []
+    # список объектов пополняется по ходу записи найденными ссылками
+    position = 0
+    while position < len(objects):
+        item = objects[position]
+        position += 1
+        fields = []
+        values = []
+        for key, value in item.__getstate__().items():
+            if isinstance(value, BasicMTD):
+                fields.append((key, 1))
+                value = ref(value)
+            elif type(value) is list and value and isinstance(value[0], BasicMTD):
+                fields.append((key, 2))
+                value = [ref(x) for x in value]
+            else:
+                fields.append((key, 0))
+                if key == 'resx' and not any(value.values()):
+                    # общий пустой словарь восстанавливается при загрузке
+                    value = None
+            values.append(value)
+        layout = (type(item).__name__, tuple(fields))
+        number = layouts.get(layout)
+        if number is None:
+            number = layouts[layout] = len(layouts)
+        records.append((number, values))
+
+    response['layouts'] = list(layouts)
+    response['records'] = records
+    return response
+
+
+def decode_model(data: Dict[str, Any]) -> Tuple[List[BasicMTD], List[BasicMTD], MetadataIndex]:
+    """ Модель из данных encode_model: объекты, ссылки между ними и индекс метаданных """
+    classes = model_classes()
+    layouts = []
+    for name, fields in data['layouts']:
+        cls = classes[name]
+        slots = set(cls._slot_names)
+        # поля в слотах устанавливаются по одному, остальные - одним обновлением __dict__
+        layouts.append((cls,
+                        [i for i, (key, _) in enumerate(fields) if key in slots],
+                        [i for i, (key, _) in enumerate(fields) if key not in slots],
+                        [key for key, _ in fields],
+                        [i for i, (_, kind) in enumerate(fields) if kind == 1],
+                        [i for i, (_, kind) in enumerate(fields) if kind == 2],
+                        next((i for i, (key, _) in enumerate(fields) if key == 'resx'), None)))
+    records = data['records']
+    objects = [layouts[number][0].__new__(layouts[number][0]) for number, _ in records]
+    for item, (number, values) in zip(objects, records):
+        _, slot_fields, dict_fields, keys, refs, ref_lists, resx = layouts[number]
+        for i in refs:
+            values[i] = objects[values[i]]
+        for i in ref_lists:
+            values[i] = [objects[x] for x in values[i]]
+        if resx is not None and values[resx] is None:
+            values[resx] = EMPTY_RESX
+        for i in slot_fields:
+            setattr(item, keys[i], values[i])
+        if dict_fields:
+            item.__dict__.update([(keys[i], values[i]) for i in dict_fields])
+
+    items = [objects[x] for x in data['items']]
+    archive = [objects[x] for x in data['archive']]
+    winners = [objects[x] for x in data['index']]
+    index = MetadataIndex()
+    for item in chain(archive, items, winners):
+        index.add(item)
+    # объекты с одинаковым Guid (архивные версии) - в индексе тот же объект, что и при разборе
+    index.entity = {x.NameGuid: x for x in winners}
+    index.build_inheritance()
+    index.build_locales()
+    return items, archive, index
+
+
+def load_or_scan(repos: List[Dict[str, str]], model_file: str, parallel=False, workers: Optional[int] = None,
+                 cache: Optional[ParseCache] = None, snapshot: Optional[str] = None,
+                 rules: discovery.Rules = discovery.Rules()):
+    """
+    Модель из двоичного снимка model_file, если отпечаток репозиториев не изменился (repos не разбираются),
+    иначе - полный обход (scan_repositories) и сохранение снимка.
+    """
+    with timings.phase('model fingerprint'):
+        key = modelstore.fingerprint(repos, rules)
+    with timings.phase('model load'):
+        data = modelstore.read(model_file, key)
+        if data is not None:
+            items, archive, _ = decode_model(data)
+    if data is not None:
+        print('Model snapshot loaded:', model_file)
+        return items, archive
+
+    index = MetadataIndex()
+    items, archive = scan_repositories(repos, parallel=parallel, workers=workers, cache=cache, snapshot=snapshot,
+                                       index=index, rules=rules)
+    with timings.phase('model save'):
+        modelstore.write(model_file, key, encode_model(items, archive, index))
+    return items, archive
+
+
+def with_revision(repos: List[Dict[str, str]], revision: str, repo_type='Work') -> List[Dict[str, str]]:
+    """ Репозитории с разбором ревизии revision для репозиториев типа repo_type (слой разработки) """
+    return [dict(x, revision=revision) if x.get('type') == repo_type else x for x in repos]
+
+
+# листы, строки которых всегда пишутся в таблицу общих строк Excel: Guid и пути сущностей повторяются
+# на следующих листах (Перекрытия, Архив), в ячейках они хранились бы дважды
+SHARED_STRING_SHEETS = ('Сущности',)
+
+
+def report_sheets(data, archive) -> List[Tuple[str, Iterable[List[Any]], bool]]:
+    """
+    Листы отчёта: (имя, строки, перенос текста в ячейках). Первая строка - заголовок, строки
+    создаются по мере чтения - общие для Excel и других форматов выгрузки.
+    Объекты берутся из индекса анализа data (model_index) в порядке разбора.
+    """
+    index = model_index(data)
+    # решения, модули и сущности
+    actual = index.actual(BaseMTD)
+    modules = [x for x in actual if isinstance(x, (Module, Solution))]
+    # Справочники, Документы, Задачи, Задания, Уведомления, Отчеты, коллекции - по модулям
+    entities = [x for guid in dict.fromkeys(m.NameGuid for m in modules) for x in index.module_entities(guid)]
+    return [
+        # Решения и модули
+        ("Модули_Решения", excel_rows(modules), False),
+        ("Сущности", excel_rows(entities), False),
+        ("Перекрытия", parent_rows(entities), True),
+        ("Кнопки", excel_rows(x for item in entities for x in item.RibbonCard), False),
+        ("Действия", excel_rows(x for item in entities for x in item.Actions), False),
+        ("Свойства", excel_rows(x for item in entities for x in item.Properties), False),
+        ("Контролы", excel_rows(x for item in entities for x in item.Controls), False),
+        # Архив
+        ("Архив", archive_rows(chain(archive, (x for x in actual if not isinstance(x, Collection)))), False),
+    ]
+
+
+def render_excel(data, archive, filename, streaming=False, compression: Optional[int] = None, deflate_threads=0,
+                 compat=False):
+    """
+    Сохранение метаданных в Excel. streaming=True - потоковая запись с постоянным расходом памяти:
+    строки пишутся сразу в файлы листов (constant_memory).
+    Ширина столбцов считается листом по ходу записи (track_widths), autofit не перебирает ячейки.
+    Части книги пишутся сразу в zip без временных файлов (stream_zip).
+    Столбцы с почти уникальными значениями (Guid, пути) определяются по первым строкам (string_mode auto)
+    и пишутся в ячейки листа без таблицы общих строк, кроме листов SHARED_STRING_SHEETS.
+    compat=True - запись как в исходном xlsxwriter: части через временные файлы, autofit по ячейкам,
+    все строки в таблице общих строк.
+    compression - уровень сжатия zip (0 - без сжатия, 1..9, None - по умолчанию zlib),
+    deflate_threads - сжатие частей книги блоками в N потоках одновременно с формированием XML.
+    """
+    options = {'constant_memory': streaming, 'compression_level': compression, 'deflate_threads': deflate_threads}
+    if not compat:
+        options.update(track_widths=True, stream_zip=True, string_mode='auto')
+    wb = xlsxwriter.Workbook(filename, options)
+
+    header_format = wb.add_format()
+    header_format.set_bold()
+    wrap_format = None
+
+    for name, rows, wrap in report_sheets(data, archive):
+        sheet = wb.add_worksheet(name)
+        if name in SHARED_STRING_SHEETS:
+            sheet.set_string_mode('shared')
+        if wrap and wrap_format is None:
+            wrap_format = wb.add_format({'text_wrap': True})
+        render_excel_rows(rows, sheet, header_format, wrap_format if wrap else None)
 
     wb.close()
+    timings.add('xlsx shared strings/xml', wb.store_times.get('xml', 0))
+    timings.add('xlsx zip', wb.store_times.get('zip', 0))
 
 
-def render_excel_sheet(rows: List[BasicMTD], sheet, header_format):
+def render_excel_rows(rows: Iterable[List[Any]], sheet, header_format, cell_format=None):
+    """
+    Запись заголовка и строк листа, автофильтр и ширина столбцов.
+    Строки пишутся одним блоком (write_rows): значения - текст, без проверок на формулы, ссылки и числа.
+    """
     len_headers = 0
-    for row_num, r in enumerate(rows):
-        if row_num == 0:
-            len_headers = len(r.ExcelHeaders())
-            sheet.write_row(0, 0, r.ExcelHeaders(), header_format)
+    row_num = 0
+    with timings.phase('sheet ' + sheet.name) as phase:
+        rows = iter(rows)
+        headers = next(rows, None)
+        if headers is not None:
+            len_headers = len(headers)
+            sheet.write_row(0, 0, headers, header_format)
+            sheet.write_rows(1, 0, rows, cell_format, column_types='string')
+            row_num = sheet.dim_rowmax
+
+        if row_num and len_headers:
+            sheet.autofilter(0, 0, row_num, len_headers - 1)
+            sheet.autofit()
+        phase.count = row_num
 
-        sheet.write_row(row_num + 1, 0, r.ExcelData())
 
-    if rows and len_headers:
-        sheet.autofilter(0, 0, len(rows), len_headers - 1)
-        sheet.autofit()
+def excel_rows(rows: Iterable[BasicMTD]) -> Iterator[List[Any]]:
+    """ Заголовок по первому объекту и строки ExcelData """
+    for row_num, r in enumerate(rows):
+        if row_num == 0:
+            yield r.ExcelHeaders()
+        yield r.ExcelData()
 
 
-def render_excel_sheet_archive(rows: List[BaseMTD], sheet, header_format):
-    len_headers = 0
-    headers = ['Type', 'Version', 'Name', 'FullName', 'Guid', 'ParentGuid', 'Path']
+def archive_rows(rows: Iterable[BaseMTD]) -> Iterator[List[Any]]:
     for row_num, r in enumerate(rows):
         if row_num == 0:
-            len_headers = len(headers)
-            sheet.write_row(0, 0, headers, header_format)
+            yield ['Type', 'Version', 'Name', 'FullName', 'Guid', 'ParentGuid', 'Path']
 
         if isinstance(r, (Module, LayerModule)):
-            row = [
+            yield [
                 r.type,
                 r.Version,
                 r.Name,
@@ -796,7 +1790,7 @@ def render_excel_sheet_archive(rows: List[BaseMTD], sheet, header_format):
                 r.path
             ]
         else:
-            row = [
+            yield [
                 r.type,
                 r.Module.Version if r.Module else '---',
                 r.Name,
@@ -805,14 +1799,17 @@ def render_excel_sheet_archive(rows: List[BaseMTD], sheet, header_format):
                 r.Parent.NameGuid if r.Parent else '---',
                 r.path
             ]
-        sheet.write_row(row_num + 1, 0, row)
 
-    if rows and len_headers:
-        sheet.autofilter(0, 0, len(rows), len_headers - 1)
-        sheet.autofit()
 
+# число столбцов родителей листа Перекрытия
+PARENT_COLUMNS = 10
 
-def render_excel_sheet_parent(rows: List[BaseMTD], sheet, header_format, workbook):
+
+def parent_rows(rows: Iterable[BaseMTD]) -> Iterator[List[Any]]:
+    """
+    Цепочки перекрытий сущностей. Строки одной ширины с заголовком: родители после PARENT_COLUMNS - 1
+    пишутся в последний столбец родителей, чтобы Path не сдвигался и выгрузки JSONL/CSV совпадали.
+    """
     def get_uri(item: DataBook):
         parts = []
         if item.Module:
@@ -824,48 +1821,182 @@ def render_excel_sheet_parent(rows: List[BaseMTD], sheet, header_format, workboo
         uri = ".".join(parts)
         return "{}\n{}".format(uri, item.NameGuid)
 
-    wrap_format = workbook.add_format({'text_wrap': True})
+    headers = ['Version', 'Модуль', 'Имя', 'Уровней', 'Сущность']
+    headers.extend('<- Родитель {}'.format(i) for i in range(1, PARENT_COLUMNS + 1))
+    headers.append('Path')
 
-    len_headers = 0
-    headers = ['Version', 'Модуль', 'Имя', 'Уровней', 'Сущность', '<- Родитель 1', '<- Родитель 2',
-               '<- Родитель 3', '<- Родитель 4', '<- Родитель 5', '<- Родитель 6',
-               '<- Родитель 7', '<- Родитель 8', '<- Родитель 9', '<- Родитель 10', 'Path']
-
-    for row_num, r in enumerate([x for x in rows if isinstance(x, DataBook) and not isinstance(x, Collection)]):
+    for row_num, r in enumerate(x for x in rows if isinstance(x, DataBook) and not isinstance(x, Collection)):
         if row_num == 0:
-            len_headers = len(headers)
-            sheet.write_row(0, 0, headers, header_format)
+            yield headers
 
+        ancestors = r.Ancestors
         row = [r.Module.Version if r.Module else '---',
                r.Module.Name if r.Module else '---',
-               r.Name, 0, get_uri(r)]
-
-        parent = r.Parent
-        levels = 0
-        while parent:
-            row.append(get_uri(parent))
-            if not parent.Parent:
-                row.append(parent.BaseGuid)
-            parent = parent.Parent
-            levels += 1
-
-        row[3] = levels
-        for i in range(len(headers)-len(row)-1):
-            row.append('...')
+               r.Name, len(ancestors), get_uri(r)]
+
+        parents = [get_uri(x) for x in ancestors]
+        if ancestors and not ancestors[-1].Parent:
+            parents.append(ancestors[-1].BaseGuid)
+        if len(parents) > PARENT_COLUMNS:
+            parents[PARENT_COLUMNS - 1:] = ['\n<- '.join(parents[PARENT_COLUMNS - 1:])]
+
+        row.extend(parents)
+        row.extend('...' for _ in range(PARENT_COLUMNS - len(parents)))
         row.append(r.path)
-        sheet.write_row(row_num + 1, 0, row, wrap_format)
+        yield row
+
 
-    if rows and len_headers:
-        sheet.autofilter(0, 0, len(rows), len_headers - 1)
-        sheet.autofit()
+def render_excel_sheet(rows: Iterable[BasicMTD], sheet, header_format):
+    render_excel_rows(excel_rows(rows), sheet, header_format)
 
 
-def gen_package(filename, repos):
-    modules = []
+def render_excel_sheet_archive(rows: Iterable[BaseMTD], sheet, header_format):
+    render_excel_rows(archive_rows(rows), sheet, header_format)
+
+
+def render_excel_sheet_parent(rows: Iterable[BaseMTD], sheet, header_format, workbook):
+    wrap_format = workbook.add_format({'text_wrap': True})
+    render_excel_rows(parent_rows(rows), sheet, header_format, wrap_format)
+
+
+def scan_headers(repos: List[Dict[str, str]], rules: discovery.Rules = discovery.Rules()) -> List[BasicMTD]:
+    """ Модули и решения репозиториев по заголовкам Module.mtd (см. parse_header) """
+    response = []
     for repo in repos:
-        items, archive = dir_walk(repo['path'], True, repo['type'])
-        modules += [x for x in items.values() if isinstance(x, (Solution, Module))]
+        print("Using repository: Type={}, path={}".format(repo.get('type'), repo.get('path')))
+        # как и при полном разборе, из модулей с одинаковым NameGuid остаётся последний
+        items = {}
+        for job in discover(repo.get('path'), True, rules, repo.get('revision')):
+            item = parse_header(os.path.join(job.path, 'Module.mtd'), job.blobs)
+            if not item:
+                continue
+            item.repo_type = repo.get('type')
+            items[item.NameGuid] = item
+        response += items.values()
+    return response
+
+
+def gen_package(filename, repos, parallel=False, workers=None, cache: Optional[ParseCache] = None, full=False,
+                rules: discovery.Rules = discovery.Rules(), model: Optional[str] = None):
+    """
+    Создание package.xml. По умолчанию из Module.mtd читаются только нужные ключи (scan_headers),
+    full=True - полный разбор модулей, parallel/workers/cache используются только в этом режиме.
+    model - двоичный снимок модели (load_or_scan): модули берутся из него, если репозитории не изменились.
+    """
+    if model:
+        items, archive = load_or_scan(repos, model, parallel, workers, cache, rules=rules)
+    elif full:
+        items, archive = scan_repositories(repos, True, parallel, workers, cache, rules=rules)
+    else:
+        items = scan_headers(repos, rules)
+    save_package(filename, items)
+    print('Saved to', filename)
+
+
+def save_package(filename, items: List[BasicMTD]):
+    """ package.xml по модулям и решениям модели """
+    modules = [x for x in items if isinstance(x, (Solution, Module))]
+    with timings.phase('package xml', len(modules)):
+        write_package(filename, modules)
+
+
+def save_jsonl(filename, data, archive):
+    """ Строки листов отчёта в JSON Lines (.gz - со сжатием) """
+    with timings.phase('jsonl') as phase:
+        phase.count = writers.write_jsonl(filename, ((name, rows) for name, rows, _ in report_sheets(data, archive)))
+
+
+def save_csv(filename, data, archive):
+    """ Строки листов отчёта в CSV, по файлу на лист (.gz - со сжатием) """
+    with timings.phase('csv') as phase:
+        phase.count = writers.write_csv(filename, ((name, rows) for name, rows, _ in report_sheets(data, archive)))
+
+
+def _guid(item) -> Optional[str]:
+    return item.NameGuid if item else None
+
+
+def sqlite_records(data) -> Iterator[sqlexport.Record]:
+    """ Решения, модули и сущности со свойствами (включая свойства коллекций), контролами, действиями и кнопками """
+    for x in model_index(data).actual(BaseMTD):
+        if isinstance(x, (Module, Solution)):
+            module = isinstance(x, Module)
+            yield sqlexport.Record('modules', (
+                x.NameGuid, x.MtdType, x.Name, x.CompanyCode, x.Version, x.SolutionGuid or None if module else None,
+                x.BaseGuid or None, x.Locale('en'), x.Locale('ru'), x.path))
+        elif isinstance(x, DataBook):
+            parent = x.Parent
+            sql_table = x.SQLTable()
+            properties = []
+            for p in x.Properties:
+                collection = p.CollectionEntity
+                properties.append((
+                    p.NameGuid, p.type, p.Name, p.FullName, p.Code or None,
+                    collection.SQLTable() if collection else sql_table, p.SQLColumn(), _guid(collection),
+                    p.Locale('en'), p.Locale('ru'), collection.path if collection and collection.path else x.path))
+            yield sqlexport.Record('entities', (
+                x.NameGuid, x.MtdType, x.Module.CompanyCode, x.Module.NameGuid, x.Module.Name, x.Name,
+                x.Locale('en'), x.Locale('ru'), sql_table, x.BaseGuid or None, parent.Name if parent else None, x.path), {
+                'properties': properties,
+                'controls': [(c.NameGuid, c.type, c.Name, c.PropertyGuid or None, c.ParentGuid or None)
+                             for c in x.Controls],
+                'actions': [(a.NameGuid, a.type, a.Name) for a in x.Actions],
+                'ribbon': [(r.NameGuid, r.type, r.Name, r.ActionGuid, r.Action.Name if r.Action else None)
+                           for r in x.RibbonCard],
+            })
+
+
+def save_sqlite(filename, data, archive, upsert=False):
+    """ Модель в базу SQLite (sqlexport), upsert - обновление только изменившихся объектов существующей базы """
+    rows = archive_rows(chain(archive, (x for x in model_index(data).actual(BaseMTD) if not isinstance(x, Collection))))
+    # заголовок листа пропускается, "---" листа Excel - NULL
+    archive_data = ([None if v == '---' else v for v in row] for row in islice(rows, 1, None))
+    with timings.phase('sqlite') as phase:
+        stats = sqlexport.write(filename, sqlite_records(data), archive_data, upsert)
+        phase.count = stats.rows
+    print('SQLite: added {}, updated {}, removed {}, unchanged {}, rows {}'.format(*stats))
+
+
+# виды выгрузки команды export
+EXPORT_FORMATS = ('xlsx', 'package', 'jsonl', 'csv', 'sqlite')
+
+
+def export(outputs: Dict[str, str], data, archive, streaming=False, upsert=False, compression: Optional[int] = None,
+           deflate_threads=0, xlsx_compat=False):
+    """
+    Выгрузка одной модели в несколько файлов за один обход репозиториев, outputs - вид выгрузки
+    (EXPORT_FORMATS) -> имя файла, upsert - обновление существующей базы SQLite,
+    compression/deflate_threads/xlsx_compat - параметры Excel (render_excel). Выгрузки выполняются
+    одновременно в потоках: пока одна строит строки, другие сжимают zip и пишут файлы
+    (zlib, sqlite и запись на диск не держат GIL).
+    """
+    tasks = []
+    if outputs.get('xlsx'):
+        tasks.append((outputs['xlsx'], partial(render_excel, data, archive, outputs['xlsx'], streaming, compression,
+                                                    deflate_threads, xlsx_compat)))
+    if outputs.get('package'):
+        tasks.append((outputs['package'], partial(save_package, outputs['package'], data)))
+    if outputs.get('jsonl'):
+        tasks.append((outputs['jsonl'], partial(save_jsonl, outputs['jsonl'], data, archive)))
+    if outputs.get('csv'):
+        tasks.append((outputs['csv'], partial(save_csv, outputs['csv'], data, archive)))
+    if outputs.get('sqlite'):
+        tasks.append((outputs['sqlite'], partial(save_sqlite, outputs['sqlite'], data, archive, upsert)))
+
+    if len(tasks) < 2:
+        for filename, task in tasks:
+            task()
+            print('Saved to', filename)
+        return
 
+    with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+        futures = [(filename, pool.submit(task)) for filename, task in tasks]
+        for filename, future in futures:
+            future.result()
+            print('Saved to', filename)
+
+
+def write_package(filename, modules: List[BaseMTD]):
     root = ET.Element('DevelopmentPackageInfo', attrib={'xmlns:xsd': "http://www.w3.org/2001/XMLSchema", 'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance"})
     genXlmElement(root, 'IsDebugPackage', 'true')
     package_modules = ET.SubElement(root, 'PackageModules')
@@ -894,9 +2025,71 @@ def gen_package(filename, repos):
         fp.write('<?xml version="1.0"?>\n')
         fp.write(ET.tostring(root, encoding='unicode', method='xml'))
 
+
+def load_snapshot(filename: str) -> List[BasicMTD]:
+    """ Модель из снимка инкрементального режима (.sgmtd_model.pickle) со своим индексом """
+    states = list(load_states(filename).values())
+    if not states:
+        raise ValueError('Snapshot not found or outdated: ' + filename)
+    index = MetadataIndex()
+    response = []
+    for state in states:
+        for parsed in state.parsed:
+            for item in parsed:
+                index.add(item)
+        response += collect(state.jobs, state.parsed, index)[0].values()
+    index.build_inheritance()
+    return response
+
+
+def load_model(repos: List[Dict[str, str]], revision: Optional[str] = None, snapshot: Optional[str] = None,
+               parallel=False, workers: Optional[int] = None, cache: Optional[ParseCache] = None,
+               rules: discovery.Rules = discovery.Rules()) -> List[BasicMTD]:
+    """ Модель для сравнения: из снимка, из ревизии git репозиториев Work или из рабочего дерева """
+    if snapshot:
+        return load_snapshot(snapshot)
+    if revision:
+        repos = with_revision(repos, revision)
+    return scan_repositories(repos, parallel=parallel, workers=workers, cache=cache, rules=rules)[0]
+
+
+def diff_models(old_items: List[BasicMTD], new_items: List[BasicMTD]) -> modeldiff.ModelDiff:
+    with timings.phase('model diff', len(new_items)):
+        response = modeldiff.compare(old_items, new_items)
+    print('Changes: {}, unchanged: {}'.format(len(response.changes), response.unchanged))
+    return response
+
+
+def save_diff(filename: str, diff: modeldiff.ModelDiff):
+    """ Сохранение изменений: .json - JSON, иначе - Excel """
+    if filename.lower().endswith('.json'):
+        modeldiff.write_json(filename, diff)
+    else:
+        render_diff_excel(diff, filename)
     print('Saved to', filename)
 
 
+def render_diff_excel(diff: modeldiff.ModelDiff, filename: str):
+    """ Excel с изменениями: лист итогов по видам объектов и лист изменений """
+    wb = xlsxwriter.Workbook(filename, {'track_widths': True})
+    header_format = wb.add_format()
+    header_format.set_bold()
+
+    summary = diff.summary()
+    rows = [['Объект'] + list(modeldiff.CHANGES)]
+    rows += [[kind] + [counts.get(x, 0) for x in modeldiff.CHANGES] for kind, counts in summary.items()]
+    rows.append(['unchanged', diff.unchanged])
+    render_excel_rows(rows, wb.add_worksheet('Итоги'), header_format)
+
+    def get_rows():
+        yield ['Объект', 'Изменение', 'Guid', 'Название', 'Сущность', 'Было', 'Стало', 'Путь']
+        for x in diff.changes:
+            yield [x.kind, x.change, x.guid, x.name, x.entity, modeldiff.format_value(x.old),
+                   modeldiff.format_value(x.new), x.path]
+
+    render_excel_rows(get_rows(), wb.add_worksheet('Изменения'), header_format)
+    wb.close()
+
 
 def genXlmElement(parent, name, text):
     """ Синтаксический сахар - создание элемента сразу с текстом """
@@ -913,33 +2106,159 @@ python mtd.py gen_package package.xml Base=c:\GIT\Base "Base=c:\Git\Space Path"
 2. Сгенерировать Excel файл с метаданными разработки:
 python mtd.py save_mtd_info filename.xlsx Base=c:\GIT\Base "Base=c:\Git\Space Path" Work=C:\Git\Work
 
+3. Выгрузить за один обход Excel, package.xml, JSON Lines, CSV (любой набор, .gz - со сжатием) и базу SQLite:
+python mtd.py export --xlsx=report.xlsx --package=package.xml --jsonl=model.jsonl.gz --csv=model.csv --sqlite=model.db Base=c:\GIT\Base Work=C:\Git\Work
+
+4. Сравнить ветки (изменения сущностей, свойств, контролов, действий и кнопок) в Excel или JSON:
+python mtd.py diff diff.xlsx Base=c:\GIT\Base Work=C:\Git\Work --old=master --new=feature
+
 Формат опиcания репозиториев - Base|Work - тип, после знака "=" полный путь до каталога репозитория,
 если путь включает пробелы, то весь параметр заключается в кавычки.
 
+Параметры:
+--parallel - разбор файлов в несколько процессов, по числу процессоров
+--workers=N - разбор файлов в N процессов
+--no-cache - не использовать кэш разбора (.sgmtd_cache.sqlite рядом с выходным файлом)
+--streaming - потоковая запись Excel с постоянным расходом памяти
+--compression=N - уровень сжатия Excel: 0 - без сжатия, 1 - быстрее, 9 - меньше размер (по умолчанию 6)
+--deflate-threads=N - сжатие частей Excel в N потоков одновременно с формированием XML
+--xlsx-compat - запись Excel как в исходном xlsxwriter: временные файлы частей, autofit по ячейкам, только общие строки
+--upsert - export: обновить существующую базу --sqlite, перезаписываются только изменившиеся объекты
+--full - gen_package: полный разбор Module.mtd вместо чтения только нужных ключей
+--include=шаблон,... - искать модули только в каталогах, относительный путь которых подходит под шаблон (glob)
+--exclude=шаблон,... - не обходить каталоги по имени или относительному пути, дополнительно к .git, .vs, bin, obj, packages, node_modules
+--revision=ветка|коммит - разбирать репозитории Work в ревизии git без извлечения (git cat-file), а не рабочее дерево
+--old=ветка|коммит, --new=ветка|коммит - diff: сравниваемые ревизии репозиториев Work, по умолчанию HEAD и рабочее дерево
+--old-snapshot=файл, --new-snapshot=файл - diff: модель из снимка .sgmtd_model.pickle вместо разбора
+--model=файл - двоичный снимок связанной модели: если репозитории не изменились, модель загружается из него без разбора,
+    иначе после разбора снимок сохраняется (save_mtd_info, gen_package)
+--git-index - брать список файлов из индекса git (git ls-files) вместо обхода каталогов, для каталогов вне git - обход
+--incremental - разбирать только файлы, изменившиеся в git с прошлого запуска (.sgmtd_model.pickle рядом с выходным файлом)
+--timings - время и число элементов по этапам: поиск файлов, чтение, JSON, .resx, создание объектов, коллекции, листы Excel, XML, zip
+--slowest=N - N самых долгих по разбору файлов (включает --timings)
+--profile[=файл] - профилирование cProfile основного процесса: вывод на экран или сохранение статистики в файл
+--profile-memory - tracemalloc: пиковый объём и места наибольшего выделения памяти
+
 Для генерации Excel файла может дополнительно потребоваться установить xlsxwriter:
 pip3 install xlsxwriter""")
         return
 
     action = sys.argv[1]
-    filename = sys.argv[2]
+    # у export выходные файлы задаются параметрами --xlsx/--package/--jsonl/--csv/--sqlite
+    first = 2 if action == 'export' else 3
+    filename = sys.argv[2] if action != 'export' else None
+    outputs = {}
     repo_list = []
-    for i in range(2, len(sys.argv)):
+    parallel = False
+    workers = None
+    no_cache = False
+    incremental = False
+    streaming = False
+    upsert = False
+    compression = None
+    deflate_threads = 0
+    xlsx_compat = False
+    full = False
+    timed = False
+    slowest = 0
+    profile = None
+    profile_memory = False
+    include = []
+    exclude = []
+    git_index = False
+    revision = None
+    model = None
+    # по умолчанию сравнивается последний коммит с рабочим деревом
+    old_revision = 'HEAD'
+    new_revision = old_snapshot = new_snapshot = None
+    for i in range(first, len(sys.argv)):
         repo = sys.argv[i]
-        if ('Base=' in repo or 'Work=' in repo) and len(repo) > 5:
-            print("Using repository: Type={}, path={}".format(repo.get('type'),repo.get('path')))
+        name, _, value = repo[2:].partition('=')
+        if repo.startswith('--') and name in EXPORT_FORMATS and value:
+            outputs[name] = value
+        elif repo == '--parallel':
+            parallel = True
+        elif repo == '--timings':
+            timed = True
+        elif repo.startswith('--slowest='):
+            slowest = int(repo[len('--slowest='):])
+        elif repo == '--profile':
+            profile = ''
+        elif repo.startswith('--profile='):
+            profile = repo[len('--profile='):]
+        elif repo == '--profile-memory':
+            profile_memory = True
+        elif repo == '--streaming':
+            streaming = True
+        elif repo == '--upsert':
+            upsert = True
+        elif repo.startswith('--compression='):
+            compression = int(repo[len('--compression='):])
+        elif repo.startswith('--deflate-threads='):
+            deflate_threads = int(repo[len('--deflate-threads='):])
+        elif repo == '--xlsx-compat':
+            xlsx_compat = True
+        elif repo == '--full':
+            full = True
+        elif repo == '--git-index':
+            git_index = True
+        elif repo.startswith('--revision='):
+            revision = repo[len('--revision='):]
+        elif repo.startswith('--model='):
+            model = repo[len('--model='):]
+        elif repo.startswith('--old='):
+            old_revision = repo[len('--old='):]
+        elif repo.startswith('--new='):
+            new_revision = repo[len('--new='):]
+        elif repo.startswith('--old-snapshot='):
+            old_snapshot = repo[len('--old-snapshot='):]
+        elif repo.startswith('--new-snapshot='):
+            new_snapshot = repo[len('--new-snapshot='):]
+        elif repo.startswith('--include='):
+            include.append(repo[len('--include='):])
+        elif repo.startswith('--exclude='):
+            exclude.append(repo[len('--exclude='):])
+        elif repo == '--incremental':
+            incremental = True
+        elif repo == '--no-cache':
+            no_cache = True
+        elif repo.startswith('--workers='):
+            parallel = True
+            workers = int(repo[len('--workers='):])
+        elif ('Base=' in repo or 'Work=' in repo) and len(repo) > 5:
             repo_list.append({'type': repo[:4], 'path': repo[5:]})
 
-    if action == 'gen_package':
-        gen_package(filename, repo_list)
+    if action == 'export':
+        if not outputs:
+            print('Не указаны выходные файлы: --xlsx, --package, --jsonl, --csv, --sqlite')
+            return
+        # кэш разбора и снимки - рядом с первым выходным файлом
+        filename = next(iter(outputs.values()))
+    rules = discovery.make_rules(','.join(include), ','.join(exclude), git_index)
+    if revision:
+        repo_list = with_revision(repo_list, revision)
+    # быстрому gen_package кэш разбора не нужен
+    no_cache = no_cache or action == 'gen_package' and not full and not model
+    with timings.session(timed, slowest, profile, profile_memory), open_cache(filename, no_cache) as cache:
+        if action == 'gen_package':
+            gen_package(filename, repo_list, parallel, workers, cache, full, rules, model)
+
+        if action in ('save_mtd_info', 'export'):
+            snapshot = snapshot_path(filename) if incremental else None
+            if model:
+                response, archive = load_or_scan(repo_list, model, parallel, workers, cache, snapshot, rules)
+            else:
+                response, archive = scan_repositories(repo_list, parallel=parallel, workers=workers, cache=cache,
+                                                      snapshot=snapshot, rules=rules)
+            if action == 'export':
+                export(outputs, response, archive, streaming, upsert, compression, deflate_threads, xlsx_compat)
+            else:
+                render_excel(response, archive, filename, streaming, compression, deflate_threads, xlsx_compat)
 
-    if action == 'save_mtd_info':
-        response = []
-        archive = []
-        for repo in repo_list:
-            items, arch = dir_walk(repo.get('path'))
-            response += items.values()
-            archive += arch
-        render_excel(response, archive, filename)
+        if action == 'diff':
+            old = load_model(repo_list, old_revision, old_snapshot, parallel, workers, cache, rules)
+            new = load_model(repo_list, new_revision, new_snapshot, parallel, workers, cache, rules)
+            save_diff(filename, diff_models(old, new))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+# coding: utf-8
+""" Дисковый кэш результатов разбора .mtd/.resx файлов. """
+import hashlib
+import marshal
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+
+# при изменении формата или логики разбора кэш пересоздаётся
+CACHE_VERSION = '1'
+CACHE_FILENAME = '.sgmtd_cache.sqlite'
+DEFAULT_MAX_SIZE_MB = 512
+# записи объектов git хранятся в той же таблице, ключ - SHA объектов вместо пути
+BLOB_PREFIX = 'git:'
+# данные разбора объектов git в памяти процесса, когда дискового кэша нет
+DEFAULT_MEMORY_SIZE_MB = 64
+
+
+def default_path(output_filename: str) -> str:
+    """ Путь к кэшу рядом с выходным файлом """
+    return os.path.join(os.path.dirname(os.path.abspath(output_filename)), CACHE_FILENAME)
+
+
+def file_stat(path: str) -> Optional[Tuple[int, int]]:
+    """ (mtime, size) файла или None, если файла нет """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def digest(content: Optional[bytes]) -> str:
+    """ Хэш содержимого файла, для отсутствующего файла - пустая строка """
+    if content is None:
+        return ''
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class ParseCache:
+    """
+    Кэш результатов разбора: по пути .mtd хранится разобранный JSON и словари
+    System.resx / System.ru.resx вместе с (mtime, size, хэш) всех трёх файлов.
+    Файлы ревизий git хранятся по SHA объектов (get_blob/put_blob).
+
+    Если mtime/size совпадают - данные берутся из кэша без чтения файлов, если нет -
+    сравниваются хэши содержимого (файл могли "потрогать" при переключении ветки).
+    Размер кэша ограничен, при превышении удаляются давно не использованные записи.
+
+    В режиме readonly (процессы пула) изменения не пишутся в базу, а накапливаются
+    в pending и переносятся в основной процесс через merge().
+    """
+
+    def __init__(self, filename: str, max_size: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024, readonly=False):
+        self.filename = filename
+        self.max_size = max_size
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        self.pending = []
+        if readonly:
+            self._db = sqlite3.connect('file:{}?mode=ro'.format(filename), uri=True)
+        else:
+            self._db = sqlite3.connect(filename)
+            self._prepare()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _prepare(self):
+        # WAL - чтение из процессов пула не блокируется записью основного процесса
+        self._db.execute('PRAGMA journal_mode=WAL')
+        version = '{}:{}'.format(CACHE_VERSION, sys.version_info[:2])
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != version:
+            # marshal зависит от версии Python, старые записи не читаем
+            self._db.execute('DROP TABLE IF EXISTS files')
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+        self._db.execute('''CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY,
+                                stat TEXT NOT NULL,
+                                mtd_hash TEXT NOT NULL,
+                                en_hash TEXT NOT NULL,
+                                ru_hash TEXT NOT NULL,
+                                payload BLOB NOT NULL,
+                                size INTEGER NOT NULL,
+                                used REAL NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_used ON files (used)')
+        self._db.commit()
+
+    @staticmethod
+    def _stat_key(files: Sequence[str]) -> str:
+        return repr([file_stat(x) for x in files])
+
+    def get(self, files: Sequence[str]) -> Optional[Any]:
+        """ Данные разбора для (mtd, resx, ru.resx) или None, если их нужно разобрать заново """
+        row = self._db.execute('SELECT stat, mtd_hash, en_hash, ru_hash, payload FROM files WHERE path = ?',
+                               (files[0],)).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+
+        stat, hashes, payload = row[0], row[1:4], row[4]
+        now = time.time()
+        new_stat = self._stat_key(files)
+        if new_stat == stat:
+            self._write('touch', (now, files[0]))
+        else:
+            contents = [_read(x) for x in files]
+            if tuple(digest(x) for x in contents) != tuple(hashes):
+                self.misses += 1
+                return None
+            self._write('row', (files[0], new_stat) + tuple(hashes) + (payload, len(payload), now))
+
+        self.hits += 1
+        return marshal.loads(payload)
+
+    def put(self, files: Sequence[str], contents: Sequence[Optional[bytes]], payload: Any):
+        """ Сохранить данные разбора, contents - прочитанное содержимое files """
+        data = marshal.dumps(payload)
+        self._write('row', (files[0], self._stat_key(files)) + tuple(digest(x) for x in contents) +
+                    (data, len(data), time.time()))
+
+    def get_blob(self, key: str) -> Optional[Any]:
+        """ Данные разбора объектов git, key - SHA объектов (.mtd, .resx, .ru.resx): содержимое не меняется """
+        row = self._db.execute('SELECT payload FROM files WHERE path = ?', (BLOB_PREFIX + key,)).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+        self._write('touch', (time.time(), BLOB_PREFIX + key))
+        self.hits += 1
+        return marshal.loads(row[0])
+
+    def put_blob(self, key: str, payload: Any):
+        data = marshal.dumps(payload)
+        self._write('row', (BLOB_PREFIX + key, '') + tuple(key.split(' ')) + (data, len(data), time.time()))
+
+    def invalidate(self, path: Optional[str] = None):
+        """ Удалить запись для path или очистить кэш целиком """
+        if path:
+            self._write('delete', (path,))
+        else:
+            self._write('clear', ())
+
+    def _write(self, kind: str, args: tuple):
+        if self.readonly:
+            self.pending.append((kind, args))
+            return
+
+        if kind == 'touch':
+            self._db.execute('UPDATE files SET used = ? WHERE path = ?', args)
+        elif kind == 'row':
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', args)
+        elif kind == 'delete':
+            self._db.execute('DELETE FROM files WHERE path = ?', args)
+        elif kind == 'clear':
+            self._db.execute('DELETE FROM files')
+
+    def take_pending(self) -> List[Tuple[str, tuple]]:
+        """ Забрать накопленные изменения и счётчики (для передачи из процесса пула) """
+        pending, self.pending = self.pending, []
+        pending.append(('stats', (self.hits, self.misses)))
+        self.hits = self.misses = 0
+        return pending
+
+    def merge(self, pending: List[Tuple[str, tuple]]):
+        """ Применить изменения, накопленные кэшем в другом процессе """
+        for kind, args in pending:
+            if kind == 'stats':
+                self.hits += args[0]
+                self.misses += args[1]
+            else:
+                self._write(kind, args)
+
+    def evict(self):
+        """ Удаление давно не использованных записей сверх max_size """
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        stale = []
+        for path, size in self._db.execute('SELECT path, size FROM files ORDER BY used'):
+            if total <= self.max_size:
+                break
+            stale.append((path,))
+            total -= size
+        self._db.executemany('DELETE FROM files WHERE path = ?', stale)
+
+    def close(self):
+        if not self._db:
+            return
+        if not self.readonly:
+            self.evict()
+            self._db.commit()
+        self._db.close()
+        self._db = None
+
+
+class MemoryCache:
+    """
+    Данные разбора в памяти процесса (marshal) по ключу. Размер ограничен max_size байт,
+    при превышении удаляются давно не использованные записи.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MEMORY_SIZE_MB * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self._items.get(key)
+        if data is None:
+            return None
+        self._items.move_to_end(key)
+        # данные изменяются при создании объектов, каждый раз нужна копия
+        return marshal.loads(data)
+
+    def put(self, key: str, payload: Any):
+        data = marshal.dumps(payload)
+        previous = self._items.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        if len(data) > self.max_size:
+            return
+        self._items[key] = data
+        self.size += len(data)
+        while self.size > self.max_size:
+            _, stale = self._items.popitem(last=False)
+            self.size -= len(stale)
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read()
+    except OSError:
+        return None
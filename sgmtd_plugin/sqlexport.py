@@ -0,0 +1,220 @@
+# coding: utf-8
+""" Выгрузка модели метаданных в базу SQLite для произвольных запросов (поиск по Guid, SQL столбцам и т.п.). """
+import hashlib
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# при изменении схемы база пересоздаётся
+SCHEMA_VERSION = '1'
+
+# столбцы таблиц (без служебных id, hash, entity_id)
+TABLES = {
+    'modules': ('guid', 'type', 'name', 'company_code', 'version', 'solution_guid', 'base_guid', 'name_en', 'name_ru',
+                'path'),
+    'entities': ('guid', 'type', 'company_code', 'module_guid', 'module', 'name', 'name_en', 'name_ru', 'sql_table',
+                 'base_guid', 'parent_name', 'path'),
+    'properties': ('guid', 'type', 'name', 'full_name', 'code', 'sql_table', 'sql_column', 'collection_guid',
+                   'name_en', 'name_ru', 'path'),
+    'controls': ('guid', 'type', 'name', 'property_guid', 'parent_guid'),
+    'actions': ('guid', 'type', 'name'),
+    'ribbon': ('guid', 'type', 'name', 'action_guid', 'action_name'),
+    'archive': ('type', 'version', 'name', 'full_name', 'guid', 'parent_guid', 'path'),
+}
+
+# таблицы объектов верхнего уровня (ключ - guid и путь .mtd) и таблицы их элементов (ссылка entity_id)
+RECORD_TABLES = ('modules', 'entities')
+CHILD_TABLES = ('properties', 'controls', 'actions', 'ribbon')
+
+INDEXES = (
+    ('modules', 'guid'), ('modules', 'base_guid'), ('modules', 'company_code'), ('modules', 'solution_guid'),
+    ('entities', 'guid'), ('entities', 'base_guid'), ('entities', 'module_guid'), ('entities', 'module'),
+    ('entities', 'company_code'), ('entities', 'sql_table'),
+    ('properties', 'entity_id'), ('properties', 'guid'), ('properties', 'sql_table', 'sql_column'),
+    ('properties', 'sql_column'),
+    ('controls', 'entity_id'), ('controls', 'guid'),
+    ('actions', 'entity_id'), ('actions', 'guid'),
+    ('ribbon', 'entity_id'), ('ribbon', 'guid'), ('ribbon', 'action_guid'),
+    ('archive', 'guid'), ('archive', 'parent_guid'),
+)
+
+# строк в одном executemany: пакеты ограничивают расход памяти на больших моделях
+BATCH_SIZE = 5000
+
+
+class Record(NamedTuple):
+    """ Объект верхнего уровня: таблица (RECORD_TABLES), строка по TABLES и строки элементов по CHILD_TABLES """
+    table: str
+    row: Sequence[Any]
+    children: Dict[str, List[Sequence[Any]]] = {}
+
+    @property
+    def key(self) -> Tuple[Any, Any]:
+        columns = TABLES[self.table]
+        return self.row[columns.index('guid')], self.row[columns.index('path')]
+
+    def digest(self) -> bytes:
+        """ Хэш строки вместе с элементами: совпадает - при обновлении объект не перезаписывается """
+        data = repr((self.row, sorted(self.children.items()))).encode('utf-8')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class Stats(NamedTuple):
+    """ Итоги выгрузки: объекты верхнего уровня и всего записанных строк """
+    added: int
+    updated: int
+    removed: int
+    unchanged: int
+    rows: int
+
+
+def create_schema(db: sqlite3.Connection):
+    for table, columns in TABLES.items():
+        if table in RECORD_TABLES:
+            service = ['id INTEGER PRIMARY KEY', 'hash BLOB']
+        elif table in CHILD_TABLES:
+            service = ['entity_id INTEGER NOT NULL']
+        else:
+            service = []
+        db.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(table, ', '.join(service + list(columns))))
+    for table, *columns in INDEXES:
+        db.execute('CREATE INDEX IF NOT EXISTS ix_{0}_{1} ON {0} ({2})'.format(
+            table, '_'.join(columns), ', '.join(columns)))
+    db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+    db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (SCHEMA_VERSION,))
+
+
+def _insert_sql(table: str) -> str:
+    columns = TABLES[table]
+    if table in RECORD_TABLES:
+        columns = ('id', 'hash') + columns
+    elif table in CHILD_TABLES:
+        columns = ('entity_id',) + columns
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns), ', '.join('?' * len(columns)))
+
+
+class _Batches:
+    """ Накопление строк по таблицам и запись пакетами через executemany """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.rows: Dict[str, List[Sequence[Any]]] = {}
+        self.count = 0
+
+    def add(self, sql: str, row: Sequence[Any]):
+        rows = self.rows.setdefault(sql, [])
+        rows.append(row)
+        if len(rows) >= BATCH_SIZE:
+            self.flush(sql)
+
+    def flush(self, sql: Optional[str] = None):
+        for key in [sql] if sql else list(self.rows):
+            rows = self.rows.pop(key, None)
+            if rows:
+                self.db.executemany(key, rows)
+                if key.startswith('INSERT'):
+                    self.count += len(rows)
+
+
+def _version(db: sqlite3.Connection) -> Optional[str]:
+    try:
+        row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    except sqlite3.DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def write(filename: str, records: Iterable[Record], archive: Iterable[Sequence[Any]], upsert=False) -> Stats:
+    """
+    Запись модели в базу SQLite, records - объекты верхнего уровня по мере построения, archive - строки архива.
+    Без upsert база создаётся заново во временном файле без журнала и заменяет прежнюю. upsert - обновление
+    существующей базы в одной транзакции: перезаписываются только объекты (со всеми элементами), хэш строк
+    которых изменился, удалённые из модели объекты удаляются. Другая версия схемы - база создаётся заново.
+    """
+    if upsert and os.path.isfile(filename):
+        db = sqlite3.connect(filename)
+        if _version(db) == SCHEMA_VERSION:
+            try:
+                return _write(db, records, archive)
+            finally:
+                db.close()
+        db.close()
+
+    tmp = filename + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        # файл временный: при сбое он просто удаляется, журнал и синхронизация не нужны
+        db.execute('PRAGMA journal_mode=OFF')
+        db.execute('PRAGMA synchronous=OFF')
+        stats = _write(db, records, archive)
+    finally:
+        db.close()
+    os.replace(tmp, filename)
+    return stats
+
+
+def _add_record(batches: _Batches, inserts: Dict[str, str], rowid: int, digest: bytes, record: Record):
+    batches.add(inserts[record.table], (rowid, digest) + tuple(record.row))
+    for table, rows in record.children.items():
+        for row in rows:
+            batches.add(inserts[table], (rowid,) + tuple(row))
+
+
+def _write(db: sqlite3.Connection, records: Iterable[Record], archive: Iterable[Sequence[Any]]) -> Stats:
+    create_schema(db)
+    # объекты базы: таблица -> (guid, путь) -> (id, hash)
+    existing = {table: {(guid, path): (rowid, digest) for rowid, digest, guid, path in
+                        db.execute('SELECT id, hash, guid, path FROM {}'.format(table))} for table in RECORD_TABLES}
+    next_id = 1 + max((db.execute('SELECT max(id) FROM {}'.format(x)).fetchone()[0] or 0 for x in RECORD_TABLES))
+    deletes = {table: 'DELETE FROM {} WHERE id = ?'.format(table) for table in RECORD_TABLES}
+    deletes.update({table: 'DELETE FROM {} WHERE entity_id = ?'.format(table) for table in CHILD_TABLES})
+    inserts = {table: _insert_sql(table) for table in TABLES}
+
+    added = updated = unchanged = 0
+    batches = _Batches(db)
+    # изменённые объекты перезаписываются с прежним id после удаления старых строк
+    changed: List[Tuple[int, bytes, Record]] = []
+    with db:
+        for record in records:
+            digest = record.digest()
+            previous = existing[record.table].pop(record.key, None)
+            if previous is None:
+                added += 1
+                _add_record(batches, inserts, next_id, digest, record)
+                next_id += 1
+                continue
+
+            rowid, old_digest = previous
+            if old_digest == digest:
+                unchanged += 1
+            else:
+                updated += 1
+                changed.append((rowid, digest, record))
+
+        # изменённые и удалённые из модели объекты удаляются одним пакетом на таблицу
+        stale = {table: [(rowid,) for rowid, _ in items.values()] for table, items in existing.items()}
+        removed = sum(len(x) for x in stale.values())
+        for rowid, _, record in changed:
+            stale[record.table].append((rowid,))
+        for table, rows in stale.items():
+            db.executemany(deletes[table], rows)
+            for child in CHILD_TABLES:
+                db.executemany(deletes[child], rows)
+
+        for rowid, digest, record in changed:
+            _add_record(batches, inserts, rowid, digest, record)
+        batches.flush()
+
+        # архив не привязан к объектам: перезаписывается целиком, только если изменился
+        rows = [tuple(x) for x in archive]
+        digest = hashlib.blake2b(repr(rows).encode('utf-8'), digest_size=16).hexdigest()
+        row = db.execute("SELECT value FROM meta WHERE key = 'archive'").fetchone()
+        if not row or row[0] != digest:
+            db.execute('DELETE FROM archive')
+            db.executemany(inserts['archive'], rows)
+            batches.count += len(rows)
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('archive', ?)", (digest,))
+
+    return Stats(added, updated, removed, unchanged, batches.count)
@@ -0,0 +1,186 @@
+# coding: utf-8
+""" Замеры времени этапов анализа и профилирование (--timings, --profile). """
+import cProfile
+import heapq
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
+
+# число строк в выводе cProfile / tracemalloc
+PROFILE_TOP = 30
+
+
+class Timings:
+    """
+    Время и число элементов по этапам, slowest - сколько самых долгих файлов запоминать.
+    Этапы вложены друг в друга (разбор файла включает чтение и декодирование), в пуле процессов
+    время этапов разбора суммируется по процессам - сумма этапов не равна общему времени.
+    Выгрузки export добавляют этапы из нескольких потоков, поэтому счётчики меняются под блокировкой.
+    """
+
+    def __init__(self, slowest: int = 0):
+        self.slowest = slowest
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}
+        self.files: List[Tuple[float, str]] = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        with self.lock:
+            data = self.phases.get(name)
+            if data is None:
+                self.phases[name] = [seconds, count]
+            else:
+                data[0] += seconds
+                data[1] += count
+
+    def add_file(self, path: str, seconds: float):
+        """ Учёт времени разбора файла, хранятся только slowest самых долгих """
+        with self.lock:
+            if len(self.files) < self.slowest:
+                heapq.heappush(self.files, (seconds, path))
+            elif self.files and seconds > self.files[0][0]:
+                heapq.heapreplace(self.files, (seconds, path))
+
+    def take(self):
+        """ Накопленные данные для передачи из процесса пула, счётчики обнуляются """
+        with self.lock:
+            state = (self.phases, self.files)
+            self.phases, self.files = {}, []
+        return state
+
+    def merge(self, state):
+        phases, files = state
+        for name, (seconds, count) in phases.items():
+            self.add(name, seconds, count)
+        for seconds, path in files:
+            self.add_file(path, seconds)
+
+    def report(self) -> str:
+        lines = ['Timings: total {:.3f} s'.format(time.perf_counter() - self.started)]
+        for name, (seconds, count) in self.phases.items():
+            lines.append('  {:<28} {:>10.3f} s {:>9} {:>10.3f} ms/item'.format(
+                name, seconds, count, seconds * 1000 / count if count else 0))
+        if self.files:
+            lines.append('Slowest files:')
+            for seconds, path in sorted(self.files, reverse=True):
+                lines.append('  {:>10.3f} ms  {}'.format(seconds * 1000, path))
+        return '\n'.join(lines)
+
+
+class Phase:
+    """ Замер этапа: with phase(...) as p: ...; p.count = число обработанных элементов """
+    __slots__ = ('timings', 'name', 'count', 'path', 'started')
+
+    def __init__(self, timings: Optional[Timings], name: str, count: int = 1, path: Optional[str] = None):
+        self.timings = timings
+        self.name = name
+        self.count = count
+        self.path = path
+        self.started = 0.0
+
+    def __enter__(self):
+        if self.timings:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings:
+            elapsed = time.perf_counter() - self.started
+            self.timings.add(self.name, elapsed, self.count)
+            if self.path:
+                self.timings.add_file(self.path, elapsed)
+
+
+# замер текущего процесса, None - замеры выключены
+_current: Optional[Timings] = None
+
+
+def active() -> Optional[Timings]:
+    return _current
+
+
+def start(slowest: int = 0) -> Timings:
+    """ Включить замеры в текущем процессе (процесс пула), если они ещё не включены """
+    global _current
+    # при fork процесс пула получает копию замеров основного процесса
+    if _current is None or _current.pid != os.getpid():
+        _current = Timings(slowest)
+    return _current
+
+
+def phase(name: str, count: int = 1) -> Phase:
+    """ Контекст замера этапа, без включённых замеров ничего не делает """
+    return Phase(_current, name, count)
+
+
+def track_file(path: str, name: str = 'parse file') -> Phase:
+    """ Замер разбора файла, файл попадает в список самых долгих """
+    return Phase(_current, name, 1, path)
+
+
+def add(name: str, seconds: float, count: int = 1):
+    if _current:
+        _current.add(name, seconds, count)
+
+
+def take():
+    """ Данные замеров процесса пула для основного процесса, None - замеры выключены """
+    return _current.take() if _current else None
+
+
+def merge(state):
+    if _current and state:
+        _current.merge(state)
+
+
+def print_memory(snapshot: tracemalloc.Snapshot, peak: int):
+    print('Memory: peak {:.1f} MB, top allocations:'.format(peak / 2 ** 20))
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, cProfile.__file__),
+                                       tracemalloc.Filter(False, tracemalloc.__file__)])
+    for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+        print('  {:>10.1f} KB {:>9} {}'.format(stat.size / 1024, stat.count, stat.traceback))
+
+
+@contextmanager
+def session(enabled=False, slowest: int = 0, profile: Union[bool, str, None] = None, memory=False):
+    """
+    Замеры на время выполнения команды, итоги выводятся по завершении.
+    enabled - время этапов, slowest - число самых долгих файлов в отчёте;
+    profile - cProfile основного процесса: True/'' - вывод на экран, строка - файл статистики pstats;
+    memory - tracemalloc: пиковый объём и места наибольшего выделения памяти.
+    """
+    global _current
+    timings = Timings(slowest) if enabled or slowest else None
+    _current = timings
+    profiler = cProfile.Profile() if profile or profile == '' else None
+    if memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield timings
+    finally:
+        if profiler:
+            profiler.disable()
+        if memory:
+            # снимок до вывода профиля, чтобы не учитывать память самого отчёта
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if profiler:
+            if isinstance(profile, str) and profile:
+                profiler.dump_stats(profile)
+                print('Profile saved to', profile)
+            else:
+                pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        if memory:
+            print_memory(snapshot, peak)
+        if timings:
+            print(timings.report())
+        _current = None
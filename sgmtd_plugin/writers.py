@@ -0,0 +1,70 @@
+# coding: utf-8
+""" Выгрузка строк листов отчёта в текстовые форматы для других инструментов. """
+import csv
+import gzip
+import json
+import os
+import re
+from typing import Any, Iterable, Sequence, TextIO, Tuple
+
+# сжатие gzip, если имя файла оканчивается на .gz
+GZIP_LEVEL = 6
+GZIP_SUFFIX = '.gz'
+
+# символы, недопустимые в имени файла листа
+_UNSAFE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def open_text(filename: str) -> TextIO:
+    """ Текстовый файл для записи в UTF-8, со сжатием gzip, если имя оканчивается на .gz """
+    if filename.endswith(GZIP_SUFFIX):
+        return gzip.open(filename, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8', newline='')
+    return open(filename, 'w', encoding='utf-8', newline='')
+
+
+def sheet_filename(filename: str, sheet: str) -> str:
+    """ Файл листа для форматов с одной таблицей в файле: report.csv.gz -> report.Сущности.csv.gz """
+    suffix = GZIP_SUFFIX if filename.endswith(GZIP_SUFFIX) else ''
+    base, ext = os.path.splitext(filename[:len(filename) - len(suffix)])
+    return '{}.{}{}{}'.format(base, _UNSAFE.sub('_', sheet), ext, suffix)
+
+
+def write_jsonl(filename: str, sheets: Iterable[Tuple[str, Iterable[Sequence[Any]]]]) -> int:
+    """
+    JSON Lines: для каждой строки листа - объект {"sheet": имя листа, заголовок столбца: значение, ...}.
+    sheets - (имя, строки), первая строка листа - заголовок. Строки пишутся по мере получения, возвращает их число.
+    """
+    count = 0
+    with open_text(filename) as fp:
+        for name, rows in sheets:
+            headers = None
+            for row in rows:
+                if headers is None:
+                    headers = row
+                    continue
+                record = {'sheet': name}
+                record.update(zip(headers, row))
+                fp.write(json.dumps(record, ensure_ascii=False))
+                fp.write('\n')
+                count += 1
+    return count
+
+
+def write_csv(filename: str, sheets: Iterable[Tuple[str, Iterable[Sequence[Any]]]]) -> int:
+    """
+    CSV: лист - отдельный файл (sheet_filename) с заголовком в первой строке, None - пустое значение.
+    Файлы пустых листов не создаются. Строки пишутся по мере получения, возвращает их число.
+    """
+    count = 0
+    for name, rows in sheets:
+        rows = iter(rows)
+        headers = next(rows, None)
+        if headers is None:
+            continue
+        with open_text(sheet_filename(filename, name)) as fp:
+            writer = csv.writer(fp)
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    return count
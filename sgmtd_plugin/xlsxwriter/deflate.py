@@ -0,0 +1,176 @@
+###############################################################################
+#
+# Deflate - A class for compressing XLSX parts in a thread pool.
+#
+# Used in conjunction with XlsxWriter.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+
+# Standard packages.
+import io
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the uncompressed blocks that are deflated independently.
+CHUNK_SIZE = 1024 * 1024
+
+# Deflate window: each block uses the end of the previous one as a preset
+# dictionary so the ratio is close to a single stream.
+WINDOW_SIZE = 32 * 1024
+
+# The zipfile module has no public API to add already deflated data. The
+# blocks are written through a ZipFile.open(name, 'w') handle with its
+# compressor replaced, and the CRC and size of the uncompressed data are set
+# on the handle before it is closed. These private attributes of
+# zipfile._ZipWriteFile are unchanged in the supported Python versions
+# (inclusive range). Other versions use the serial compression of zipfile.
+SUPPORTED_PYTHON = ((3, 6), (3, 13))
+_HANDLE_ATTRIBUTES = ('_compressor', '_crc', '_file_size')
+
+
+def _deflate(data, level, zdict, last):
+    # Compress a block to raw deflate data. Blocks other than the last end
+    # with a sync flush so that they can be concatenated into one stream.
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    flush = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    return compressor.compress(data) + compressor.flush(flush)
+
+
+class _Passthrough(object):
+    # Stands in for the zlib compressor of a zipfile write handle since the
+    # blocks are already deflated.
+
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class DeflateMember(io.RawIOBase):
+    """
+    A write-only stream for one zip member. Data is split into blocks that
+    are deflated in the Deflater thread pool while the XML is still being
+    generated. The Deflater writes the finished blocks to the zip file in
+    order, so only the blocks in flight are kept in memory.
+
+    """
+
+    def __init__(self, deflater, name, force_zip64=False):
+        super(DeflateMember, self).__init__()
+        self.deflater = deflater
+        self.name = name
+        self.force_zip64 = force_zip64
+        self.buffer = bytearray()
+        self.crc = 0
+        self.file_size = 0
+        self.zdict = None
+        self.handle = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.deflater.chunk_size:
+            self._submit(False)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        super(DeflateMember, self).close()
+        self._submit(True)
+
+    def _submit(self, last):
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+        self.deflater._submit(self, data, self.zdict, last)
+        self.zdict = data[-WINDOW_SIZE:]
+
+    def _write_block(self, data, last):
+        # Write a deflated block to the zip member, which is opened with the
+        # first block. The ZipFile allows one open write handle at a time
+        # and the Deflater writes the members in order.
+        if self.handle is None:
+            handle = self.deflater.zip_file.open(
+                self.name, 'w', force_zip64=self.force_zip64)
+            for attribute in _HANDLE_ATTRIBUTES:
+                if not hasattr(handle, attribute):
+                    handle.close()
+                    raise RuntimeError("Parallel deflate isn't supported by "
+                                       "the zipfile module of this Python.")
+            handle._compressor = _Passthrough()
+            self.handle = handle
+
+        self.handle.write(data)
+
+        if last:
+            # The handle computed the CRC and size of the deflated data.
+            self.handle._crc = self.crc
+            self.handle._file_size = self.file_size
+            self.handle.close()
+
+
+class Deflater(object):
+    """
+    Parallel deflate of zip members. Members are compressed in blocks by a
+    thread pool (zlib releases the GIL) and the blocks are written into the
+    zip file in the order they were submitted, as soon as they are ready.
+
+    """
+
+    def __init__(self, zip_file, threads, level=None,
+                 chunk_size=CHUNK_SIZE):
+        self.zip_file = zip_file
+        self.level = -1 if level is None else level
+        self.chunk_size = chunk_size
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        # Blocks not yet written are kept in memory: limit their number.
+        self.queue = deque()
+        self.max_in_flight = 2 * threads
+
+    @staticmethod
+    def is_supported():
+        """
+        Check if parallel deflate can be used with this version of Python.
+
+        """
+        first, last = SUPPORTED_PYTHON
+        return first <= sys.version_info[:2] <= last
+
+    def open(self, name, force_zip64=False):
+        return DeflateMember(self, name, force_zip64)
+
+    def close(self):
+        # Write the remaining blocks and stop the thread pool.
+        try:
+            self._write_ready(True)
+        finally:
+            self.pool.shutdown()
+
+    def _submit(self, member, data, zdict, last):
+        future = self.pool.submit(_deflate, data, self.level, zdict, last)
+        self.queue.append((member, future, last))
+        self._write_ready(False)
+        while len(self.queue) > self.max_in_flight:
+            self._write_next()
+
+    def _write_ready(self, wait):
+        while self.queue and (wait or self.queue[0][1].done()):
+            self._write_next()
+
+    def _write_next(self):
+        member, future, last = self.queue.popleft()
+        member._write_block(future.result(), last)
@@ -14,6 +14,7 @@ from shutil import copy
 
 from io import StringIO
 from io import BytesIO
+from io import TextIOWrapper
 
 # Package imports.
 from .app import App
@@ -89,6 +90,10 @@ class Packager(object):
 
         self.tmpdir = ''
         self.in_memory = False
+        self.zip_file = None
+        self.zip_handle = None
+        self.force_zip64 = False
+        self.deflater = None
         self.workbook = None
         self.worksheet_count = 0
         self.chartsheet_count = 0
@@ -114,6 +119,16 @@ class Packager(object):
         # Set the optional 'in_memory' mode.
         self.in_memory = in_memory
 
+    def _set_zip_file(self, zip_file, force_zip64=False, deflater=None):
+        # Set the optional 'stream_zip' mode: XML parts are written straight
+        # into the open ZipFile instead of temp files. 'force_zip64' is used
+        # for the parts that can grow large since their size isn't known
+        # in advance. With a 'deflater' the parts are compressed in its
+        # thread pool and written to the ZipFile in order.
+        self.zip_file = zip_file
+        self.force_zip64 = force_zip64
+        self.deflater = deflater
+
     def _add_workbook(self, workbook):
         # Add the Excel::Writer::XLSX::Workbook object to the package.
         self.workbook = workbook
@@ -154,6 +169,7 @@ class Packager(object):
         self._write_core_file()
         self._write_app_file()
         self._write_metadata_file()
+        self._close_zip_handle()
 
         return self.filenames
 
@@ -162,6 +178,8 @@ class Packager(object):
         # filename to use as the name in the Zip container.
         if self.in_memory:
             os_filename = StringIO()
+        elif self.zip_file:
+            return self._zip_member(xml_filename)
         else:
             (fd, os_filename) = tempfile.mkstemp(dir=self.tmpdir)
             os.close(fd)
@@ -170,6 +188,33 @@ class Packager(object):
 
         return os_filename
 
+    def _zip_member(self, xml_filename):
+        # Open a text stream to a new member of the zip file. Only one member
+        # can be written at a time so close the previous one if the writer
+        # didn't.
+        self._close_zip_handle()
+
+        # The member gets Excel's timestamp of 1/1/1980 (the ZipInfo default)
+        # and the compression type and level of the ZipFile.
+        force_zip64 = self.force_zip64 and (
+            xml_filename.startswith('xl/worksheets/sheet')
+            or xml_filename == 'xl/sharedStrings.xml')
+
+        if self.deflater:
+            stream = self.deflater.open(xml_filename, force_zip64)
+        else:
+            stream = self.zip_file.open(xml_filename, 'w',
+                                        force_zip64=force_zip64)
+
+        self.zip_handle = TextIOWrapper(stream, encoding='utf-8')
+
+        return self.zip_handle
+
+    def _close_zip_handle(self):
+        if self.zip_handle is not None and not self.zip_handle.closed:
+            self.zip_handle.close()
+        self.zip_handle = None
+
     def _write_workbook_file(self):
         # Write the workbook.xml file.
         workbook = self.workbook
@@ -630,7 +675,7 @@ class Packager(object):
 
             xml_image_name = 'xl/media/image' + str(index) + ext
 
-            if not self.in_memory:
+            if not self.in_memory and not self.zip_file:
                 # In file mode we just write or copy the image file.
                 os_filename = self._filename(xml_image_name)
 
@@ -649,7 +694,8 @@ class Packager(object):
                     except OSError:
                         pass
             else:
-                # For in-memory mode we read the image into a stream.
+                # For in-memory and stream_zip modes we read the image into a
+                # stream.
                 if image_data:
                     # The data is already in a byte stream.
                     os_filename = image_data
@@ -673,7 +719,7 @@ class Packager(object):
 
         xml_vba_name = 'xl/vbaProject.bin'
 
-        if not self.in_memory:
+        if not self.in_memory and not self.zip_file:
             # In file mode we just write or copy the VBA file.
             os_filename = self._filename(xml_vba_name)
 
@@ -686,7 +732,8 @@ class Packager(object):
                 copy(vba_project, os_filename)
 
         else:
-            # For in-memory mode we read the vba into a stream.
+            # For in-memory and stream_zip modes we read the vba into a
+            # stream.
             if vba_is_stream:
                 # The data is already in a byte stream.
                 os_filename = vba_project
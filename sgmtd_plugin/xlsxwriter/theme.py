@@ -48,6 +48,10 @@ class Theme(object):
         if isinstance(filename, StringIO):
             self.internal_fh = False
             self.fh = filename
+        elif not isinstance(filename, str):
+            # A stream opened for us, such as a zip file member.
+            self.internal_fh = True
+            self.fh = filename
         else:
             self.internal_fh = True
             self.fh = open(filename, mode='w', encoding='utf-8')
@@ -17,7 +17,7 @@ from decimal import Decimal
 from fractions import Fraction
 from struct import unpack
 from warnings import warn
-from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, LargeZipFile
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, LargeZipFile
 
 
 # Package imports.
@@ -27,6 +27,7 @@ from .chartsheet import Chartsheet
 from .sharedstrings import SharedStringTable
 from .format import Format
 from .packager import Packager
+from .deflate import Deflater
 from .utility import xl_cell_to_rowcol
 from .chart_area import ChartArea
 from .chart_bar import ChartBar
@@ -81,9 +82,14 @@ class Workbook(xmlwriter.XMLwriter):
         self.default_date_format = options.get('default_date_format', None)
         self.constant_memory = options.get('constant_memory', False)
         self.in_memory = options.get('in_memory', False)
+        self.stream_zip = options.get('stream_zip', False)
+        self.compression_level = options.get('compression_level', None)
+        self.deflate_threads = options.get('deflate_threads', 0)
         self.excel2003_style = options.get('excel2003_style', False)
         self.remove_timezone = options.get('remove_timezone', False)
         self.use_future_functions = options.get('use_future_functions', False)
+        self.track_widths = options.get('track_widths', False)
+        self.string_mode = options.get('string_mode', 'shared')
         self.default_format_properties = \
             options.get('default_format_properties', {})
 
@@ -132,6 +138,8 @@ class Workbook(xmlwriter.XMLwriter):
         self.tab_ratio = 600
         self.str_table = SharedStringTable()
         self.vba_project = None
+        # Durations of the close() stages: XML parts generation and zip.
+        self.store_times = {}
         self.vba_is_stream = False
         self.vba_codename = None
         self.image_types = {}
@@ -149,6 +157,7 @@ class Workbook(xmlwriter.XMLwriter):
         # We can't do 'constant_memory' mode while doing 'in_memory' mode.
         if self.in_memory:
             self.constant_memory = False
+            self.stream_zip = False
 
         # Add the default cell format.
         if self.excel2003_style:
@@ -650,11 +659,19 @@ class Workbook(xmlwriter.XMLwriter):
         self._xml_close()
 
     def _store_workbook(self):
+        started = time.perf_counter()
+
+        # Create the xlsx/zip file. Compression level 0 stores the parts
+        # without compression.
+        if self.compression_level == 0:
+            compression = ZIP_STORED
+        else:
+            compression = ZIP_DEFLATED
 
-        # Create the xlsx/zip file.
         try:
-            xlsx_file = ZipFile(self.filename, "w", compression=ZIP_DEFLATED,
-                                allowZip64=self.allow_zip64)
+            xlsx_file = ZipFile(self.filename, "w", compression=compression,
+                                allowZip64=self.allow_zip64,
+                                compresslevel=self.compression_level or None)
         except IOError as e:
             raise e
 
@@ -706,28 +723,60 @@ class Workbook(xmlwriter.XMLwriter):
         packager._add_workbook(self)
         packager._set_tmpdir(self.tmpdir)
         packager._set_in_memory(self.in_memory)
-        xml_files = packager._create_package()
+
+        # The parts are written to the Zip file directly in 'stream_zip'
+        # mode and when they are deflated in a thread pool.
+        deflater = None
+        if self.deflate_threads and compression == ZIP_DEFLATED \
+                and not self.in_memory and Deflater.is_supported():
+            deflater = Deflater(xlsx_file, self.deflate_threads,
+                                self.compression_level)
+            packager._set_zip_file(xlsx_file, self.allow_zip64, deflater)
+        elif self.stream_zip:
+            packager._set_zip_file(xlsx_file, self.allow_zip64)
+        streamed = packager.zip_file is not None
+
+        try:
+            xml_files = packager._create_package()
+            if deflater:
+                deflater.close()
+                deflater = None
+        except RuntimeError as e:
+            # Raised by zipfile for a streamed part over 4GB without zip64.
+            if streamed and 'too large' in str(e):
+                raise LargeZipFile(e)
+            raise e
+        finally:
+            if deflater:
+                deflater.pool.shutdown()
 
         # Free up the Packager object.
         packager = None
+        packaged = time.perf_counter()
+        self.store_times['xml'] = packaged - started
 
-        # Add XML sub-files to the Zip file with their Excel filename.
+        # Add XML sub-files to the Zip file with their Excel filename. When
+        # streamed the XML parts are already in the Zip file and only
+        # in-memory binary files such as images are left.
         for file_id, file_data in enumerate(xml_files):
             os_filename, xml_filename, is_binary = file_data
 
-            if self.in_memory:
+            if self.in_memory or streamed:
 
                 # Set sub-file timestamp to Excel's timestamp of 1/1/1980.
                 zipinfo = ZipInfo(xml_filename, (1980, 1, 1, 0, 0, 0))
 
-                # Copy compression type from parent ZipFile.
+                # Copy compression type and level from parent ZipFile.
                 zipinfo.compress_type = xlsx_file.compression
+                level = xlsx_file.compresslevel
 
                 if is_binary:
-                    xlsx_file.writestr(zipinfo, os_filename.getvalue())
+                    xlsx_file.writestr(zipinfo, os_filename.getvalue(),
+                                       compresslevel=level)
                 else:
                     xlsx_file.writestr(zipinfo,
-                                       os_filename.getvalue().encode('utf-8'))
+                                       os_filename.getvalue().encode('utf-8'),
+                                       compresslevel=level)
             else:
                 # The sub-files are tempfiles on disk, i.e, not in memory.
 
@@ -746,6 +795,7 @@ class Workbook(xmlwriter.XMLwriter):
                     raise e
 
         xlsx_file.close()
+        self.store_times['zip'] = time.perf_counter() - packaged
 
     def _add_sheet(self, name, worksheet_class=None):
         # Utility for shared code in add_worksheet() and add_chartsheet().
@@ -777,6 +827,8 @@ class Workbook(xmlwriter.XMLwriter):
             'remove_timezone': self.remove_timezone,
             'max_url_length': self.max_url_length,
             'use_future_functions': self.use_future_functions,
+            'track_widths': self.track_widths,
+            'string_mode': self.string_mode,
         }
 
         worksheet._initialize(init_data)
@@ -17,6 +17,7 @@ from collections import defaultdict
 from collections import namedtuple
 from decimal import Decimal
 from fractions import Fraction
+from functools import lru_cache
 from functools import wraps
 from io import StringIO
 from math import isinf
@@ -48,6 +49,25 @@ from .exceptions import OverlappingRange
 re_control_chars_1 = re.compile('(_x[0-9a-fA-F]{4}_)')
 re_control_chars_2 = re.compile(r'([\x00-\x08\x0b-\x1f])')
 
+
+# Cache the pixel width of strings for autofit(). Column data usually has a
+# lot of repeated values so the width is only calculated once per string.
+@lru_cache(maxsize=65536)
+def _string_pixel_width(string):
+    if "\n" not in string:
+        # Single line string.
+        return xl_pixel_width(string)
+
+    # Handle multi-line strings.
+    length = 0
+    for segment in string.split("\n"):
+        seg_length = xl_pixel_width(segment)
+        if seg_length > length:
+            length = seg_length
+
+    return length
+
+
 re_dynamic_function = re.compile(r"""
     \bSORT\(       |
     \bLET\(        |
@@ -199,6 +219,15 @@ class Worksheet(xmlwriter.XMLwriter):
         self.constant_memory = 0
         self.tmpdir = None
         self.is_chartsheet = False
+        self.track_widths = False
+        self.tracked_widths = {}
+        self.tracked_first_row = None
+        self.tracked_first_widths = {}
+        self.string_mode = 'shared'
+        self.string_modes = {}
+        self.string_samples = {}
+        self.string_sample_size = 1000
+        self.string_unique_ratio = 0.9
 
         self.ext_sheets = []
         self.fileclosed = 0
@@ -567,11 +596,15 @@ class Worksheet(xmlwriter.XMLwriter):
             string = string[:self.xls_strmax]
             str_error = -2
 
-        # Write a shared string or an in-line string in constant_memory mode.
-        if not self.constant_memory:
-            string_index = self.str_table._get_shared_string_index(string)
-        else:
+        # Write a shared string or an in-line string in constant_memory mode
+        # or in the 'inline' string mode.
+        if self.constant_memory:
+            string_index = string
+        elif ((self.string_modes or self.string_mode != 'shared')
+                and self._inline_string(col, string)):
             string_index = string
+        else:
+            string_index = self.str_table._get_shared_string_index(string)
 
         # Write previous row if in in-line string constant_memory mode.
         if self.constant_memory and row > self.previous_row:
@@ -580,6 +613,9 @@ class Worksheet(xmlwriter.XMLwriter):
         # Store the cell data in the worksheet data table.
         self.table[row][col] = cell_string_tuple(string_index, cell_format)
 
+        if self.track_widths:
+            self._track_width(row, col, _string_pixel_width(string))
+
         return str_error
 
     @convert_cell_args
@@ -630,6 +666,9 @@ class Worksheet(xmlwriter.XMLwriter):
         # Store the cell data in the worksheet data table.
         self.table[row][col] = cell_number_tuple(number, cell_format)
 
+        if self.track_widths:
+            self._track_width(row, col, 7 * len(str(number)))
+
         return 0
 
     @convert_cell_args
@@ -721,6 +760,9 @@ class Worksheet(xmlwriter.XMLwriter):
         # Store the cell data in the worksheet data table.
         self.table[row][col] = cell_formula_tuple(formula, cell_format, value)
 
+        if self.track_widths:
+            self._track_width(row, col, self._formula_pixel_width(value))
+
         return 0
 
     @convert_range_args
@@ -991,6 +1033,10 @@ class Worksheet(xmlwriter.XMLwriter):
                                                                 cell_range,
                                                                 atype)
 
+        if self.track_widths:
+            self._track_width(first_row, first_col,
+                              self._formula_pixel_width(value))
+
         # Pad out the rest of the area with formatted zeroes.
         if not self.constant_memory:
             for row in range(first_row, last_row + 1):
@@ -1039,6 +1085,9 @@ class Worksheet(xmlwriter.XMLwriter):
         # Store the cell data in the worksheet data table.
         self.table[row][col] = cell_datetime_tuple(number, cell_format)
 
+        if self.track_widths:
+            self._track_width(row, col, self.default_date_pixels)
+
         return 0
 
     @convert_cell_args
@@ -1078,6 +1127,9 @@ class Worksheet(xmlwriter.XMLwriter):
         # Store the cell data in the worksheet data table.
         self.table[row][col] = cell_boolean_tuple(value, cell_format)
 
+        if self.track_widths:
+            self._track_width(row, col, 31 if value else 36)
+
         return 0
 
     # Write a hyperlink. This is comprised of two elements: the displayed
@@ -1349,6 +1401,9 @@ class Worksheet(xmlwriter.XMLwriter):
                                                       cell_format,
                                                       raw_string)
 
+        if self.track_widths:
+            self._track_width(row, col, _string_pixel_width(raw_string))
+
         return 0
 
     def add_write_handler(self, user_type, user_function):
@@ -1412,6 +1467,180 @@ class Worksheet(xmlwriter.XMLwriter):
 
         return 0
 
+    @convert_cell_args
+    def write_rows(self, row, col, rows, cell_format=None,
+                   column_types=None):
+        """
+        Write a block of rows starting from (row, col). This is a faster
+        alternative to calling write_row() for each row of homogeneous data.
+
+        Args:
+            row:          The first cell row (zero indexed).
+            col:          The first cell column (zero indexed).
+            rows:         An iterable of sequences of tokens, one per row.
+            cell_format:  An optional cell Format object.
+            column_types: Optional column types: a list with a type for
+                          each column or a single type for all columns.
+                          Types are 'string' and 'number'. None or other
+                          values are written with write().
+
+        Values of the declared type are stored directly: 'string' values
+        are always written as plain text, without the formula, url and
+        number conversions of write(). Empty strings and None are written
+        as blank cells. Other values are passed to write(). Strings are
+        shared or in-line according to the column string mode.
+
+        If a row or value can't be written the block stops there. The cells
+        written before it are kept and the worksheet dimensions include
+        them, then the error is returned or the exception is raised.
+
+        Returns:
+            0:  Success.
+            -1: Row or column is out of worksheet bounds.
+            -2: One or more strings were truncated to 32k characters.
+            other: Return value of write() method.
+
+        """
+        if row < 0 or col < 0:
+            return -1
+
+        if column_types is None or isinstance(column_types, str):
+            types = None
+            default_type = column_types
+        else:
+            types = list(column_types)
+            default_type = None
+
+        # In constant_memory mode rows that are already written can't change.
+        if self.constant_memory and row < self.previous_row:
+            return -1
+
+        str_error = 0
+        strmax = self.xls_strmax
+        constant_memory = self.constant_memory
+        track_widths = self.track_widths
+        tracked = self.tracked_widths
+        get_string_index = self.str_table._get_shared_string_index
+        if self.string_modes or self.string_mode != 'shared':
+            inline_string = self._inline_string
+        else:
+            inline_string = None
+        table = self.table
+        row_first = None
+        row_last = None
+        col_last = -1
+
+        try:
+            for row_num, data in enumerate(rows, row):
+                if row_num >= self.xls_rowmax:
+                    return -1
+
+                col_end = col + len(data) - 1
+                if col_end >= self.xls_colmax:
+                    return -1
+
+                # Update the column dimensions before the row is written
+                # since they are used to write the previous row in
+                # constant_memory mode.
+                if col_end > col_last:
+                    col_last = col_end
+                    self._check_dimensions(row_num, col, ignore_row=True)
+                    self._check_dimensions(row_num, col_end, ignore_row=True)
+
+                # Write previous row if in in-line string constant_memory
+                # mode.
+                if constant_memory and row_num > self.previous_row:
+                    self._write_single_row(row_num)
+
+                cells = {}
+                # Widths of the first tracked row are handled by
+                # _track_width() for the autofilter adjustment.
+                fast_track = (track_widths
+                              and self.tracked_first_row is not None
+                              and row_num > self.tracked_first_row)
+
+                try:
+                    for col_num, token in enumerate(data, col):
+                        if types is None:
+                            token_type = default_type
+                        elif col_num - col < len(types):
+                            token_type = types[col_num - col]
+                        else:
+                            token_type = None
+
+                        if token_type == 'string' and (token is None
+                                                       or type(token) is str):
+                            if not token:
+                                # Don't write a blank cell unless it has a
+                                # format.
+                                if cell_format is not None:
+                                    cells[col_num] = \
+                                        cell_blank_tuple(cell_format)
+                                continue
+
+                            if len(token) > strmax:
+                                token = token[:strmax]
+                                str_error = -2
+
+                            if constant_memory or (
+                                    inline_string
+                                    and inline_string(col_num, token)):
+                                cells[col_num] = \
+                                    cell_string_tuple(token, cell_format)
+                            else:
+                                cells[col_num] = cell_string_tuple(
+                                    get_string_index(token), cell_format)
+
+                            if track_widths:
+                                length = _string_pixel_width(token)
+                                if not fast_track:
+                                    self._track_width(row_num, col_num,
+                                                      length)
+                                elif length > tracked.get(col_num, 0):
+                                    tracked[col_num] = length
+
+                        elif token_type == 'number' and type(token) is int:
+                            cells[col_num] = \
+                                cell_number_tuple(token, cell_format)
+
+                            if track_widths:
+                                length = 7 * len(str(token))
+                                if not fast_track:
+                                    self._track_width(row_num, col_num,
+                                                      length)
+                                elif length > tracked.get(col_num, 0):
+                                    tracked[col_num] = length
+
+                        else:
+                            error = self._write(row_num, col_num, token,
+                                                cell_format)
+                            if error == -2:
+                                # The string was written truncated.
+                                str_error = -2
+                            elif error:
+                                return error
+                finally:
+                    # Add the row to the worksheet data table in one step,
+                    # including the cells written before an error.
+                    if cells:
+                        existing = table.get(row_num)
+                        if existing:
+                            existing.update(cells)
+                        else:
+                            table[row_num] = cells
+
+                        if row_first is None:
+                            row_first = row_num
+                        row_last = row_num
+        finally:
+            # Store the row dimensions once for the block, including the
+            # rows written before an error.
+            if row_first is not None:
+                self._check_dimensions(row_first, col, ignore_col=True)
+                self._check_dimensions(row_last, col, ignore_col=True)
+
+        return str_error
+
     @convert_cell_args
     def insert_image(self, row, col, filename, options=None):
         """
@@ -1824,6 +2053,10 @@ class Worksheet(xmlwriter.XMLwriter):
         """
         Simulate autofit based on the data, and datatypes in each column.
 
+        If the Workbook() 'track_widths' option is on the column widths are
+        recorded as the cells are written so autofit() doesn't need to scan
+        the worksheet data. This also works in constant_memory mode.
+
         Args:
             None.
 
@@ -1831,108 +2064,13 @@ class Worksheet(xmlwriter.XMLwriter):
             Nothing.
 
         """
-        if self.constant_memory:
+        if self.track_widths:
+            col_width_max = self._get_tracked_widths()
+        elif self.constant_memory:
             warn("Autofit is not supported in constant_memory mode.")
             return
-
-        # Store the max pixel width for each column.
-        col_width_max = {}
-
-        # Create a reverse lookup for the share strings table so we can convert
-        # the string id back to the original string.
-        strings = sorted(self.str_table.string_table,
-                         key=self.str_table.string_table.__getitem__)
-
-        for row_num in range(self.dim_rowmin, self.dim_rowmax + 1):
-            if not self.table.get(row_num):
-                continue
-
-            for col_num in range(self.dim_colmin, self.dim_colmax + 1):
-                if col_num in self.table[row_num]:
-                    cell = self.table[row_num][col_num]
-                    cell_type = type(cell).__name__
-                    length = 0
-
-                    if cell_type == 'String' or cell_type == 'RichString':
-                        # Handle strings and rich strings.
-                        #
-                        # For standard shared strings we do a reverse lookup
-                        # from the shared string id to the actual string. For
-                        # rich strings we use the unformatted string. We also
-                        # split multi-line strings and handle each part
-                        # separately.
-                        if cell_type == 'String':
-                            string_id = cell.string
-                            string = strings[string_id]
-                        else:
-                            string = cell.raw_string
-
-                        if "\n" not in string:
-                            # Single line string.
-                            length = xl_pixel_width(string)
-                        else:
-                            # Handle multi-line strings.
-                            for string in (string.split("\n")):
-                                seg_length = xl_pixel_width(string)
-                                if seg_length > length:
-                                    length = seg_length
-
-                    elif cell_type == 'Number':
-                        # Handle numbers.
-                        #
-                        # We use a workaround/optimization for numbers since
-                        # digits all have a pixel width of 7. This gives a
-                        # slightly greater width for the decimal place and
-                        # minus sign but only by a few pixels and
-                        # over-estimation is okay.
-                        length = 7 * len(str(cell.number))
-
-                    elif cell_type == 'Datetime':
-                        # Handle dates.
-                        #
-                        # The following uses the default width for mm/dd/yyyy
-                        # dates. It isn't feasible to parse the number format
-                        # to get the actual string width for all format types.
-                        length = self.default_date_pixels
-
-                    elif cell_type == 'Boolean':
-                        # Handle boolean values.
-                        #
-                        # Use the Excel standard widths for TRUE and FALSE.
-                        if cell.boolean:
-                            length = 31
-                        else:
-                            length = 36
-
-                    elif (cell_type == 'Formula'
-                            or cell_type == 'ArrayFormula'):
-                        # Handle formulas.
-                        #
-                        # We only try to autofit a formula if it has a
-                        # non-zero value.
-                        if isinstance(cell.value, (float, int)):
-                            if cell.value > 0:
-                                length = 7 * len(str(cell.value))
-
-                        elif isinstance(cell.value, str):
-                            length = xl_pixel_width(cell.value)
-
-                        elif type(cell.value) == bool:
-                            if cell.value:
-                                length = 31
-                            else:
-                                length = 36
-
-                    # If the cell is in an autofilter header we add an
-                    # additional 16 pixels for the dropdown arrow.
-                    if self.filter_cells.get((row_num, col_num)):
-                        if length > 0:
-                            length += 16
-
-                    # Add the string length to the lookup table.
-                    max = col_width_max.get(col_num, 0)
-                    if length > max:
-                        col_width_max[col_num] = length
+        else:
+            col_width_max = self._get_autofit_widths()
 
         # Apply the width to the column.
         for (col_num, pixel_width) in col_width_max.items():
@@ -1963,6 +2101,72 @@ class Worksheet(xmlwriter.XMLwriter):
             else:
                 self.col_info[col_num] = [width, None, False, 0, False, True]
 
+    def set_string_mode(self, mode):
+        """
+        Set how strings are stored in the worksheet columns that don't have
+        a mode set by set_column_string_mode().
+
+        Args:
+            mode: 'shared', 'inline' or 'auto'.
+
+        Returns:
+            0:  Success.
+            -1: Unknown mode.
+
+        See set_column_string_mode() for a description of the modes.
+
+        """
+        if mode not in ('shared', 'inline', 'auto'):
+            warn("Unknown string mode '%s' in set_string_mode()" % mode)
+            return -1
+
+        self.string_mode = mode
+        return 0
+
+    @convert_column_args
+    def set_column_string_mode(self, first_col, last_col, mode):
+        """
+        Set how strings are stored in a single column or a range of columns.
+
+        'shared' strings are stored once in the workbook shared string
+        table and referenced by index. This is the default and is smaller
+        for repeated values. 'inline' strings are written into the
+        worksheet cells (t="inlineStr") and aren't kept in the shared string
+        table, which saves memory and package size for unique values such
+        as ids or paths. 'auto' samples the first strings of the column and
+        switches it to 'inline' if nearly all of them are new to the shared
+        string table, otherwise to 'shared'.
+
+        In constant_memory mode all strings are written in-line.
+
+        Args:
+            first_col: First column (zero-indexed).
+            last_col:  Last column (zero-indexed). Can be same as first_col.
+            mode:      'shared', 'inline' or 'auto'.
+
+        Returns:
+            0:  Success.
+            -1: Column number is out of worksheet bounds or unknown mode.
+
+        """
+        if mode not in ('shared', 'inline', 'auto'):
+            warn("Unknown string mode '%s' in set_column_string_mode()"
+                 % mode)
+            return -1
+
+        # Ensure 2nd col is larger than first.
+        if first_col > last_col:
+            (first_col, last_col) = (last_col, first_col)
+
+        if first_col < 0 or last_col >= self.xls_colmax:
+            return -1
+
+        for col in range(first_col, last_col + 1):
+            self.string_modes[col] = mode
+            self.string_samples.pop(col, None)
+
+        return 0
+
     def set_row(self, row, height=None, cell_format=None, options=None):
         """
         Set the width, and other properties of a row.
@@ -4369,6 +4573,8 @@ class Worksheet(xmlwriter.XMLwriter):
         self.remove_timezone = init_data['remove_timezone']
         self.max_url_length = init_data['max_url_length']
         self.use_future_functions = init_data['use_future_functions']
+        self.track_widths = init_data.get('track_widths', False)
+        self.string_mode = init_data.get('string_mode', 'shared')
 
         if self.excel2003_style:
             self.original_row_height = 12.75
@@ -4394,6 +4600,167 @@ class Worksheet(xmlwriter.XMLwriter):
             # Set as the worksheet filehandle until the file is assembled.
             self.fh = self.row_data_fh
 
+    # Calculate the max pixel width for each column from the worksheet data
+    # table, for autofit().
+    def _get_autofit_widths(self):
+
+        # Store the max pixel width for each column.
+        col_width_max = {}
+
+        # Create a reverse lookup for the share strings table so we can convert
+        # the string id back to the original string.
+        strings = sorted(self.str_table.string_table,
+                         key=self.str_table.string_table.__getitem__)
+
+        for row_num in range(self.dim_rowmin, self.dim_rowmax + 1):
+            if not self.table.get(row_num):
+                continue
+
+            for col_num in range(self.dim_colmin, self.dim_colmax + 1):
+                if col_num in self.table[row_num]:
+                    cell = self.table[row_num][col_num]
+                    cell_type = type(cell).__name__
+                    length = 0
+
+                    if cell_type == 'String' or cell_type == 'RichString':
+                        # Handle strings and rich strings.
+                        #
+                        # For standard shared strings we do a reverse lookup
+                        # from the shared string id to the actual string.
+                        # In-line strings are stored as they are. For
+                        # rich strings we use the unformatted string. We also
+                        # split multi-line strings and handle each part
+                        # separately.
+                        if cell_type == 'String':
+                            string = cell.string
+                            if type(string) is int:
+                                string = strings[string]
+                        else:
+                            string = cell.raw_string
+
+                        length = _string_pixel_width(string)
+
+                    elif cell_type == 'Number':
+                        # Handle numbers.
+                        #
+                        # We use a workaround/optimization for numbers since
+                        # digits all have a pixel width of 7. This gives a
+                        # slightly greater width for the decimal place and
+                        # minus sign but only by a few pixels and
+                        # over-estimation is okay.
+                        length = 7 * len(str(cell.number))
+
+                    elif cell_type == 'Datetime':
+                        # Handle dates.
+                        #
+                        # The following uses the default width for mm/dd/yyyy
+                        # dates. It isn't feasible to parse the number format
+                        # to get the actual string width for all format types.
+                        length = self.default_date_pixels
+
+                    elif cell_type == 'Boolean':
+                        # Handle boolean values.
+                        #
+                        # Use the Excel standard widths for TRUE and FALSE.
+                        if cell.boolean:
+                            length = 31
+                        else:
+                            length = 36
+
+                    elif (cell_type == 'Formula'
+                            or cell_type == 'ArrayFormula'):
+                        # Handle formulas.
+                        length = self._formula_pixel_width(cell.value)
+
+                    # If the cell is in an autofilter header we add an
+                    # additional 16 pixels for the dropdown arrow.
+                    if self.filter_cells.get((row_num, col_num)):
+                        if length > 0:
+                            length += 16
+
+                    # Add the string length to the lookup table.
+                    max = col_width_max.get(col_num, 0)
+                    if length > max:
+                        col_width_max[col_num] = length
+
+        return col_width_max
+
+    # Get the max pixel width for each column recorded by _track_width(), for
+    # autofit() in 'track_widths' mode.
+    def _get_tracked_widths(self):
+        col_width_max = dict(self.tracked_widths)
+
+        # If the cell is in an autofilter header we add an additional 16
+        # pixels for the dropdown arrow. The autofilter is usually added
+        # after the data so only the first row is tracked separately.
+        row_num = self.tracked_first_row
+        for (col_num, length) in self.tracked_first_widths.items():
+            if length > 0 and self.filter_cells.get((row_num, col_num)):
+                if length + 16 > col_width_max[col_num]:
+                    col_width_max[col_num] = length + 16
+
+        return col_width_max
+
+    # Check if a string is written in-line rather than to the shared string
+    # table, for the 'inline' and 'auto' string modes. In 'auto' mode the
+    # strings are shared while the column is sampled. Then the column
+    # switches to 'inline' if nearly all of them were new to the table.
+    def _inline_string(self, col, string):
+        mode = self.string_modes.get(col, self.string_mode)
+
+        if mode == 'shared':
+            return False
+
+        if mode == 'inline':
+            return True
+
+        sample = self.string_samples.get(col)
+        if sample is None:
+            sample = self.string_samples[col] = [0, 0]
+
+        sample[0] += 1
+        if string not in self.str_table.string_table:
+            sample[1] += 1
+
+        if sample[0] >= self.string_sample_size:
+            if sample[1] >= sample[0] * self.string_unique_ratio:
+                self.string_modes[col] = 'inline'
+            else:
+                self.string_modes[col] = 'shared'
+            del self.string_samples[col]
+
+        return False
+
+    # Record the pixel width of a written cell for autofit().
+    def _track_width(self, row, col, length):
+        if length > self.tracked_widths.get(col, 0):
+            self.tracked_widths[col] = length
+
+        if self.tracked_first_row is None or row < self.tracked_first_row:
+            self.tracked_first_row = row
+            self.tracked_first_widths = {}
+
+        if row == self.tracked_first_row:
+            self.tracked_first_widths[col] = length
+
+    # Get the autofit pixel width of a formula value.
+    def _formula_pixel_width(self, value):
+        # We only try to autofit a formula if it has a non-zero value.
+        if isinstance(value, (float, int)):
+            if value > 0:
+                return 7 * len(str(value))
+
+        elif isinstance(value, str):
+            return xl_pixel_width(value)
+
+        elif type(value) == bool:
+            if value:
+                return 31
+            else:
+                return 36
+
+        return 0
+
     def _assemble_xml_file(self):
         # Assemble and write the XML file.
 
@@ -5584,8 +5951,9 @@ class Worksheet(xmlwriter.XMLwriter):
 
                     elif cell_type == 'String':
                         # Return a string from it's shared string index.
-                        index = cell.string
-                        string = self.str_table._get_shared_string(index)
+                        string = cell.string
+                        if type(string) is int:
+                            string = self.str_table._get_shared_string(string)
 
                         data.append(string)
 
@@ -6473,7 +6841,7 @@ class Worksheet(xmlwriter.XMLwriter):
             # Write a string.
             string = cell.string
 
-            if not self.constant_memory:
+            if type(string) is int:
                 # Write a shared string.
                 self._xml_string_element(string, attributes)
             else:
@@ -6488,8 +6856,10 @@ class Worksheet(xmlwriter.XMLwriter):
                 string = string.replace('\uFFFE', '_xFFFE_')
                 string = string.replace('\uFFFF', '_xFFFF_')
 
-                # Write any rich strings without further tags.
-                if string.startswith('<r>') and string.endswith('</r>'):
+                # Write any rich strings without further tags. Rich strings
+                # are only stored in-line in constant_memory mode.
+                if (self.constant_memory and string.startswith('<r>')
+                        and string.endswith('</r>')):
                     self._xml_rich_inline_string(string, attributes)
                 else:
                     # Add attribute to preserve leading or trailing whitespace.
@@ -0,0 +1,94 @@
+# coding: utf-8
+""" Сжатие частей xlsx блоками в потоках (xlsxwriter.deflate): архив читается zipfile, CRC и данные совпадают. """
+import os
+import random
+import sys
+import zipfile
+import zlib
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import xlsxwriter  # noqa: E402
+from xlsxwriter.deflate import Deflater  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not Deflater.is_supported(), reason='parallel deflate is not supported')
+
+CHUNK = 4096
+
+
+def payload(size, seed=0):
+    # XML-подобные строки со случайными Guid: сжимается, но не в один блок
+    rnd = random.Random(seed)
+    rows = []
+    while sum(len(x) for x in rows) < size:
+        rows.append('<row r="{}"><c t="inlineStr"><is><t>{:032x}</t></is></c></row>\n'.format(
+            len(rows), rnd.getrandbits(128)))
+    return ''.join(rows).encode('utf-8')[:size]
+
+
+def write(filename, members, threads=2, level=6):
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        deflater = Deflater(zip_file, threads, level, chunk_size=CHUNK)
+        for name, data in members:
+            stream = deflater.open(name)
+            # запись частями, как из XML writer
+            for pos in range(0, len(data), 1000):
+                stream.write(data[pos:pos + 1000])
+            stream.close()
+        deflater.close()
+
+
+@pytest.mark.parametrize('size', [0, 10, CHUNK - 1, CHUNK, CHUNK * 10 + 7], ids=['empty', 'small', 'one block',
+                                                                                 'exact block', 'many blocks'])
+def test_member(tmp_path, size):
+    filename = str(tmp_path / 'test.zip')
+    data = payload(size)
+    write(filename, [('xl/worksheets/sheet1.xml', data)])
+
+    with zipfile.ZipFile(filename) as zip_file:
+        assert zip_file.testzip() is None
+        info = zip_file.getinfo('xl/worksheets/sheet1.xml')
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert info.file_size == size
+        assert info.CRC == zlib.crc32(data)
+        assert zip_file.read(info) == data
+
+
+def test_members_order(tmp_path):
+    # больше блоков в работе, чем max_in_flight: блоки пишутся по мере готовности в порядке частей
+    filename = str(tmp_path / 'test.zip')
+    members = [('part{}.xml'.format(i), payload(CHUNK * (i % 4) + i * 100, seed=i)) for i in range(12)]
+    write(filename, members, threads=3, level=1)
+
+    with zipfile.ZipFile(filename) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == [name for name, _ in members]
+        for name, data in members:
+            assert zip_file.read(name) == data
+
+
+def test_ratio(tmp_path):
+    # блоки со словарём предыдущего блока сжимаются почти как один поток
+    data = payload(CHUNK * 20)
+    filename = str(tmp_path / 'test.zip')
+    write(filename, [('sheet.xml', data)])
+    with zipfile.ZipFile(filename) as zip_file:
+        size = zip_file.getinfo('sheet.xml').compress_size
+    assert size < len(zlib.compress(data, 6)) * 1.1
+
+
+def test_workbook(tmp_path):
+    filename = str(tmp_path / 'test.xlsx')
+    wb = xlsxwriter.Workbook(filename, {'deflate_threads': 2, 'compression_level': 1})
+    sheet = wb.add_worksheet()
+    for row in range(3000):
+        sheet.write_row(row, 0, ['{:08x}'.format(row * 7919), row, 'text'])
+    wb.close()
+
+    with zipfile.ZipFile(filename) as zip_file:
+        assert zip_file.testzip() is None
+        xml = zip_file.read('xl/worksheets/sheet1.xml')
+        assert xml.count(b'<row ') == 3000
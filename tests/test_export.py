@@ -0,0 +1,44 @@
+# coding: utf-8
+""" Выгрузка листов отчёта в JSONL и CSV: одинаковые столбцы и значения, в том числе для длинных цепочек перекрытий. """
+import csv
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+import writers  # noqa: E402
+
+
+def test_long_inheritance_chain(tmp_path):
+    # сущность последнего слоя перекрывает цепочку из большего числа родителей, чем столбцов листа
+    layers = mtd.PARENT_COLUMNS + 3
+    options = genrepo.Options(modules=1, entities=1, properties=1, controls=0, actions=0, layers=layers, archive=0)
+    repos = genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+    items, archive = mtd.scan_repositories(repos)
+
+    jsonl = str(tmp_path / 'report.jsonl')
+    mtd.save_jsonl(jsonl, items, archive)
+    with open(jsonl, encoding='utf-8') as fp:
+        records = [json.loads(line) for line in fp]
+    records = [x for x in records if x.pop('sheet') == 'Перекрытия']
+
+    csv_name = str(tmp_path / 'report.csv')
+    mtd.save_csv(csv_name, items, archive)
+    with open(writers.sheet_filename(csv_name, 'Перекрытия'), encoding='utf-8', newline='') as fp:
+        rows = list(csv.reader(fp))
+
+    headers = rows[0]
+    assert all(len(row) == len(headers) for row in rows)
+    assert [dict(zip(headers, row)) for row in rows[1:]] == [{k: str(v) for k, v in x.items()} for x in records]
+
+    deepest = max(records, key=lambda x: x['Уровней'])
+    assert deepest['Уровней'] > mtd.PARENT_COLUMNS
+    assert deepest['Path'].endswith('.mtd')
+    # остальные родители - в последнем столбце родителей
+    last = deepest['<- Родитель {}'.format(mtd.PARENT_COLUMNS)]
+    assert last.count('\n<- ') >= deepest['Уровней'] - mtd.PARENT_COLUMNS
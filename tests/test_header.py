@@ -0,0 +1,77 @@
+# coding: utf-8
+""" Заголовок Module.mtd для package.xml (scan_header) в сравнении с полным разбором JSON. """
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+MODULE = {
+    "$type": "Sungero.Metadata.ModuleMetadata, Sungero.Metadata",
+    "NameGuid": "5b4e5fd1-2f08-4fc5-9d63-0c4a5a1f2c11",
+    "Name": "Contracts",
+    "AsyncHandlers": [{"Name": "Handler", "Parameters": [{"Name": "Id", "Value": "}{\"]["}]}],
+    "PublicFunctions": [{"Name": "Get", "Body": "if (x) { return \"}\"; }"}, [], {}],
+    "Code": "Contr",
+    "CompanyCode": "Sungero",
+    "Dependencies": [],
+    "Empty": {},
+    "Flag": True,
+    "Nothing": None,
+    "Number": -1.5e3,
+    "Version": "4.6.0.0",
+    "Widgets": [],
+}
+
+
+def header(data):
+    return {k: v for k, v in data.items() if k in mtd.HEADER_KEYS}
+
+
+@pytest.mark.parametrize('indent', [None, 0, 2, 4, '\t'])
+def test_formatting(indent):
+    text = json.dumps(MODULE, indent=indent, ensure_ascii=False)
+    assert mtd.scan_header(text) == header(MODULE)
+    assert mtd.scan_header(' \r\n' + text.replace('\n', '\r\n')) == header(MODULE)
+
+
+def test_key_order():
+    # Version и CompanyCode после больших значений, $type - последним
+    data = dict(reversed(list(MODULE.items())))
+    assert mtd.scan_header(json.dumps(data, indent=2)) == header(MODULE)
+
+
+def test_missing_keys():
+    data = {k: v for k, v in MODULE.items() if k not in ('Version', 'CompanyCode')}
+    assert mtd.scan_header(json.dumps(data, indent=2)) == header(data)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        mtd.scan_header('[]')
+    with pytest.raises(ValueError):
+        mtd.scan_header('{"AsyncHandlers": [{"Name": "x"}, "Name": "y"}')
+
+
+def test_generated_modules(tmp_path):
+    options = genrepo.Options(modules=2, entities=1, properties=1, controls=1, actions=1, archive=1)
+    genrepo.Generator(options).generate(str(tmp_path))
+    paths = glob.glob(str(tmp_path / '**' / 'Module.mtd'), recursive=True)
+    assert paths
+    for path in paths:
+        with open(path, encoding='utf-8-sig') as fp:
+            text = fp.read()
+        assert mtd.scan_header(text) == header(json.loads(text))
+
+        item = mtd.parse_header(path)
+        full = mtd.parse_file(path, 'Module.mtd')
+        assert (type(item), item.NameGuid, item.Name, item.CompanyCode, item.Version) == \
+               (type(full), full.NameGuid, full.Name, full.CompanyCode, full.Version)
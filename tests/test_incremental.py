@@ -0,0 +1,56 @@
+# coding: utf-8
+""" Инкрементальный режим: обновление модели по git diff от проанализированного коммита. """
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not available')
+
+
+def git(path, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args), cwd=path,
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def repos(tmp_path):
+    options = genrepo.Options(modules=3, entities=3, properties=2, controls=1, actions=1, archive=0)
+    response = genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+    for repo in response:
+        git(repo['path'], 'init', '-q')
+        git(repo['path'], 'add', '-A')
+        git(repo['path'], 'commit', '-q', '-m', 'init')
+    return response
+
+
+def model(items):
+    return sorted((x.NameGuid, type(x).__name__, x.path) for x in items)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_removed_module(repos, tmp_path, capsys, workers):
+    snapshot = str(tmp_path / mtd.SNAPSHOT_FILENAME)
+    mtd.scan_repositories(repos, parallel=workers is not None, workers=workers, snapshot=snapshot)
+
+    # модуль удалён в рабочем дереве: выполняется полный разбор репозитория с индексом анализа
+    work = repos[0]['path']
+    shutil.rmtree(os.path.join(work, 'source', 'Layer1.Module0_1'))
+    capsys.readouterr()
+    items, _ = mtd.scan_repositories(repos, parallel=workers is not None, workers=workers, snapshot=snapshot)
+    output = capsys.readouterr().out
+    assert 'object has no attribute' not in output
+
+    expected, _ = mtd.scan_repositories(repos)
+    assert model(items) == model(expected)
+    assert not any('Module0_1' in x.path and 'Layer1' in x.path for x in items)
+    assert all(x.index is not None for x in items)
@@ -0,0 +1,36 @@
+# coding: utf-8
+""" Локализованные имена: таблица локализации индекса и поиск по .resx объекта и его родителей. """
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+
+def names(items):
+    entities = [x for x in items if isinstance(x, mtd.BaseMTD)]
+    properties = [p for x in entities if isinstance(x, mtd.DataBook) for p in x.Properties]
+    return [(x.NameGuid, lang, x.Locale(lang)) for x in entities + properties for lang in ('en', 'ru')]
+
+
+def test_locale_without_table(tmp_path):
+    options = genrepo.Options(modules=2, entities=2, properties=2, controls=1, actions=1, layers=2, archive=0)
+    repos = genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+    items, _ = mtd.scan_repositories(repos)
+    index = mtd.model_index(items)
+    assert index.locales is not None
+    expected = names(items)
+
+    # без таблицы строки ищутся в .resx объекта и его родителей
+    index.locales = None
+    assert names(items) == expected
+
+    # у свойств наследников нет своих строк в .resx, имя берётся у родителя
+    heirs = [p for x in items if isinstance(x, mtd.DataBook) and x.Ancestors for p in x.Properties
+             if p.IsAncestorMetadata]
+    assert heirs
+    assert all(p.Locale('ru') and p.Locale('ru').endswith(' title (ru)') for p in heirs)
@@ -0,0 +1,112 @@
+# coding: utf-8
+""" Сравнение двух моделей по NameGuid: добавленные, удалённые и изменённые объекты. """
+import json
+import os
+import shutil
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+import modeldiff  # noqa: E402
+
+
+@pytest.fixture
+def repos(tmp_path):
+    options = genrepo.Options(modules=1, entities=3, properties=2, controls=1, actions=1, collections=0, archive=0)
+    return genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+
+
+def entity_file(repos, name):
+    folder = os.path.join(repos[0]['path'], 'source', 'Layer1.Module0_0', 'Layer1.Module0_0.Shared', name)
+    return os.path.join(folder, name + '.mtd')
+
+
+def edit(path, change):
+    with open(path, encoding='utf-8-sig') as fp:
+        data = json.load(fp)
+    change(data)
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, indent=2)
+    return data
+
+
+def changes(diff):
+    return sorted((x.kind, x.change, x.name) for x in diff.changes)
+
+
+def test_unchanged(repos):
+    old, _ = mtd.scan_repositories(repos)
+    new, _ = mtd.scan_repositories(repos)
+    diff = modeldiff.compare(old, new)
+    assert diff.changes == []
+    assert diff.unchanged == len(new)
+
+
+def test_changes(repos):
+    old, _ = mtd.scan_repositories(repos)
+
+    # удалённая сущность
+    removed = entity_file(repos, 'Entity0_0')
+    shutil.rmtree(os.path.dirname(removed))
+
+    # добавленная сущность - копия с новыми Guid
+    source = entity_file(repos, 'Entity0_1')
+    added = entity_file(repos, 'Entity0_9')
+    os.makedirs(os.path.dirname(added))
+    shutil.copy(source, added)
+
+    def new_entity(data):
+        data.update(NameGuid=str(uuid.uuid4()), Name='Entity0_9')
+        for key in ('Properties', 'Actions'):
+            for item in data[key]:
+                item['NameGuid'] = str(uuid.uuid4())
+        data['Forms'][0]['Controls'] = []
+        data['RibbonCardMetadata']['Elements'] = []
+    edit(added, new_entity)
+
+    # изменённая сущность: имя, поле, SQL столбец, удалённое и добавленное свойство
+    def change_entity(data):
+        data['Name'] = 'Entity0_1New'
+        data['Code'] = 'NewCode'
+        data['Properties'][0]['Code'] = 'NewCode'
+        data['Properties'].pop()
+        data['Properties'].append({"$type": "Sungero.Metadata.StringPropertyMetadata, Sungero.Metadata",
+                                   "NameGuid": str(uuid.uuid4()), "Name": "Extra", "Code": "Extra"})
+    data = edit(source, change_entity)
+
+    new, _ = mtd.scan_repositories(repos)
+    diff = modeldiff.compare(old, new)
+    assert changes(diff) == sorted([
+        ('entity', 'added', 'Entity0_9'),
+        ('entity', 'removed', 'Entity0_0'),
+        ('entity', 'renamed', 'Entity0_1New'),
+        ('entity', 'changed', 'Entity0_1New'),
+        ('property', 'sql', data['Properties'][0]['Name']),
+        ('property', 'removed', 'Property1'),
+        ('property', 'added', 'Extra'),
+    ])
+    changed = next(x for x in diff.changes if x.change == 'changed')
+    assert (changed.old, changed.new) == ({'Code': 'Entity01'}, {'Code': 'NewCode'})
+    assert diff.unchanged == len(new) - 2
+    assert diff.summary()['entity'] == {'added': 1, 'removed': 1, 'renamed': 1, 'changed': 1}
+
+
+def test_archive_flag(repos):
+    # ключ IsArchive в JSON не делает объект архивным, признак задаёт только обход архивного репозитория
+    edit(entity_file(repos, 'Entity0_0'), lambda data: data.update(IsArchive=True))
+    old, _ = mtd.scan_repositories(repos)
+    assert not any(x.IsArchive for x in old if isinstance(x, mtd.BaseMTD))
+
+    new, _ = mtd.scan_repositories(repos)
+    for item in new:
+        if isinstance(item, mtd.BaseMTD):
+            item.IsArchive = True
+    assert 'IsArchive' not in mtd.DataBook._schema
+    assert modeldiff.compare(old, new).changes == []
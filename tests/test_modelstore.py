@@ -0,0 +1,88 @@
+# coding: utf-8
+""" Двоичный снимок модели: заголовок, отпечаток репозиториев и загрузка модели из снимка. """
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import modelstore  # noqa: E402
+import mtd  # noqa: E402
+
+DATA = {'items': [1, 2], 'records': [(0, ['a', None, 1.5])]}
+
+
+@pytest.fixture
+def filename(tmp_path):
+    response = str(tmp_path / 'model.bin')
+    modelstore.write(response, 'abc', DATA)
+    return response
+
+
+def test_read(filename):
+    assert modelstore.read(filename, 'abc') == DATA
+    assert modelstore.read(filename) == DATA
+    assert not os.path.exists(filename + '.tmp')
+
+
+def test_fingerprint_mismatch(filename):
+    assert modelstore.read(filename, 'abd') is None
+    assert modelstore.read(filename + '.missing', 'abc') is None
+
+
+def corrupt(filename, change):
+    with open(filename, 'rb') as fp:
+        content = fp.read()
+    with open(filename, 'wb') as fp:
+        fp.write(change(content))
+
+
+@pytest.mark.parametrize('change', [
+    lambda x: b'',  # пустой файл
+    lambda x: x[:4],  # обрезанный заголовок
+    lambda x: b'XXXXXX' + x[6:],  # не снимок модели
+    lambda x: x.replace(modelstore._version(), b'0:0.0', 1),  # другая версия формата или Python
+    lambda x: x[:-10],  # обрезанные данные
+], ids=['empty', 'truncated header', 'magic', 'version', 'truncated data'])
+def test_bad_header(filename, change, capsys):
+    corrupt(filename, change)
+    assert modelstore.read(filename, 'abc') is None
+
+
+def test_fingerprint(tmp_path):
+    options = genrepo.Options(modules=1, entities=2, properties=1, controls=1, actions=1, archive=0)
+    repos = genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+    key = modelstore.fingerprint(repos)
+    assert modelstore.fingerprint(repos) == key
+    # другие правила обхода
+    assert modelstore.fingerprint(repos, mtd.discovery.make_rules(None, 'VersionData', False)) != key
+
+    # каталог вне git: учитываются время изменения и размер .mtd
+    path = os.path.join(repos[0]['path'], 'source', 'Layer1.Module0_0', 'Layer1.Module0_0.Shared', 'Module.mtd')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert modelstore.fingerprint(repos) != key
+
+
+def test_load_or_scan(tmp_path, capsys):
+    options = genrepo.Options(modules=1, entities=2, properties=1, controls=1, actions=1, archive=1)
+    repos = genrepo.Generator(options).generate(str(tmp_path / 'tree'))
+    model = str(tmp_path / 'model.bin')
+    items, archive = mtd.load_or_scan(repos, model)
+    assert 'Model snapshot loaded' not in capsys.readouterr().out
+
+    loaded, loaded_archive = mtd.load_or_scan(repos, model)
+    assert 'Model snapshot loaded' in capsys.readouterr().out
+    assert [(x.NameGuid, x.MtdType, x.path) for x in loaded] == [(x.NameGuid, x.MtdType, x.path) for x in items]
+    assert len(loaded_archive) == len(archive)
+
+    # изменившийся репозиторий разбирается заново
+    path = os.path.join(repos[0]['path'], 'source', 'Layer1.Module0_0', 'Layer1.Module0_0.Shared', 'Module.mtd')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    mtd.load_or_scan(repos, model)
+    assert 'Model snapshot loaded' not in capsys.readouterr().out
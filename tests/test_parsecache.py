@@ -0,0 +1,122 @@
+# coding: utf-8
+""" Кэш результатов разбора: дисковый (ParseCache) и в памяти процесса (MemoryCache). """
+import marshal
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import parsecache  # noqa: E402
+
+
+def test_memory_cache_copy():
+    cache = parsecache.MemoryCache()
+    cache.put('a', {'Name': 'A', 'Properties': []})
+    payload = cache.get('a')
+    payload['Properties'].append(1)
+    assert cache.get('a') == {'Name': 'A', 'Properties': []}
+    assert cache.get('b') is None
+
+
+def test_memory_cache_eviction():
+    item = len(marshal.dumps('x' * 100))
+    cache = parsecache.MemoryCache(max_size=item * 2)
+    cache.put('a', 'a' * 100)
+    cache.put('b', 'b' * 100)
+    # 'a' использована последней, удаляется 'b'
+    assert cache.get('a') == 'a' * 100
+    cache.put('c', 'c' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'a' * 100
+    assert cache.get('c') == 'c' * 100
+    assert len(cache) == 2 and cache.size == item * 2
+
+    # запись больше ограничения не хранится
+    cache.put('d', 'd' * 1000)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+
+def write(path, data: bytes):
+    with open(path, 'wb') as fp:
+        fp.write(data)
+
+
+@pytest.fixture
+def files(tmp_path):
+    response = [str(tmp_path / x) for x in ('Entity.mtd', 'EntitySystem.resx', 'EntitySystem.ru.resx')]
+    write(response[0], b'{"Name": "Entity"}')
+    write(response[1], b'<root />')
+    return response
+
+
+def contents(files):
+    return [parsecache._read(x) for x in files]
+
+
+def test_unchanged(tmp_path, files):
+    with parsecache.ParseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        cache.put(files, contents(files), {'Name': 'Entity'})
+        assert cache.get(files) == {'Name': 'Entity'}
+
+    # данные сохраняются в базе между запусками
+    with parsecache.ParseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert cache.get(files) == {'Name': 'Entity'}
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_touched_file(tmp_path, files):
+    with parsecache.ParseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        cache.put(files, contents(files), 'payload')
+        # другое время изменения, то же содержимое (переключение ветки) - хэши совпадают
+        st = os.stat(files[0])
+        os.utime(files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        assert cache.get(files) == 'payload'
+        assert cache.get(files) == 'payload'
+        assert cache.misses == 0
+
+
+@pytest.mark.parametrize('change', ['content', 'size', 'resx', 'ru_resx'])
+def test_changed_file(tmp_path, files, change):
+    with parsecache.ParseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        cache.put(files, contents(files), 'payload')
+        st = os.stat(files[0])
+        if change == 'content':
+            # тот же размер, другое содержимое: время изменения отличается, сравниваются хэши
+            write(files[0], b'{"Name": "Entitx"}')
+            os.utime(files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        elif change == 'size':
+            write(files[0], b'{"Name": "Entity2"}')
+        elif change == 'resx':
+            write(files[1], b'<root></root>')
+        else:
+            # появился .ru.resx
+            write(files[2], b'<root />')
+        assert cache.get(files) is None
+        assert cache.misses == 1
+
+
+def test_eviction(tmp_path, monkeypatch):
+    # время использования записей - по порядку обращений
+    clock = iter(range(1000))
+    monkeypatch.setattr(parsecache.time, 'time', lambda: next(clock))
+    filename = str(tmp_path / 'cache.sqlite')
+    paths = []
+    with parsecache.ParseCache(filename) as cache:
+        for name in ('a', 'b', 'c'):
+            path = str(tmp_path / (name + '.mtd'))
+            write(path, name.encode())
+            paths.append([path, path + '.resx', path + '.ru.resx'])
+            cache.put(paths[-1], [name.encode(), None, None], name * 100)
+        size = len(marshal.dumps('a' * 100))
+        # 'a' использована позже 'b'
+        assert cache.get(paths[0]) == 'a' * 100
+        cache.max_size = size * 2
+
+    with parsecache.ParseCache(filename) as cache:
+        assert cache.get(paths[1]) is None
+        assert cache.get(paths[0]) == 'a' * 100
+        assert cache.get(paths[2]) == 'c' * 100
@@ -0,0 +1,46 @@
+# coding: utf-8
+""" Отчёт Excel (render_excel): новая запись и запись как в исходном xlsxwriter (compat). """
+import os
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import genrepo  # noqa: E402
+import mtd  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def model(tmp_path_factory):
+    # на листе «Свойства» больше строк, чем проверяется для выбора inlineStr (string_sample_size)
+    options = genrepo.Options(modules=2, entities=300, properties=2, controls=0, actions=0, archive=1)
+    repos = genrepo.Generator(options).generate(str(tmp_path_factory.mktemp('tree')))
+    return mtd.scan_repositories(repos)
+
+
+def parts(filename):
+    with zipfile.ZipFile(filename) as fp:
+        assert fp.testzip() is None
+        return {name: fp.read(name).decode('utf-8') for name in fp.namelist()}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_compat(model, tmp_path, streaming):
+    items, archive = model
+    default = str(tmp_path / 'default.xlsx')
+    compat = str(tmp_path / 'compat.xlsx')
+    mtd.render_excel(items, archive, default, streaming)
+    mtd.render_excel(items, archive, compat, streaming, compat=True)
+
+    new, old = parts(default), parts(compat)
+    assert sorted(new) == sorted(old)
+    sheets = [name for name in old if name.startswith('xl/worksheets/')]
+    assert sheets
+    # Guid и пути листов после «Сущности» - в ячейках, compat - в таблице общих строк
+    # (constant_memory исходного xlsxwriter всегда пишет строки в ячейки)
+    assert any('t="inlineStr"' in new[name] for name in sheets)
+    assert any('t="inlineStr"' in old[name] for name in sheets) == streaming
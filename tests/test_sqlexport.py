@@ -0,0 +1,108 @@
+# coding: utf-8
+""" Выгрузка в SQLite: обновление существующей базы (upsert) только изменившимися объектами. """
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import sqlexport  # noqa: E402
+from sqlexport import Record  # noqa: E402
+
+ARCHIVE = [('Module', '1.0', 'Old', 'Solution.Old', 'g-old', None, 'path')]
+
+
+def module(guid, name):
+    return Record('modules', (guid, 'Module', name, 'Sungero', '1.0', None, None, name, name, guid + '.mtd'))
+
+
+def entity(guid, name, properties=('Name', 'Code'), controls=1):
+    row = (guid, 'DataBook', 'Sungero', 'm1', 'Module', name, name, name, 'Sungero_' + name, None, None,
+           guid + '.mtd')
+    return Record('entities', row, {
+        'properties': [(guid + p, 'String', p, p, p, 'Sungero_' + name, p, None, p, p, guid + '.mtd')
+                       for p in properties],
+        'controls': [(guid + 'c{}'.format(i), 'Control', 'Control{}'.format(i), None, None) for i in range(controls)],
+        'actions': [(guid + 'a', 'Action', 'Save')],
+        'ribbon': [],
+    })
+
+
+def content(filename):
+    """ Строки всех таблиц, элементы - с Guid сущности вместо entity_id """
+    db = sqlite3.connect(filename)
+    try:
+        guids = dict(db.execute('SELECT id, guid FROM entities'))
+        response = {}
+        for table, columns in sqlexport.TABLES.items():
+            if table in sqlexport.CHILD_TABLES:
+                rows = [(guids[x[0]],) + x[1:] for x in
+                        db.execute('SELECT entity_id, {} FROM {}'.format(', '.join(columns), table))]
+            else:
+                rows = db.execute('SELECT {} FROM {}'.format(', '.join(columns), table)).fetchall()
+            response[table] = sorted(rows, key=repr)
+        return response
+    finally:
+        db.close()
+
+
+def ids(filename):
+    db = sqlite3.connect(filename)
+    try:
+        return dict(db.execute('SELECT guid, id FROM entities'))
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def filename(tmp_path):
+    response = str(tmp_path / 'model.db')
+    records = [module('m1', 'Module'), entity('e1', 'Same'), entity('e2', 'Changed'), entity('e3', 'Removed')]
+    stats = sqlexport.write(response, records, ARCHIVE)
+    assert stats[:4] == (4, 0, 0, 0)
+    return response
+
+
+def test_upsert(filename, tmp_path):
+    before = ids(filename)
+    records = [module('m1', 'Module'), entity('e1', 'Same'),
+               entity('e2', 'Changed', properties=('Name', 'Amount'), controls=2), entity('e4', 'Added')]
+    stats = sqlexport.write(filename, records, ARCHIVE, upsert=True)
+    # строки e4 и e2: сущность, свойства, контролы, действие
+    assert stats == sqlexport.Stats(added=1, updated=1, removed=1, unchanged=2,
+                                    rows=(1 + 2 + 1 + 1) + (1 + 2 + 2 + 1))
+
+    # неизменённые и изменённые объекты сохраняют id, строки удалённых и старые элементы удалены
+    after = ids(filename)
+    assert after['e1'] == before['e1'] and after['e2'] == before['e2']
+    assert 'e3' not in after and after['e4'] not in before.values()
+
+    # база совпадает с выгрузкой заново
+    fresh = str(tmp_path / 'fresh.db')
+    sqlexport.write(fresh, records, ARCHIVE)
+    assert content(filename) == content(fresh)
+
+
+def test_upsert_archive(filename, tmp_path):
+    records = [module('m1', 'Module'), entity('e1', 'Same'), entity('e2', 'Changed'), entity('e3', 'Removed')]
+    stats = sqlexport.write(filename, records, ARCHIVE, upsert=True)
+    assert stats == sqlexport.Stats(0, 0, 0, 4, 0)
+
+    archive = ARCHIVE + [('Module', '2.0', 'Old', 'Solution.Old', 'g-old', None, 'path2')]
+    stats = sqlexport.write(filename, records, archive, upsert=True)
+    assert stats.rows == 2
+    assert content(filename)['archive'] == sorted(archive, key=repr)
+
+
+def test_schema_version(filename):
+    db = sqlite3.connect(filename)
+    with db:
+        db.execute("UPDATE meta SET value = '0' WHERE key = 'version'")
+    db.close()
+    # другая версия схемы - база создаётся заново
+    stats = sqlexport.write(filename, [entity('e1', 'Same')], ARCHIVE, upsert=True)
+    assert stats[:4] == (1, 0, 0, 0)
+    assert content(filename)['modules'] == []
@@ -0,0 +1,120 @@
+# coding: utf-8
+""" Режимы хранения строк листа: общие строки (shared), в ячейках (inline) и выбор по столбцу (auto). """
+import os
+import re
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sgmtd_plugin'))
+
+import xlsxwriter  # noqa: E402
+
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+ROWS = [['{:08x}-guid'.format(i * 7919), 'Type{}'.format(i % 3), ' a & <b> "c" ', i] for i in range(50)]
+
+
+def read_cells(filename):
+    """ Ячейки листа: адрес -> (тип ячейки, значение) """
+    with zipfile.ZipFile(filename) as fp:
+        assert fp.testzip() is None
+        names = fp.namelist()
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            root = ET.fromstring(fp.read('xl/sharedStrings.xml'))
+            shared = [''.join(t.text or '' for t in si.iter('{%s}t' % NS['x'])) for si in root.findall('x:si', NS)]
+        sheet = ET.fromstring(fp.read('xl/worksheets/sheet1.xml'))
+
+    response = {}
+    for c in sheet.iter('{%s}c' % NS['x']):
+        kind = c.get('t', 'n')
+        if kind == 's':
+            value = shared[int(c.find('x:v', NS).text)]
+        elif kind == 'inlineStr':
+            value = ''.join(t.text or '' for t in c.iter('{%s}t' % NS['x']))
+        else:
+            value = float(c.find('x:v', NS).text)
+        response[c.get('r')] = (kind, value)
+    return response
+
+
+def write(filename, constant_memory, setup, options=None):
+    workbook = xlsxwriter.Workbook(filename, dict(options or {}, constant_memory=constant_memory))
+    sheet = workbook.add_worksheet()
+    setup(sheet)
+    for row, values in enumerate(ROWS):
+        sheet.write_row(row, 0, values)
+    workbook.close()
+    return read_cells(filename)
+
+
+def check_values(cells):
+    for row, values in enumerate(ROWS):
+        for col, value in enumerate(values):
+            ref = '{}{}'.format('ABCD'[col], row + 1)
+            assert cells[ref][1] == value, ref
+
+
+def kinds(cells, col):
+    return {kind for ref, (kind, _) in cells.items() if re.match(col + r'\d', ref)}
+
+
+@pytest.fixture(params=[False, True], ids=['memory', 'constant_memory'])
+def constant_memory(request):
+    return request.param
+
+
+def test_shared(tmp_path, constant_memory):
+    cells = write(str(tmp_path / 'shared.xlsx'), constant_memory, lambda sheet: sheet.set_string_mode('shared'))
+    check_values(cells)
+    # в режиме constant_memory строки всегда пишутся в ячейки
+    assert kinds(cells, 'A') == kinds(cells, 'B') == ({'inlineStr'} if constant_memory else {'s'})
+
+
+def test_inline(tmp_path, constant_memory):
+    cells = write(str(tmp_path / 'inline.xlsx'), constant_memory, lambda sheet: sheet.set_string_mode('inline'))
+    check_values(cells)
+    assert kinds(cells, 'A') == kinds(cells, 'B') == kinds(cells, 'C') == {'inlineStr'}
+    assert kinds(cells, 'D') == {'n'}
+
+
+def test_workbook_option(tmp_path, constant_memory):
+    cells = write(str(tmp_path / 'option.xlsx'), constant_memory, lambda sheet: None, {'string_mode': 'inline'})
+    check_values(cells)
+    assert kinds(cells, 'A') == {'inlineStr'}
+
+
+def test_auto(tmp_path):
+    def setup(sheet):
+        sheet.set_string_mode('auto')
+        sheet.string_sample_size = 10
+
+    cells = write(str(tmp_path / 'auto.xlsx'), False, setup)
+    check_values(cells)
+    # уникальные значения после выборки пишутся в ячейки, повторяющиеся - в общие строки
+    assert [cells['A{}'.format(row)][0] for row in (1, 10, 11, 50)] == ['s', 's', 'inlineStr', 'inlineStr']
+    assert kinds(cells, 'B') == kinds(cells, 'C') == {'s'}
+
+
+def test_column_mode(tmp_path):
+    def setup(sheet):
+        sheet.set_string_mode('inline')
+        assert sheet.set_column_string_mode('B:C', 'shared') == 0
+
+    cells = write(str(tmp_path / 'column.xlsx'), False, setup)
+    check_values(cells)
+    assert kinds(cells, 'A') == {'inlineStr'}
+    assert kinds(cells, 'B') == kinds(cells, 'C') == {'s'}
+
+
+def test_unknown_mode(tmp_path):
+    workbook = xlsxwriter.Workbook(str(tmp_path / 'unknown.xlsx'))
+    sheet = workbook.add_worksheet()
+    with pytest.warns(UserWarning):
+        assert sheet.set_string_mode('compact') == -1
+    with pytest.warns(UserWarning):
+        assert sheet.set_column_string_mode(0, 1, 'compact') == -1
+    assert sheet.string_mode == 'shared' and not sheet.string_modes
+    workbook.close()
@@ -0,0 +1,30 @@
+# coding: utf-8
+""" Замеры этапов (timings): добавление из нескольких потоков, как в export. """
+import os
+import sys
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'sgmtd_plugin'))
+
+import timings  # noqa: E402
+
+
+def test_threads():
+    threads, repeat = 8, 20000
+    with timings.session(slowest=3) as current:
+        def work(number):
+            for i in range(repeat):
+                timings.add('phase', 0.5, 2)
+                with timings.track_file('file{}_{}'.format(number, i)):
+                    pass
+
+        workers = [threading.Thread(target=work, args=(x,)) for x in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert current.phases['phase'] == [0.5 * threads * repeat, 2 * threads * repeat]
+        assert current.phases['parse file'][1] == threads * repeat
+        assert len(current.files) == 3
@@ -0,0 +1,64 @@
+# coding: utf-8
+""" Запись блока строк листа Excel (Worksheet.write_rows). """
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sgmtd_plugin'))
+
+import xlsxwriter  # noqa: E402
+
+
+def sheet_xml(filename):
+    with zipfile.ZipFile(filename) as fp:
+        return fp.read('xl/worksheets/sheet1.xml').decode('utf-8')
+
+
+@pytest.mark.parametrize('constant_memory', [False, True])
+def test_invalid_value_keeps_written_rows(tmp_path, constant_memory):
+    filename = str(tmp_path / 'block.xlsx')
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': constant_memory})
+    sheet = workbook.add_worksheet()
+    rows = [['a', 'b', 'c'], ['d', 'e', 'f'], ['g', object(), 'h'], ['i', 'j', 'k']]
+
+    with pytest.raises(TypeError):
+        sheet.write_rows(1, 0, rows, column_types=['string', None, 'string'])
+
+    # строки до ошибки и ячейки строки с ошибкой перед неверным значением
+    assert (sheet.dim_rowmin, sheet.dim_rowmax) == (1, 3)
+    assert (sheet.dim_colmin, sheet.dim_colmax) == (0, 2)
+    workbook.close()
+
+    xml = sheet_xml(filename)
+    assert '<dimension ref="A2:C4"/>' in xml
+    assert '<c r="A4"' in xml
+    assert '<c r="B4"' not in xml and '<c r="C4"' not in xml
+    assert '<row r="5"' not in xml
+
+
+def test_bounds_error_keeps_written_rows(tmp_path):
+    filename = str(tmp_path / 'bounds.xlsx')
+    workbook = xlsxwriter.Workbook(filename)
+    sheet = workbook.add_worksheet()
+    rows = [['a', 'b'], ['c'] * (sheet.xls_colmax + 1), ['d', 'e']]
+
+    assert sheet.write_rows(0, 0, rows, column_types='string') == -1
+    assert (sheet.dim_rowmin, sheet.dim_rowmax) == (0, 0)
+    assert (sheet.dim_colmin, sheet.dim_colmax) == (0, 1)
+    workbook.close()
+
+    assert '<dimension ref="A1:B1"/>' in sheet_xml(filename)
+
+
+def test_truncated_string_continues(tmp_path):
+    workbook = xlsxwriter.Workbook(str(tmp_path / 'long.xlsx'))
+    sheet = workbook.add_worksheet()
+    rows = [['a', 'x' * (sheet.xls_strmax + 1)], ['b', 'c']]
+
+    # значение без объявленного типа записывается через write() и усекается
+    assert sheet.write_rows(0, 0, rows, column_types=['string']) == -2
+    assert sheet.dim_rowmax == 1
+    assert len(sheet.str_table.string_table) == 4
+    workbook.close()